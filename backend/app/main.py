@@ -0,0 +1,82 @@
+"""
+Module: main.py
+Purpose: FastAPI entrypoint of the SoulSketch backend.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import yaml
+from fastapi import FastAPI
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The job store, tracing and progress-event modules are shared with the services
+# (segmentation_service.utils); make the project root importable when started from backend/
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app.routes.api import router
+from app.services.progress import StatusIndex
+from app.services.pdf_generator import ReportRenderer
+from app.services import metrics
+
+CONFIG_PATH = os.environ.get("SOULSKETCH_BACKEND_CONFIG", os.path.join(BACKEND_DIR, "config.yaml"))
+
+
+def load_config(config_path: str = CONFIG_PATH) -> dict:
+    """
+    Loads the configuration YAML file.
+
+    Args:
+        config_path (str): Path to the configuration YAML file.
+
+    Returns:
+        dict: Loaded configuration dictionary.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config = load_config()
+    os.makedirs(config["base_shared_dir"], exist_ok=True)
+    metrics.configure(config.get("metrics_enabled", True))
+
+    report_renderer = ReportRenderer(
+        backend=config.get("report_backend", "wkhtmltopdf"),
+        max_workers=config.get("report_workers", 2),
+        executor=config.get("report_executor", "thread"),
+        wkhtmltopdf_path=config.get("wkhtmltopdf_path", "wkhtmltopdf"),
+        timeout=config.get("report_timeout_seconds", 60)
+    )
+    on_complete = report_renderer.ensure_report if config.get("render_report_on_complete", True) else None
+
+    status_index = StatusIndex(
+        base_shared_dir=config["base_shared_dir"],
+        poll_interval=config.get("status_poll_interval_seconds", 0.5),
+        max_jobs=config.get("status_index_max_jobs", 10000),
+        on_complete=on_complete
+    )
+    status_index.start()
+
+    app.state.config = config
+    app.state.status_index = status_index
+    app.state.report_renderer = report_renderer
+    print("🧩 Backend started")
+    try:
+        yield
+    finally:
+        status_index.stop()
+        report_renderer.shutdown()
+
+
+app = FastAPI(title="SoulSketch Backend", lifespan=lifespan)
+app.include_router(router)
@@ -0,0 +1,412 @@
+"""
+Module: api.py
+Purpose: REST API of the backend — uploads, push-based job status, results and reports.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+from typing import List, Dict, Any, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from app.services import storage, metrics, analytics
+from segmentation_service.utils.job_store import UPLOADED, FINISHED
+from segmentation_service.utils.progress_events import publish_event, COMPLETED
+from app.services.progress import StatusIndex
+from app.services.pdf_generator import ReportRenderer, is_report_current
+
+router = APIRouter()
+
+
+class UploadResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class StatusResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    progress: float = 0.0
+    completed_stages: List[str] = []
+    detail: Dict[str, Any] = {}
+    updated_at: float = 0.0
+
+
+class AnalyzeRequest(BaseModel):
+    job_id: str
+    final_objects: Optional[List[Dict[str, Any]]] = None
+
+
+class AnalyzeResponse(BaseModel):
+    job_id: str
+    report_status: str
+    pdf_url: str
+
+
+class ResultsResponse(BaseModel):
+    job_id: str
+    status: str
+    final_objects: List[Dict[str, Any]]
+    pdf_url: Optional[str] = None
+
+
+class AnalyticsResponse(BaseModel):
+    start: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+    label: Optional[str] = None
+    num_objects: int = 0
+    groups: List[Dict[str, Any]] = []
+
+
+class HistogramResponse(BaseModel):
+    start: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+    label: Optional[str] = None
+    field: str
+    num_objects: int = 0
+    num_missing: int = 0
+    bins: List[Dict[str, Any]] = []
+
+
+def _status_index(request: Request) -> StatusIndex:
+    return request.app.state.status_index
+
+
+def _report_renderer(request: Request) -> ReportRenderer:
+    return request.app.state.report_renderer
+
+
+async def _resolve_job(request: Request, job_id: str) -> str:
+    """
+    Validates the job id and returns the bare id. Loading a job's status (event log or
+    job index lookup) runs in a worker thread, like all SQLite and archive work here.
+
+    Raises:
+        HTTPException: 404 if the id is invalid or the job folder does not exist.
+    """
+    bare_id = storage.normalize_job_id(job_id)
+    if bare_id is None or await asyncio.to_thread(_status_index(request).track, bare_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found — please re-upload the drawing")
+    return bare_id
+
+
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}},
+    }}},
+}
+
+
+@router.post("/upload", response_model=UploadResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload(request: Request) -> UploadResponse:
+    """
+    Streams the drawing (multipart field `file`) into a new (sharded) job folder and
+    starts tracking the job. The request body is parsed as it arrives and the file bytes
+    are written to disk in CHUNK_SIZE pieces from a worker thread, so memory and disk
+    stay flat per request. The size limit is enforced from Content-Length before reading
+    and again while streaming; the format and image size are checked from the image
+    header. Invalid or oversized uploads are rejected before the job becomes visible
+    to the segmentation service.
+    """
+    config = request.app.state.config
+    base_shared_dir = config["base_shared_dir"]
+    max_bytes = int(config.get("max_upload_mb", 25) * 1024 * 1024)
+
+    try:
+        reader = storage.MultipartFileReader(request.headers.get("content-type", ""))
+    except ValueError as e:
+        metrics.count("soulsketch_uploads_total", status="invalid")
+        raise HTTPException(status_code=422, detail=str(e))
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + storage.MULTIPART_OVERHEAD_BYTES:
+        metrics.count("soulsketch_uploads_total", status="too_large")
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+
+    job_id = await asyncio.to_thread(storage.create_job, base_shared_dir)
+    job_dir = storage.get_job_dir(base_shared_dir, job_id)
+    writer = storage.UploadWriter(job_dir, max_bytes, config.get("max_image_pixels", 40_000_000))
+
+    started = time.perf_counter()
+    try:
+        pending, pending_size, received = [], 0, 0
+        async for chunk in request.stream():
+            # Stops a body without (or with a wrong) Content-Length as soon as it is too big
+            received += len(chunk)
+            if received > max_bytes + storage.MULTIPART_OVERHEAD_BYTES:
+                raise storage.UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+            data = reader.feed(chunk)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= storage.CHUNK_SIZE:
+                await asyncio.to_thread(writer.write, b"".join(pending))
+                pending, pending_size = [], 0
+        reader.finish()
+        if pending:
+            await asyncio.to_thread(writer.write, b"".join(pending))
+        path, fmt, width, height = await asyncio.to_thread(writer.finish)
+    except ValueError as e:
+        await asyncio.to_thread(writer.abort)
+        await asyncio.to_thread(storage.delete_job, base_shared_dir, job_id)
+        too_large = isinstance(e, storage.UploadTooLarge)
+        metrics.count("soulsketch_uploads_total", status="too_large" if too_large else "invalid")
+        raise HTTPException(status_code=413 if too_large else 422, detail=str(e))
+    except BaseException:
+        # Includes the client disconnecting mid-upload
+        await asyncio.to_thread(writer.abort)
+        await asyncio.to_thread(storage.delete_job, base_shared_dir, job_id)
+        raise
+    metrics.record_span(job_dir, "upload_stream", time.perf_counter() - started, format=fmt)
+    metrics.count("soulsketch_uploads_total", status="accepted")
+    metrics.count("soulsketch_upload_bytes_total", writer.total)
+    publish_event(job_dir, "upload", COMPLETED, filename=reader.filename, format=fmt, width=width, height=height)
+    # Visible to segmentation from here on
+    await asyncio.to_thread(storage.set_job_state, base_shared_dir, job_id, UPLOADED)
+
+    await asyncio.to_thread(_status_index(request).track, job_id)
+    return UploadResponse(job_id=job_id, status="queued")
+
+
+@router.post("/analyze", response_model=AnalyzeResponse, status_code=202)
+async def analyze(request: Request, body: AnalyzeRequest) -> AnalyzeResponse:
+    """
+    Accepts the final analysis (or uses the job's final_objects.json) and queues the
+    report rendering. Returns immediately; /pdf/:id waits for the render to finish.
+    """
+    bare_id = await _resolve_job(request, body.job_id)
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    restored = await asyncio.to_thread(storage.restore_archived_job, base_shared_dir, bare_id)
+    job_dir = restored or storage.get_job_dir(base_shared_dir, bare_id)
+
+    if body.final_objects is not None:
+        await asyncio.to_thread(storage.save_final_objects, job_dir, body.final_objects)
+        await asyncio.to_thread(storage.set_job_state, base_shared_dir, bare_id, FINISHED)
+    elif not storage.has_final_objects(job_dir):
+        raise HTTPException(status_code=422, detail=f"Job '{bare_id}' has no final_objects.json yet")
+
+    future = _report_renderer(request).ensure_report(bare_id, job_dir)
+    return AnalyzeResponse(
+        job_id=bare_id,
+        report_status="ready" if future is None else "rendering",
+        pdf_url=f"/pdf/{bare_id}"
+    )
+
+
+@router.get("/status/{job_id}", response_model=StatusResponse)
+async def status(request: Request, job_id: str) -> StatusResponse:
+    """
+    Current job status, served from the in-memory status index.
+    """
+    bare_id = await _resolve_job(request, job_id)
+    return StatusResponse(**_status_index(request).get(bare_id))
+
+
+@router.get("/events/{job_id}")
+async def events(request: Request, job_id: str) -> StreamingResponse:
+    """
+    Server-Sent Events stream of the job's status: the current status first, then one
+    `status` event per change until the job completes or fails. Comment lines keep
+    idle connections open through proxies.
+    """
+    bare_id = await _resolve_job(request, job_id)
+    index = _status_index(request)
+    keepalive = request.app.state.config.get("sse_keepalive_seconds", 15)
+
+    async def stream():
+        queue = index.subscribe(bare_id)
+        try:
+            current = index.get(bare_id)
+            yield f"event: status\ndata: {json.dumps(current)}\n\n"
+            if current["status"] in ("complete", "failed"):
+                return
+
+            while True:
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(current)}\n\n"
+                if current["status"] in ("complete", "failed"):
+                    return
+        finally:
+            index.unsubscribe(bare_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/results/{job_id}", response_model=ResultsResponse)
+async def results(request: Request, job_id: str) -> ResultsResponse:
+    """
+    Emotional analysis of a finished job plus the report link.
+    """
+    bare_id = await _resolve_job(request, job_id)
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    job_dir = storage.get_job_dir(base_shared_dir, bare_id)
+
+    final_objects = storage.load_final_objects(job_dir)
+    if final_objects is None:
+        archived = await asyncio.to_thread(storage.read_archived_file, base_shared_dir, bare_id, storage.FINAL_FILENAME)
+        final_objects = json.loads(archived) if archived is not None else None
+    if final_objects is None:
+        raise HTTPException(status_code=409, detail=f"Job '{bare_id}' is not complete yet")
+
+    return ResultsResponse(
+        job_id=bare_id, status="complete", final_objects=final_objects, pdf_url=f"/pdf/{bare_id}"
+    )
+
+
+@router.get("/pdf/{job_id}")
+async def pdf(request: Request, job_id: str) -> Response:
+    """
+    Streams the job's report.pdf, rendering it first if needed. The handler only awaits
+    the shared render future, so the event loop keeps serving other requests meanwhile.
+    """
+    bare_id = await _resolve_job(request, job_id)
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    job_dir = storage.get_job_dir(base_shared_dir, bare_id)
+
+    if not os.path.isdir(job_dir) and await asyncio.to_thread(storage.is_archived, base_shared_dir, bare_id):
+        report = await asyncio.to_thread(storage.read_archived_file, base_shared_dir, bare_id, storage.REPORT_FILENAME)
+        if report is not None:
+            etag = '"' + hashlib.md5(report).hexdigest() + '"'
+            if etag in request.headers.get("if-none-match", ""):
+                return Response(status_code=304, headers={"ETag": etag})
+            return Response(report, media_type="application/pdf", headers={
+                "ETag": etag, "Cache-Control": "private, no-cache",
+                "Content-Disposition": f'attachment; filename="soulsketch_{bare_id}.pdf"'
+            })
+        # Archived before its report was rendered: bring the job back and render it
+        job_dir = await asyncio.to_thread(storage.restore_archived_job, base_shared_dir, bare_id) or job_dir
+
+    if not is_report_current(job_dir):
+        if not storage.has_final_objects(job_dir):
+            raise HTTPException(status_code=404, detail=f"Job '{bare_id}' is not complete yet")
+
+        future = _report_renderer(request).submit(bare_id, job_dir)
+        try:
+            # shield: a client timing out must not cancel the render other requests share
+            await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                timeout=request.app.state.config.get("pdf_wait_seconds", 30)
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Report is still rendering", headers={"Retry-After": "2"})
+        except Exception as e:
+            print(f"❌ PDF rendering failed for job {bare_id}: {e}")
+            raise HTTPException(status_code=500, detail="PDF rendering failed")
+
+    # Served with sendfile (FileResponse): Range requests and ETag/If-None-Match revalidation
+    report_path = storage.get_report_path(job_dir)
+    etag = storage.file_etag(report_path)
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return FileResponse(
+        report_path, media_type="application/pdf", filename=f"soulsketch_{bare_id}.pdf",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """
+    Prometheus text endpoint: the backend's own metrics plus the latest snapshot each
+    service published to shared/.metrics/ (every sample carries a `service` label).
+    """
+    config = request.app.state.config
+    if not metrics.is_enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+
+    snapshots = metrics.load_snapshots(config["base_shared_dir"], config.get("metrics_max_age_seconds", 0))
+    snapshots[metrics.SERVICE_NAME] = metrics.METRICS.snapshot()
+    return PlainTextResponse(
+        metrics.render_prometheus(snapshots), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _check_analytics(request: Request, start: Optional[datetime.date], end: Optional[datetime.date]) -> None:
+    if not request.app.state.config.get("analytics_enabled", True):
+        raise HTTPException(status_code=404, detail="Analytics are disabled")
+    if not analytics.is_available():
+        raise HTTPException(status_code=503, detail="Analytics require the pyarrow package")
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=422, detail="start must not be after end")
+
+
+@router.get("/analytics/emotions", response_model=AnalyticsResponse)
+async def analytics_emotions(
+    request: Request,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None
+) -> AnalyticsResponse:
+    """
+    Emotion-tag frequency per label over the jobs finished between `start` and `end`
+    (inclusive dates, UTC; both optional).
+    """
+    _check_analytics(request, start, end)
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    # Parquet scans run in a worker thread, off the event loop
+    result = await asyncio.to_thread(analytics.emotion_frequency, base_shared_dir, start, end, label)
+    return AnalyticsResponse(start=start, end=end, label=label, **result)
+
+
+@router.get("/analytics/colors", response_model=AnalyticsResponse)
+async def analytics_colors(
+    request: Request,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None,
+    mode: str = "primary"
+) -> AnalyticsResponse:
+    """
+    Emotional color distribution per label: each object's primary mapped color, or
+    every mapped color with mode=all.
+    """
+    _check_analytics(request, start, end)
+    if mode not in analytics.COLOR_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of: {', '.join(analytics.COLOR_MODES)}")
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    result = await asyncio.to_thread(analytics.color_distribution, base_shared_dir, start, end, label, mode)
+    return AnalyticsResponse(start=start, end=end, label=label, **result)
+
+
+@router.get("/analytics/scores", response_model=HistogramResponse)
+async def analytics_scores(
+    request: Request,
+    field: str = "relative_size_score",
+    bins: int = Query(20, ge=1, le=200),
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None,
+    lower: Optional[float] = None,
+    upper: Optional[float] = None
+) -> HistogramResponse:
+    """
+    Histogram of one relative score (relative_size_score, relative_distance_score,
+    relative_isolation_score or relative_complexity_score).
+    """
+    _check_analytics(request, start, end)
+    if field not in analytics.SCORE_FIELDS:
+        raise HTTPException(status_code=422, detail=f"field must be one of: {', '.join(analytics.SCORE_FIELDS)}")
+    base_shared_dir = request.app.state.config["base_shared_dir"]
+    result = await asyncio.to_thread(
+        analytics.score_histogram, base_shared_dir, field, bins, start, end, label, lower, upper
+    )
+    return HistogramResponse(start=start, end=end, label=label, **result)
@@ -0,0 +1,221 @@
+"""
+Module: analytics.py
+Purpose: Cohort-level aggregates over the date-partitioned Parquet export of finished jobs.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import datetime
+from typing import List, Dict, Any, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:  # optional — the /analytics endpoints answer 503 without it
+    pa = None
+
+# Same layout as emotion_mapper/analytics_export.py
+ANALYTICS_DIRNAME = "analytics"
+PARTITION_PREFIX = "date="
+SCORE_FIELDS = (
+    "relative_size_score", "relative_distance_score",
+    "relative_isolation_score", "relative_complexity_score",
+)
+COLOR_MODES = ("primary", "all")
+DEDUP_COLUMNS = ("job_id", "object_id", "finished_at")
+
+
+def is_available() -> bool:
+    return pa is not None
+
+
+def partition_files(
+    base_shared_dir: str,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None
+) -> List[str]:
+    """
+    Parquet files of the daily partitions between `start` and `end` (inclusive). Only
+    the partition folder names are compared, so days outside the range are never opened.
+    """
+    root = os.path.join(base_shared_dir, ANALYTICS_DIRNAME)
+    try:
+        partitions = sorted(name for name in os.listdir(root) if name.startswith(PARTITION_PREFIX))
+    except FileNotFoundError:
+        return []
+
+    files = []
+    for name in partitions:
+        day = name[len(PARTITION_PREFIX):]
+        if (start is not None and day < start.isoformat()) or (end is not None and day > end.isoformat()):
+            continue
+        partition_dir = os.path.join(root, name)
+        files.extend(
+            os.path.join(partition_dir, file) for file in sorted(os.listdir(partition_dir))
+            if file.endswith(".parquet") and not file.startswith(".")
+        )
+    return files
+
+
+def latest_rows(table: "pa.Table") -> "pa.Table":
+    """
+    Drops superseded exports: a job finished again (rerun, new final objects) or a pass
+    repeated after a crash is exported again, so only the rows of each job's latest
+    finished_at are kept, once per (job_id, object_id).
+    """
+    if table.num_rows == 0:
+        return table
+    # Joined on the key columns only (list columns can't pass through a join)
+    rows = pa.table({
+        "job_id": table.column("job_id"),
+        "object_id": pc.fill_null(table.column("object_id"), ""),
+        "finished_at": table.column("finished_at"),
+        "row": pa.array(range(table.num_rows), pa.int64()),
+    })
+    latest = rows.group_by("job_id").aggregate([("finished_at", "max")])
+    rows = rows.join(latest, "job_id")
+    rows = rows.filter(pc.equal(rows.column("finished_at"), rows.column("finished_at_max")))
+
+    # Repeated exports of the same run are identical: keep the first copy of each object
+    rows = rows.sort_by([("job_id", "ascending"), ("object_id", "ascending"), ("row", "ascending")])
+    keys = pc.binary_join_element_wise(rows.column("job_id"), rows.column("object_id"), "/").combine_chunks()
+    first = pc.not_equal(keys.slice(1), keys.slice(0, len(keys) - 1))
+    rows = rows.filter(pa.concat_arrays([pa.array([True]), first]))
+    return table.take(rows.column("row"))
+
+
+def load_objects(
+    base_shared_dir: str,
+    columns: List[str],
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None
+) -> "pa.Table":
+    """
+    Reads only the given columns of the exported objects in the date range, optionally
+    for one label (the filter is pushed down to the Parquet row groups). Superseded
+    exports of a job are dropped (see `latest_rows`).
+    """
+    files = partition_files(base_shared_dir, start, end)
+    if not files:
+        return pa.table({column: pa.array([], pa.string()) for column in columns})
+    dataset = ds.dataset(files, format="parquet")
+    keys = [key for key in DEDUP_COLUMNS if key not in columns]
+    table = dataset.to_table(columns=columns + keys, filter=(ds.field("label") == label) if label else None)
+    return latest_rows(table).select(columns)
+
+
+def _count_by(table: "pa.Table", keys: List[str]) -> List[Dict[str, Any]]:
+    if table.num_rows == 0:
+        return []
+    counts = table.group_by(keys).aggregate([(keys[0], "count", pc.CountOptions(mode="all"))])
+    rows = [
+        {**{key: row[key] for key in keys}, "count": row[f"{keys[0]}_count"]}
+        for row in counts.to_pylist()
+    ]
+
+    # Share of each row within its label
+    totals: Dict[Any, int] = {}
+    for row in rows:
+        totals[row["label"]] = totals.get(row["label"], 0) + row["count"]
+    for row in rows:
+        row["share"] = round(row["count"] / totals[row["label"]], 4)
+    rows.sort(key=lambda row: (str(row["label"]), -row["count"]))
+    return rows
+
+
+def emotion_frequency(
+    base_shared_dir: str,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    How often each emotion tag was given to each label.
+
+    Returns:
+        Dict[str, Any]: {"num_objects", "groups": [{"label", "emotion_tag", "count", "share"}]},
+        with `share` the fraction of that label's objects.
+    """
+    table = load_objects(base_shared_dir, ["label", "emotion_tag"], start, end, label)
+    return {"num_objects": table.num_rows, "groups": _count_by(table, ["label", "emotion_tag"])}
+
+
+def color_distribution(
+    base_shared_dir: str,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None,
+    mode: str = "primary"
+) -> Dict[str, Any]:
+    """
+    Emotional color groups per label.
+
+    Args:
+        mode (str): "primary" counts each object's first mapped color; "all" counts every
+            mapped color of every object.
+
+    Returns:
+        Dict[str, Any]: {"num_objects", "groups": [{"label", "color", "count", "share"}]}.
+    """
+    if mode == "primary":
+        table = load_objects(base_shared_dir, ["label", "primary_color"], start, end, label)
+        num_objects = table.num_rows
+        table = table.rename_columns(["label", "color"])
+    else:
+        table = load_objects(base_shared_dir, ["label", "mapped_colors"], start, end, label)
+        num_objects = table.num_rows
+        if num_objects:
+            colors = table.column("mapped_colors").combine_chunks()
+            labels = pc.take(table.column("label"), pc.list_parent_indices(colors))
+            table = pa.table({"label": labels, "color": pc.list_flatten(colors)})
+    return {"num_objects": num_objects, "groups": _count_by(table, ["label", "color"])}
+
+
+def score_histogram(
+    base_shared_dir: str,
+    field: str,
+    bins: int = 20,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    label: Optional[str] = None,
+    lower: Optional[float] = None,
+    upper: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Histogram of one relative score over `bins` equal-width bins. The range defaults to
+    the observed minimum and maximum; values outside an explicit range are not counted.
+
+    Returns:
+        Dict[str, Any]: {"field", "num_objects", "num_missing", "bins": [{"lower", "upper", "count"}]}.
+    """
+    if field not in SCORE_FIELDS:
+        raise ValueError(f"Unknown score field '{field}' (expected one of {', '.join(SCORE_FIELDS)})")
+
+    column = load_objects(base_shared_dir, [field], start, end, label).column(field)
+    values = pc.drop_null(column)
+    result = {"field": field, "num_objects": len(column), "num_missing": column.null_count, "bins": []}
+    if len(values) == 0:
+        return result
+
+    observed = pc.min_max(values)
+    lower = observed["min"].as_py() if lower is None else lower
+    upper = observed["max"].as_py() if upper is None else upper
+    if upper <= lower:
+        upper = lower + 1.0
+    width = (upper - lower) / bins
+
+    values = pc.filter(values, pc.and_(pc.greater_equal(values, lower), pc.less_equal(values, upper)))
+    counts = [0] * bins
+    if len(values):
+        index = pc.cast(pc.floor(pc.divide(pc.subtract(values, lower), width)), pa.int64())
+        index = pc.min_element_wise(index, bins - 1)   # the upper edge belongs to the last bin
+        for entry in pc.value_counts(index).to_pylist():
+            counts[entry["values"]] = entry["counts"]
+
+    result["bins"] = [
+        {"lower": round(lower + i * width, 6), "upper": round(lower + (i + 1) * width, 6), "count": count}
+        for i, count in enumerate(counts)
+    ]
+    return result
@@ -0,0 +1,117 @@
+"""
+Module: metrics.py
+Purpose: Backend metrics and the Prometheus text view of them plus the snapshots the services publish.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+from typing import List, Dict, Any, Tuple
+
+from segmentation_service.utils import tracing
+# The backend records into the same registry the services use, so all snapshots share
+# one format and one set of buckets
+from segmentation_service.utils.tracing import METRICS, METRICS_DIRNAME, count, is_enabled, job_trace
+
+SERVICE_NAME = "backend"
+
+__all__ = [
+    "METRICS", "SERVICE_NAME", "configure", "is_enabled", "count", "record_span",
+    "load_snapshots", "render_prometheus",
+]
+
+
+def configure(enabled: bool) -> bool:
+    """
+    Turns the backend metrics on or off (SOULSKETCH_TRACING=0/1 overrides the config).
+    """
+    return tracing.configure({"tracing": enabled})
+
+
+def record_span(job_dir: str, name: str, seconds: float, **labels: Any) -> None:
+    """
+    Records a span in the backend histogram and appends it to the job's trace.jsonl.
+    """
+    with job_trace([job_dir], SERVICE_NAME):
+        tracing.record_span(name, seconds, **labels)
+
+
+def load_snapshots(base_shared_dir: str, max_age_seconds: float = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    Reads the metrics snapshots published by the services (shared/.metrics/<service>.json).
+
+    Args:
+        base_shared_dir (str): Path to the shared folder.
+        max_age_seconds (float): Skip snapshots older than this (0 = keep all).
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {service: snapshot}.
+    """
+    metrics_dir = os.path.join(base_shared_dir, METRICS_DIRNAME)
+    snapshots = {}
+    try:
+        names = sorted(os.listdir(metrics_dir))
+    except OSError:
+        return snapshots
+
+    now = time.time()
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if max_age_seconds and now - snapshot.get("ts", 0) > max_age_seconds:
+            continue
+        snapshots[snapshot.get("service", name[:-len(".json")])] = snapshot
+    return snapshots
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") + '"'
+        for key, value in sorted(labels.items())
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(snapshots: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Renders snapshots in the Prometheus text exposition format (version 0.0.4).
+    Every sample gets a `service` label; series of the same name from different
+    services are grouped under one TYPE line.
+    """
+    families: Dict[str, Tuple[str, List[str]]] = {}
+
+    for service, snapshot in sorted(snapshots.items()):
+        for counter in snapshot.get("counters", []):
+            _, lines = families.setdefault(counter["name"], ("counter", []))
+            labels = {**counter["labels"], "service": service}
+            lines.append(f"{counter['name']}{_format_labels(labels)} {_format_value(counter['value'])}")
+
+        for hist in snapshot.get("histograms", []):
+            name = hist["name"]
+            _, lines = families.setdefault(name, ("histogram", []))
+            labels = {**hist["labels"], "service": service}
+            cumulative = 0
+            for bound, bucket_count in zip(hist["buckets"], hist["counts"]):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': repr(float(bound))})} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {_format_value(hist['count'])}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_value(hist['count'])}")
+
+    output = []
+    for name, (metric_type, lines) in sorted(families.items()):
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
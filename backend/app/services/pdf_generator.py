@@ -0,0 +1,225 @@
+"""
+Module: pdf_generator.py
+Purpose: Render report.pdf from final_objects.json off the request path (cached template, bounded worker pool).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import glob
+import json
+import time
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import Future, Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:
+    pisa = None
+
+from segmentation_service.utils.progress_events import publish_event, STARTED, COMPLETED, FAILED
+from app.services.metrics import count, record_span
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "templates")
+TEMPLATE_NAME = "report_template.html"
+FINAL_FILENAME = "final_objects.json"
+REPORT_FILENAME = "report.pdf"
+
+# "wkhtmltopdf": external binary (reference layout); "xhtml2pdf": pure Python, no subprocess
+RENDER_BACKENDS = ("wkhtmltopdf", "xhtml2pdf")
+EXECUTORS = ("thread", "process")
+
+
+@lru_cache(maxsize=None)
+def get_template(templates_dir: str = TEMPLATES_DIR, template_name: str = TEMPLATE_NAME) -> Template:
+    """
+    Loads and compiles the report template once per process.
+    """
+    env = Environment(
+        loader=FileSystemLoader(templates_dir),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False
+    )
+    return env.get_template(template_name)
+
+
+def build_report_context(job_id: str, job_dir: str, final_objects: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Template variables: job metadata, the objects and per-emotion counts.
+    """
+    uploads = glob.glob(os.path.join(job_dir, "uploaded.*"))
+    uploaded_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(uploads[0]))) if uploads else None
+    tag_counts = Counter(obj.get("emotion_tag", "neutral") for obj in final_objects)
+
+    return {
+        "job_id": job_id,
+        "uploaded_at": uploaded_at,
+        "generated_at": time.strftime("%Y-%m-%d %H:%M"),
+        "objects": final_objects,
+        "tag_counts": tag_counts.most_common(),
+    }
+
+
+def render_html(context: Dict[str, Any]) -> str:
+    return get_template().render(**context)
+
+
+def _pdf_with_wkhtmltopdf(html: str, output_path: str, binary: str, timeout: float) -> None:
+    subprocess.run(
+        [binary, "--quiet", "--encoding", "utf-8", "-", output_path],
+        input=html.encode("utf-8"), capture_output=True, timeout=timeout, check=True
+    )
+
+
+def _pdf_with_xhtml2pdf(html: str, output_path: str) -> None:
+    if pisa is None:
+        raise RuntimeError("❌ The xhtml2pdf backend requires the xhtml2pdf package")
+    with open(output_path, "wb") as f:
+        result = pisa.CreatePDF(html, dest=f, encoding="utf-8")
+    if result.err:
+        raise RuntimeError(f"❌ xhtml2pdf reported {result.err} error(s)")
+
+
+def generate_report(
+    job_id: str,
+    job_dir: str,
+    backend: str = "wkhtmltopdf",
+    wkhtmltopdf_path: str = "wkhtmltopdf",
+    timeout: float = 60
+) -> str:
+    """
+    Renders shared/job_<uuid>/report.pdf from final_objects.json.
+
+    The PDF is written to a temporary file and renamed into place, so readers never
+    see a partial report.
+
+    Args:
+        job_id (str): Job id (shown in the report).
+        job_dir (str): Path to the job folder.
+        backend (str): One of RENDER_BACKENDS.
+        wkhtmltopdf_path (str): wkhtmltopdf binary for the "wkhtmltopdf" backend.
+        timeout (float): Max seconds for the wkhtmltopdf subprocess.
+
+    Returns:
+        str: Path of the written report.
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"❌ Unknown report backend: {backend} (expected one of {RENDER_BACKENDS})")
+
+    with open(os.path.join(job_dir, FINAL_FILENAME), "r", encoding="utf-8") as f:
+        final_objects = json.load(f)
+    html = render_html(build_report_context(job_id, job_dir, final_objects))
+
+    path = os.path.join(job_dir, REPORT_FILENAME)
+    tmp_path = os.path.join(job_dir, f".{REPORT_FILENAME}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if backend == "wkhtmltopdf":
+            _pdf_with_wkhtmltopdf(html, tmp_path, wkhtmltopdf_path, timeout)
+        else:
+            _pdf_with_xhtml2pdf(html, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def is_report_current(job_dir: str) -> bool:
+    """
+    True if report.pdf exists and is not older than final_objects.json.
+    """
+    try:
+        return os.path.getmtime(os.path.join(job_dir, REPORT_FILENAME)) >= \
+            os.path.getmtime(os.path.join(job_dir, FINAL_FILENAME))
+    except OSError:
+        return False
+
+
+class ReportRenderer:
+    """
+    Renders reports in a bounded worker pool so request handlers never block on PDF
+    generation.
+
+    Concurrent requests for the same job share one render (the in-flight future is
+    reused until it finishes). Threads suit the wkhtmltopdf backend (the work happens
+    in the subprocess); the pure-Python xhtml2pdf backend is CPU-bound and scales
+    better with the process executor. Each worker compiles the template once.
+    """
+
+    def __init__(
+        self,
+        backend: str = "wkhtmltopdf",
+        max_workers: int = 2,
+        executor: str = "thread",
+        wkhtmltopdf_path: str = "wkhtmltopdf",
+        timeout: float = 60
+    ):
+        if backend not in RENDER_BACKENDS:
+            raise ValueError(f"❌ Unknown report backend: {backend} (expected one of {RENDER_BACKENDS})")
+        if executor not in EXECUTORS:
+            raise ValueError(f"❌ Unknown report executor: {executor} (expected one of {EXECUTORS})")
+
+        self.backend = backend
+        self.wkhtmltopdf_path = wkhtmltopdf_path
+        self.timeout = timeout
+        self._executor: Executor = (
+            ProcessPoolExecutor(max_workers=max_workers) if executor == "process"
+            else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        )
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str, job_dir: str) -> Future:
+        """
+        Starts rendering the job's report, or returns the render already in progress.
+
+        Returns:
+            Future: Resolves to the report path (raises if rendering failed).
+        """
+        with self._lock:
+            future = self._inflight.get(job_id)
+            if future is not None:
+                return future
+
+            publish_event(job_dir, "report", STARTED, backend=self.backend)
+            started = time.perf_counter()
+            future = self._executor.submit(
+                generate_report, job_id, job_dir, self.backend, self.wkhtmltopdf_path, self.timeout
+            )
+            self._inflight[job_id] = future
+
+        def _done(done: Future) -> None:
+            with self._lock:
+                self._inflight.pop(job_id, None)
+            elapsed = time.perf_counter() - started
+            elapsed_ms = round(elapsed * 1000, 1)
+            error = done.exception()
+            # Timed from submit (includes waiting for a free worker), in this process so
+            # it also covers renders done by the process executor
+            record_span(job_dir, "pdf_render", elapsed, backend=self.backend)
+            count("soulsketch_reports_total", backend=self.backend, status=FAILED if error else COMPLETED)
+            if error is None:
+                publish_event(job_dir, "report", COMPLETED, render_ms=elapsed_ms)
+                print(f"📄 Rendered report for job {job_id} in {elapsed_ms} ms")
+            else:
+                publish_event(job_dir, "report", FAILED, error=str(error))
+                print(f"❌ Report rendering failed for job {job_id}: {error}")
+
+        future.add_done_callback(_done)
+        return future
+
+    def ensure_report(self, job_id: str, job_dir: str) -> Optional[Future]:
+        """
+        Submits a render unless an up-to-date report already exists.
+        """
+        if is_report_current(job_dir):
+            return None
+        return self.submit(job_id, job_dir)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
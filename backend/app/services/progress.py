@@ -0,0 +1,283 @@
+"""
+Module: progress.py
+Purpose: In-memory job status index fed by the per-job progress event logs, with push notifications for subscribers.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from app.services import storage
+from segmentation_service.utils.progress_events import EVENTS_FILENAME
+ANALYSIS_STAGES = ("segmentation", "object_processor", "comparator", "emotion_mapper")
+FINAL_STAGE = "emotion_mapper"
+
+# Stage outputs, used once for jobs that have no event log (created before events existed)
+LEGACY_STAGE_OUTPUTS = [
+    ("segmentation", "segmented_objects.json"),
+    ("object_processor", "object_features.json"),
+    ("comparator", "enriched_objects.json"),
+    ("emotion_mapper", "final_objects.json"),
+]
+
+QUEUED, RUNNING, COMPLETE, FAILED = "queued", "running", "complete", "failed"
+TERMINAL_STATES = (COMPLETE, FAILED)
+
+
+def read_events(job_dir: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Reads the complete events appended since `offset`.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        offset (int): Byte offset already consumed.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], int]: New events and the offset after the last full line
+        (a line still being written is left for the next read).
+    """
+    try:
+        with open(os.path.join(job_dir, EVENTS_FILENAME), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    end = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, offset + end
+
+
+class JobStatus:
+    """
+    Status of one job, folded from its events.
+    """
+
+    def __init__(self, job_id: str, job_dir: str):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.offset = 0
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.completed_stages: List[str] = []
+        self.detail: Dict[str, Any] = {}
+        self.updated_at = 0.0
+        self.num_events = 0
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        stage, status = event.get("stage"), event.get("status")
+        self.num_events += 1
+        self.updated_at = event.get("ts", time.time())
+        self.stage = stage
+        self.detail = {k: v for k, v in event.items() if k not in ("ts", "stage", "status")}
+
+        # Only analysis stages change the job state (upload and report events are informational)
+        if stage not in ANALYSIS_STAGES:
+            return
+        if status == "failed":
+            self.status = FAILED
+        elif status == "completed":
+            if stage not in self.completed_stages:
+                self.completed_stages.append(stage)
+            self.status = COMPLETE if stage == FINAL_STAGE else RUNNING
+        elif status in ("started", "retrying"):
+            self.status = RUNNING
+
+    @property
+    def terminal(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(len(self.completed_stages) / len(ANALYSIS_STAGES), 2),
+            "completed_stages": list(self.completed_stages),
+            "detail": self.detail,
+            "updated_at": self.updated_at,
+        }
+
+
+class StatusIndex:
+    """
+    Keeps the status of every tracked job in memory.
+
+    A single background thread tails the event logs of the jobs that are not complete
+    (one stat per active job per tick, shared by all clients), so `/status` requests are
+    dictionary lookups and never touch the shared volume. Subscribers (SSE streams)
+    receive every status change pushed onto their asyncio queue, and `on_complete`
+    (if given) is called with (job_id, job_dir) when a tracked job finishes.
+    """
+
+    def __init__(
+        self,
+        base_shared_dir: str,
+        poll_interval: float = 0.5,
+        max_jobs: int = 10000,
+        on_complete: Optional[Callable[[str, str], None]] = None
+    ):
+        self.base_shared_dir = base_shared_dir
+        self.poll_interval = poll_interval
+        self.max_jobs = max_jobs
+        self.on_complete = on_complete
+
+        self._jobs: "OrderedDict[str, JobStatus]" = OrderedDict()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def job_dir(self, job_id: str) -> str:
+        return storage.get_job_dir(self.base_shared_dir, job_id)
+
+    def start(self) -> None:
+        """
+        Starts tailing event logs in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="status-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def track(self, job_id: str) -> Optional[JobStatus]:
+        """
+        Returns the job's status record, loading it from its event log on first access.
+
+        Returns:
+            Optional[JobStatus]: None if the job folder does not exist (and it was not archived).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+                return job
+
+        job_dir = self.job_dir(job_id)
+        job = JobStatus(job_id, job_dir)
+        if os.path.isdir(job_dir):
+            events, job.offset = read_events(job_dir)
+            for event in events:
+                job.apply(event)
+            if not events:
+                self._apply_legacy_outputs(job)
+        else:
+            # Compacted by the retention worker: only finished jobs are archived
+            record = storage.get_job_record(self.base_shared_dir, job_id)
+            if record is None or record["state"] != storage.ARCHIVED:
+                return None
+            job.status = COMPLETE
+            job.completed_stages = list(ANALYSIS_STAGES)
+            job.updated_at = record["finished_at"] or record["updated_at"]
+            job.detail = {"archived": True}
+
+        with self._lock:
+            job = self._jobs.setdefault(job_id, job)
+            self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Current status of a job as a dict (None if unknown).
+        """
+        job = self.track(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            return job.to_dict()
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """
+        Registers an asyncio queue that receives the job's status dict on every change.
+        Must be called from the event loop that will consume the queue.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            remaining = [(loop, q) for loop, q in self._subscribers.get(job_id, []) if q is not queue]
+            if remaining:
+                self._subscribers[job_id] = remaining
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def refresh(self) -> None:
+        """
+        Reads new events of all active jobs and notifies their subscribers.
+        """
+        # Failed jobs stay tailed: a released job can be retried by its stage
+        with self._lock:
+            active = [job for job in self._jobs.values() if job.status != COMPLETE]
+
+        for job in active:
+            try:
+                size = os.path.getsize(os.path.join(job.job_dir, EVENTS_FILENAME))
+            except OSError:
+                continue
+            if size <= job.offset:
+                continue
+
+            events, offset = read_events(job.job_dir, job.offset)
+            with self._lock:
+                job.offset = offset
+                for event in events:
+                    job.apply(event)
+                snapshot = job.to_dict()
+                subscribers = list(self._subscribers.get(job.job_id, []))
+
+            if job.status == COMPLETE and self.on_complete is not None:
+                try:
+                    self.on_complete(job.job_id, job.job_dir)
+                except Exception as e:
+                    print(f"⚠️ Completion hook failed for job {job.job_id}: {e}")
+
+            if events:
+                for loop, queue in subscribers:
+                    try:
+                        loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+                    except RuntimeError:
+                        pass   # subscriber's loop is already closed
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Status index error: {e}")
+
+    def _apply_legacy_outputs(self, job: JobStatus) -> None:
+        for stage, filename in LEGACY_STAGE_OUTPUTS:
+            if os.path.exists(os.path.join(job.job_dir, filename)):
+                job.apply({"ts": os.path.getmtime(os.path.join(job.job_dir, filename)),
+                           "stage": stage, "status": "completed"})
+        job.num_events = 0
+
+    def _evict(self) -> None:
+        # Oldest finished jobs go first; running jobs are kept
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [jid for jid, job in self._jobs.items() if job.terminal]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if job_id not in self._subscribers:
+                del self._jobs[job_id]
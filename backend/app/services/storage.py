@@ -0,0 +1,411 @@
+"""
+Module: storage.py
+Purpose: Job folder management (sharded layout + job index) and file I/O for uploads, final results and reports.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import re
+import json
+import struct
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple, BinaryIO
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # releases before 0.0.13 install the package as `multipart`
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from segmentation_service.utils.job_store import JobStore, resolve_job_dir, ARCHIVED
+
+FINAL_FILENAME = "final_objects.json"
+REPORT_FILENAME = "report.pdf"
+
+_stores: Dict[str, JobStore] = {}
+_stores_lock = threading.Lock()
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9A-Za-z-]{1,64}$")
+
+CHUNK_SIZE = 1024 * 1024
+# Allowance for the multipart framing (boundaries, part headers) around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 256 * 1024
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers carrying the JPEG size (all SOFn except DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+UPLOAD_EXTENSIONS = {"png": "png", "jpeg": "jpg"}
+
+
+class UploadTooLarge(ValueError):
+    """
+    The upload exceeds the configured file or image size limit.
+    """
+
+
+def normalize_job_id(job_id: str) -> Optional[str]:
+    """
+    Accepts "<id>" or "job_<id>" and returns the bare id, or None if it is not a valid
+    job id (so it can never be used to escape the shared folder).
+    """
+    job_id = job_id[len("job_"):] if job_id.startswith("job_") else job_id
+    return job_id if _JOB_ID_PATTERN.match(job_id) else None
+
+
+def job_store(base_shared_dir: str) -> JobStore:
+    """
+    The shared job store (sharded folders + state index) of a shared folder; one per
+    folder, with one SQLite connection per thread.
+    """
+    with _stores_lock:
+        store = _stores.get(base_shared_dir)
+        if store is None:
+            store = _stores[base_shared_dir] = JobStore(base_shared_dir)
+        return store
+
+
+def get_job_dir(base_shared_dir: str, job_id: str) -> str:
+    """
+    Folder of a job — its shard, or shared/job_<id>/ for a job from before sharding.
+    Costs at most two stats, however many jobs are kept.
+    """
+    return resolve_job_dir(base_shared_dir, job_id)
+
+
+def create_job(base_shared_dir: str) -> str:
+    """
+    Creates a new sharded job folder and registers it in the job index as "created".
+    The segmentation service only picks it up once it is marked "uploaded".
+
+    Returns:
+        str: The new job id (UUIDv4).
+    """
+    job_id, _ = job_store(base_shared_dir).create()
+    return job_id
+
+
+def set_job_state(base_shared_dir: str, job_id: str, state: str) -> None:
+    job_store(base_shared_dir).set_state(job_id, state)
+
+
+def delete_job(base_shared_dir: str, job_id: str) -> None:
+    """
+    Removes a job's folder and index entry (e.g. after a rejected upload).
+    """
+    job_store(base_shared_dir).delete(job_id)
+
+
+def get_job_record(base_shared_dir: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The job's index entry (state, timestamps, archive), or None if it is not indexed.
+    """
+    return job_store(base_shared_dir).get(job_id)
+
+
+def is_archived(base_shared_dir: str, job_id: str) -> bool:
+    record = get_job_record(base_shared_dir, job_id)
+    return record is not None and record["state"] == ARCHIVED
+
+
+def read_archived_file(base_shared_dir: str, job_id: str, filename: str) -> Optional[bytes]:
+    """
+    Reads one output of a job the retention worker compacted into an archive
+    (None if the job is not archived or the file is not part of it).
+    """
+    return job_store(base_shared_dir).read_archived(job_id, filename)
+
+
+def restore_archived_job(base_shared_dir: str, job_id: str) -> Optional[str]:
+    """
+    Extracts an archived job back into its folder (see JobStore.restore).
+
+    Returns:
+        Optional[str]: The job folder, or None if the job is not archived.
+    """
+    return job_store(base_shared_dir).restore(job_id)
+
+
+def read_image_header(header: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Identifies a PNG or JPEG upload and its size from the first bytes of the file,
+    without decoding it.
+
+    Args:
+        header (bytes): Leading bytes of the upload.
+
+    Returns:
+        Optional[Tuple[str, int, int]]: (format, width, height), or None if more bytes
+        are needed (JPEG size markers can come after large metadata segments).
+
+    Raises:
+        ValueError: If the bytes are not a supported image.
+    """
+    if header.startswith(PNG_SIGNATURE[:len(header)]) and len(header) < 24:
+        return None
+    if header.startswith(PNG_SIGNATURE):
+        if header[12:16] != b"IHDR":
+            raise ValueError("Corrupt PNG header")
+        width, height = struct.unpack(">II", header[16:24])
+        return "png", width, height
+
+    if len(header) < 3:
+        return None
+    if not header.startswith(b"\xff\xd8\xff"):
+        raise ValueError("Unsupported image format (expected PNG or JPEG)")
+
+    pos = 2
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG header")
+        marker = header[pos + 1]
+        if marker == 0xFF:                        # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > len(header):
+                return None
+            height, width = struct.unpack(">HH", header[pos + 5:pos + 9])
+            return "jpeg", width, height
+        pos += 2 + struct.unpack(">H", header[pos + 2:pos + 4])[0]
+    return None
+
+
+class UploadWriter:
+    """
+    Writes an upload to disk chunk by chunk and publishes it atomically.
+
+    The bytes go to a hidden `.upload.part` file; the image is validated from its header
+    as soon as enough bytes arrived, and only a complete, valid upload is renamed to
+    uploaded.<ext>. The job watchers skip dot-files, so they never see a partial image.
+    The methods block on disk I/O — call them from a worker thread (asyncio.to_thread)
+    in request handlers.
+    """
+
+    def __init__(self, job_dir: str, max_bytes: int, max_pixels: int):
+        self.job_dir = job_dir
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.tmp_path = os.path.join(job_dir, ".upload.part")
+        self.total = 0
+        self._header = b""
+        self._info: Optional[Tuple[str, int, int]] = None
+        self._file = None
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Appends a chunk.
+
+        Raises:
+            UploadTooLarge: If the file or the image exceeds the limits.
+            ValueError: If the upload is not a valid PNG/JPEG.
+        """
+        self.total += len(chunk)
+        if self.total > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+
+        if self._info is None:
+            self._header += chunk[:MAX_HEADER_BYTES - len(self._header)]
+            self._info = read_image_header(self._header)
+            if self._info is None and len(self._header) >= MAX_HEADER_BYTES:
+                raise ValueError("Image size not found in the file header")
+            if self._info is not None:
+                _, width, height = self._info
+                if width <= 0 or height <= 0:
+                    raise ValueError("Image has no pixels")
+                if width * height > self.max_pixels:
+                    raise UploadTooLarge(f"Image is {width}x{height} — above the {self.max_pixels} pixel limit")
+
+        if self._file is None:
+            self._file = open(self.tmp_path, "wb")
+        self._file.write(chunk)
+
+    def finish(self) -> Tuple[str, str, int, int]:
+        """
+        Publishes the complete upload as uploaded.<ext>.
+
+        Returns:
+            Tuple[str, str, int, int]: (stored path, format, width, height).
+
+        Raises:
+            ValueError: If the upload ended before its image header was complete.
+        """
+        if self._info is None:
+            raise ValueError("Empty or truncated image")
+        self._file.close()
+        fmt, width, height = self._info
+        path = os.path.join(self.job_dir, f"uploaded.{UPLOAD_EXTENSIONS[fmt]}")
+        os.replace(self.tmp_path, path)
+        return path, fmt, width, height
+
+    def abort(self) -> None:
+        """
+        Drops the partial upload.
+        """
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class MultipartFileReader:
+    """
+    Incremental multipart/form-data parser: each `feed` takes the next bytes of the
+    request body and returns the bytes of the file field found in them, so an upload
+    can be written to disk while it arrives, without spooling the body first.
+    """
+
+    def __init__(self, content_type: str, field_name: str = "file"):
+        mime, params = parse_options_header(content_type)
+        if mime != b"multipart/form-data" or not params.get(b"boundary"):
+            raise ValueError("Expected a multipart/form-data upload")
+        self.field_name = field_name.encode("utf-8")
+        self.filename: Optional[str] = None
+        self.found = False
+
+        self._data: List[bytes] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = self._header_value = b""
+        self._in_file = False
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Only the first part of the file field is the upload
+        if options.get(b"name") == self.field_name and not self.found:
+            self._in_file = self.found = True
+            filename = options.get(b"filename")
+            self.filename = filename.decode("utf-8", "replace") if filename else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self) -> None:
+        self._in_file = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """
+        Parses the next body bytes and returns the file bytes they contained.
+
+        Raises:
+            ValueError: If the body is not valid multipart data.
+        """
+        self._data = []
+        self._parser.write(chunk)
+        return b"".join(self._data)
+
+    def finish(self) -> None:
+        """
+        Checks that the body ended and contained the file field.
+
+        Raises:
+            ValueError: If the body is incomplete or has no file field.
+        """
+        self._parser.finalize()
+        if not self.found:
+            raise ValueError(f"No '{self.field_name.decode()}' field in the upload")
+
+
+def save_upload(
+    job_dir: str,
+    source: BinaryIO,
+    max_bytes: int,
+    max_pixels: int,
+    chunk_size: int = CHUNK_SIZE
+) -> Tuple[str, str, int, int]:
+    """
+    Copies an already readable file into the job folder with `UploadWriter`
+    (e.g. when importing drawings from disk). Blocking.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        source (BinaryIO): Readable file, read from its current position to the end.
+        max_bytes (int): Upload size limit.
+        max_pixels (int): Image size limit (width x height).
+        chunk_size (int): Bytes per read/write.
+
+    Returns:
+        Tuple[str, str, int, int]: (stored path, format, width, height).
+
+    Raises:
+        UploadTooLarge: If the file or the image exceeds the limits.
+        ValueError: If the upload is not a valid PNG/JPEG.
+    """
+    writer = UploadWriter(job_dir, max_bytes, max_pixels)
+    try:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def load_final_objects(job_dir: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Reads final_objects.json (None while the job is still running).
+    """
+    path = os.path.join(job_dir, FINAL_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def has_final_objects(job_dir: str) -> bool:
+    return os.path.exists(os.path.join(job_dir, FINAL_FILENAME))
+
+
+def save_final_objects(job_dir: str, final_objects: List[Dict[str, Any]]) -> str:
+    """
+    Atomically writes final_objects.json (e.g. when submitted through /analyze).
+    """
+    path = os.path.join(job_dir, FINAL_FILENAME)
+    tmp_path = os.path.join(job_dir, f".{FINAL_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(final_objects, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_report_path(job_dir: str) -> Optional[str]:
+    """
+    Path of the job's report.pdf, or None if it was not rendered yet.
+    """
+    path = os.path.join(job_dir, REPORT_FILENAME)
+    return path if os.path.exists(path) else None
+
+
+def file_etag(path: str) -> str:
+    """
+    Strong ETag from the file's mtime and size (no content hashing, so it costs one stat).
+    """
+    stat = os.stat(path)
+    return '"' + hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest() + '"'
@@ -0,0 +1,179 @@
+"""
+Module: comparator_engine.py
+Purpose: Main comparator loop — relational scoring of each job's objects (enriched_objects.json).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import List, Dict, Any, Optional
+
+import yaml
+
+from comparator_engine.scorer import score_jobs
+from segmentation_service.utils.progress_events import publish_event, STARTED, COMPLETED, FAILED
+from segmentation_service.utils.stage_claims import claim_job, release_job, record_stage_failure
+from segmentation_service.utils.tracing import configure as configure_tracing, job_trace
+from segmentation_service.utils.job_store import JobStore, resolve_job_dir, SEGMENTED
+
+FEATURES_FILENAME = "object_features.json"
+ENRICHED_FILENAME = "enriched_objects.json"
+CLAIM_FILENAME = ".comparator.claim"
+
+
+def load_config(config_path: str = "config.yaml") -> dict:
+    """
+    Loads the configuration YAML file.
+
+    Args:
+        config_path (str): Path to the configuration YAML file.
+
+    Returns:
+        dict: Loaded configuration dictionary.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def find_pending_jobs(job_store: JobStore) -> List[str]:
+    """
+    Lists jobs that have object_features.json but no enriched_objects.json yet, oldest
+    first. Candidates come from the job index, so only jobs in flight are checked.
+    """
+    pending = []
+    for job_dir in job_store.job_dirs([SEGMENTED]):
+        if os.path.exists(os.path.join(job_dir, FEATURES_FILENAME)) and \
+                not os.path.exists(os.path.join(job_dir, ENRICHED_FILENAME)):
+            pending.append(job_dir)
+    return pending
+
+
+def save_enriched_objects(job_dir: str, objects: List[Dict[str, Any]]) -> str:
+    """
+    Atomically writes enriched_objects.json into the job folder.
+    """
+    path = os.path.join(job_dir, ENRICHED_FILENAME)
+    tmp_path = os.path.join(job_dir, f".{ENRICHED_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(objects, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def process_jobs(
+    job_dirs: List[str],
+    config: Dict[str, Any],
+    errors: Optional[Dict[str, str]] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Scores several jobs with one `score_jobs` call and writes enriched_objects.json for each.
+
+    Args:
+        job_dirs (List[str]): Job folders with object_features.json.
+        config (Dict[str, Any]): Comparator configuration.
+        errors (Optional[Dict[str, str]]): Filled with {job_dir: error} for the jobs that
+            could not be read (their failure is reported by the caller).
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: {job_dir: enriched objects} for the jobs that succeeded.
+    """
+    errors = {} if errors is None else errors
+    loaded = {}
+    for job_dir in job_dirs:
+        publish_event(job_dir, "comparator", STARTED)
+        try:
+            with open(os.path.join(job_dir, FEATURES_FILENAME), "r", encoding="utf-8") as f:
+                loaded[job_dir] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Failed to read {FEATURES_FILENAME} for {job_dir}: {e}")
+            errors[job_dir] = str(e)
+
+    start = time.perf_counter()
+    enriched = score_jobs(
+        list(loaded.values()),
+        kd_tree_threshold=config.get("kd_tree_threshold", 256),
+        max_block_elements=config.get("max_block_elements", 4_000_000)
+    )
+    num_objects = sum(len(objects) for objects in enriched)
+    print(f"📏 Scored {num_objects} objects from {len(loaded)} job(s) "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    results = {}
+    for job_dir, objects in zip(loaded, enriched):
+        save_enriched_objects(job_dir, objects)
+        publish_event(job_dir, "comparator", COMPLETED, num_objects=len(objects))
+        print(f"✅ Wrote {ENRICHED_FILENAME} with {len(objects)} objects to: {job_dir}")
+        results[job_dir] = objects
+    return results
+
+
+def run_comparator_engine(config_path: str = "config.yaml") -> None:
+    """
+    Main loop: waits for jobs with object features and scores up to `max_jobs_per_batch` together.
+    """
+    print("📏 Comparator Engine Started...")
+
+    config = load_config(config_path)
+    configure_tracing(config)
+    base_shared_dir = config["base_shared_dir"]
+    job_store = JobStore(base_shared_dir)
+    check_interval = config.get("check_interval_seconds", 1)
+    max_jobs = max(1, config.get("max_jobs_per_batch", 16))
+    lease_seconds = config.get("job_lease_seconds", 300)
+    max_attempts = max(1, config.get("job_max_attempts", 3))
+    retry_delay = config.get("job_retry_delay_seconds", 5)
+
+    while True:
+        claimed = []
+        try:
+            for job_dir in find_pending_jobs(job_store):
+                if len(claimed) >= max_jobs:
+                    break
+                if claim_job(job_dir, CLAIM_FILENAME, lease_seconds):
+                    claimed.append(job_dir)
+        except FileNotFoundError:
+            pass
+
+        if not claimed:
+            time.sleep(check_interval)
+            continue
+
+        results, errors, batch_error = {}, {}, ""
+        try:
+            with job_trace(claimed, "comparator", base_shared_dir):
+                results = process_jobs(claimed, config, errors)
+        except Exception as e:
+            print(f"❌ Error during comparator engine: {e}")
+            batch_error = str(e)
+
+        # Failed jobs are retried after a backoff, then marked "failed" in the job index
+        for job_dir in claimed:
+            if job_dir not in results:
+                record_stage_failure(
+                    job_store, job_dir, "comparator", errors.get(job_dir, batch_error), max_attempts, retry_delay
+                )
+            release_job(job_dir, CLAIM_FILENAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch comparator engine")
+    parser.add_argument("--job_id", help="Process a single job (shared/job_<id>) and exit")
+    parser.add_argument("--config", default="config.yaml", help="Path to config.yaml")
+    args = parser.parse_args()
+
+    if args.job_id:
+        cfg = load_config(args.config)
+        configure_tracing(cfg)
+        job_dir = resolve_job_dir(cfg["base_shared_dir"], args.job_id)
+        errors = {}
+        with job_trace([job_dir], "comparator"):
+            process_jobs([job_dir], cfg, errors)
+        if job_dir in errors:
+            publish_event(job_dir, "comparator", FAILED, error=errors[job_dir])
+    else:
+        run_comparator_engine(args.config)
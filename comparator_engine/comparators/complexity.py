@@ -0,0 +1,36 @@
+"""
+Module: complexity.py
+Purpose: Relative complexity score of each object compared to its drawing's average complexity.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from comparator_engine.comparators.size import group_relative_scores
+
+
+def relative_complexity_scores(
+    complexities: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    num_groups: int = 1
+) -> np.ndarray:
+    """
+    Computes `complexity / average_complexity` for all objects at once, relative to
+    each object's own job.
+
+    Args:
+        complexities (np.ndarray): `complexity_score` per object, shape (N,). NaN marks
+            objects without a complexity score (they are skipped).
+        groups (Optional[np.ndarray]): Job index per object (default: one job).
+        num_groups (int): Number of jobs.
+
+    Returns:
+        np.ndarray: Scores of shape (N,) — NaN where the value is missing, 1.0 when
+        there is no meaningful average (single object or all-zero complexity).
+    """
+    complexities = np.asarray(complexities, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(complexities), dtype=np.int64)
+    return group_relative_scores(complexities, groups, num_groups)
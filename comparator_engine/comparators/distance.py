@@ -0,0 +1,106 @@
+"""
+Module: distance.py
+Purpose: Pairwise distances between object centers, relative distance and isolation scores.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # optional — large object sets fall back to chunked distance matrices
+    cKDTree = None
+
+KD_TREE_THRESHOLD = 256
+CHUNK_ROWS = 2048
+
+
+def pairwise_distances(points: np.ndarray) -> np.ndarray:
+    """
+    Euclidean distance matrix between object centers (broadcasting).
+
+    Args:
+        points (np.ndarray): Centers of shape (N, 2).
+
+    Returns:
+        np.ndarray: Matrix of shape (N, N).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    diff = points[:, None, :] - points[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+
+def mean_distances(points: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """
+    Average distance from each object to all other objects.
+    Rows are computed in chunks so memory stays O(chunk_rows * N).
+
+    Args:
+        points (np.ndarray): Centers of shape (N, 2).
+        chunk_rows (int): Rows of the distance matrix held in memory at once.
+
+    Returns:
+        np.ndarray: Shape (N,), zeros if N < 2.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n < 2:
+        return np.zeros(n)
+
+    totals = np.empty(n)
+    for start in range(0, n, chunk_rows):
+        block = points[start:start + chunk_rows]
+        totals[start:start + len(block)] = np.sqrt(((block[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)).sum(axis=1)
+    return totals / (n - 1)
+
+
+def nearest_neighbor_distances(points: np.ndarray, kd_tree_threshold: int = KD_TREE_THRESHOLD) -> np.ndarray:
+    """
+    Distance from each object to its closest neighbour.
+    Uses a KD-tree (scipy) for large object sets, the distance matrix otherwise.
+
+    Args:
+        points (np.ndarray): Centers of shape (N, 2).
+        kd_tree_threshold (int): Object count from which the KD-tree is used.
+
+    Returns:
+        np.ndarray: Shape (N,), zeros if N < 2.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n < 2:
+        return np.zeros(n)
+
+    if cKDTree is not None and n >= kd_tree_threshold:
+        distances, _ = cKDTree(points).query(points, k=2)
+        return distances[:, 1]
+
+    nearest = np.empty(n)
+    for start in range(0, n, CHUNK_ROWS):
+        block = np.sqrt(((points[start:start + CHUNK_ROWS, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+        rows = np.arange(len(block))
+        block[rows, start + rows] = np.inf
+        nearest[start:start + len(block)] = block.min(axis=1)
+    return nearest
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    average = values.mean() if len(values) else 0.0
+    if len(values) < 2 or average <= 0:
+        return np.ones(len(values))
+    return values / average
+
+
+def relative_distance_scores(points: np.ndarray) -> np.ndarray:
+    """
+    `avg_dist_from_obj / avg_pairwise_distance` for every object (1.0 for a single object).
+    """
+    return _normalize(mean_distances(points))
+
+
+def relative_isolation_scores(points: np.ndarray, kd_tree_threshold: int = KD_TREE_THRESHOLD) -> np.ndarray:
+    """
+    Nearest-neighbour distance divided by the drawing's average nearest-neighbour distance.
+    Values > 1.3 mark objects that stand apart from everything else.
+    """
+    return _normalize(nearest_neighbor_distances(points, kd_tree_threshold))
@@ -0,0 +1,59 @@
+"""
+Module: size.py
+Purpose: Relative size score of each object compared to its drawing's average object size.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import Optional
+
+import numpy as np
+
+
+def group_relative_scores(values: np.ndarray, groups: np.ndarray, num_groups: int) -> np.ndarray:
+    """
+    `value / mean(value within its job)` for all objects of all jobs in one pass.
+
+    Args:
+        values (np.ndarray): Shape (N,), NaN for missing values.
+        groups (np.ndarray): Job index per object, shape (N,).
+        num_groups (int): Number of jobs.
+
+    Returns:
+        np.ndarray: Shape (N,) — NaN for missing values, 1.0 for jobs with a single
+        object or a non-positive average.
+    """
+    valid = ~np.isnan(values)
+    sums = np.bincount(groups, weights=np.where(valid, values, 0.0), minlength=num_groups)
+    counts = np.bincount(groups, weights=valid.astype(np.float64), minlength=num_groups)
+    objects = np.bincount(groups, minlength=num_groups)
+
+    means = sums / np.maximum(counts, 1)
+    degenerate = (objects < 2) | (means <= 0)
+    scores = values / np.where(degenerate, 1.0, means)[groups]
+    scores[degenerate[groups]] = 1.0
+    scores[~valid] = np.nan
+    return scores
+
+
+def relative_size_scores(
+    sizes: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    num_groups: int = 1
+) -> np.ndarray:
+    """
+    Computes `size / average_size` for all objects at once, relative to each
+    object's own job.
+
+    Args:
+        sizes (np.ndarray): Object sizes, shape (N,). NaN marks a missing size.
+        groups (Optional[np.ndarray]): Job index per object (default: one job).
+        num_groups (int): Number of jobs.
+
+    Returns:
+        np.ndarray: Scores of shape (N,) — NaN where the size is missing, 1.0 when
+        there is no meaningful average (single object or all-zero sizes).
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(sizes), dtype=np.int64)
+    return group_relative_scores(sizes, groups, num_groups)
@@ -0,0 +1,191 @@
+"""
+Module: scorer.py
+Purpose: Coordinate the relational scores (size, distance, isolation, complexity) for one or many jobs.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import math
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from comparator_engine.comparators.size import relative_size_scores
+from comparator_engine.comparators.complexity import relative_complexity_scores
+from comparator_engine.comparators.distance import (
+    KD_TREE_THRESHOLD, relative_distance_scores, relative_isolation_scores
+)
+from segmentation_service.utils.tracing import span
+
+# Max elements of the padded (jobs, n, n) distance block built at once
+MAX_BLOCK_ELEMENTS = 4_000_000
+
+
+def _to_float(value: Any) -> float:
+    """
+    Returns a float, or NaN for missing / non-numeric values (which are then skipped).
+    """
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        print(f"⚠️ Skipping non-numeric value: {value!r}")
+        return math.nan
+
+
+def _flatten(jobs: List[List[Dict[str, Any]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Converts the object lists of all jobs into flat arrays plus the job index of each object.
+    """
+    sizes, complexities, positions, groups = [], [], [], []
+    for job_idx, objects in enumerate(jobs):
+        for obj in objects:
+            position = obj.get("position") or {}
+            sizes.append(_to_float(obj.get("size")))
+            complexities.append(_to_float(obj.get("complexity_score")))
+            positions.append((_to_float(position.get("x")), _to_float(position.get("y"))))
+            groups.append(job_idx)
+
+    return (
+        np.array(sizes, dtype=np.float64),
+        np.array(complexities, dtype=np.float64),
+        np.array(positions, dtype=np.float64).reshape(-1, 2),
+        np.array(groups, dtype=np.int64),
+    )
+
+
+def group_distance_scores(
+    positions: np.ndarray,
+    groups: np.ndarray,
+    num_groups: int,
+    kd_tree_threshold: int = KD_TREE_THRESHOLD,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Relative distance and isolation scores for all jobs.
+
+    Jobs are sorted by object count and packed into padded (jobs, n, n) distance blocks,
+    so many small drawings are scored with a handful of broadcast operations. Jobs with
+    at least `kd_tree_threshold` objects are scored on their own by distance.py
+    (chunked distance rows / KD-tree).
+
+    Args:
+        positions (np.ndarray): Object centers (N, 2), NaN where missing.
+        groups (np.ndarray): Job index per object, shape (N,).
+        num_groups (int): Number of jobs.
+        kd_tree_threshold (int): Object count from which a job is scored on its own.
+        max_block_elements (int): Memory bound for one padded block.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Relative distance scores and relative isolation
+        scores, shape (N,) each (NaN where the position is missing).
+    """
+    distance_scores = np.full(len(groups), np.nan)
+    isolation_scores = np.full(len(groups), np.nan)
+
+    valid_idx = np.flatnonzero(~np.isnan(positions).any(axis=1))
+    if len(valid_idx) == 0:
+        return distance_scores, isolation_scores
+
+    order = valid_idx[np.argsort(groups[valid_idx], kind="stable")]
+    counts = np.bincount(groups[order], minlength=num_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    small_groups = [g for g in np.argsort(counts, kind="stable") if 0 < counts[g] < kd_tree_threshold]
+    large_groups = [g for g in range(num_groups) if counts[g] >= kd_tree_threshold]
+
+    for g in large_groups:
+        members = order[starts[g]:starts[g] + counts[g]]
+        distance_scores[members] = relative_distance_scores(positions[members])
+        isolation_scores[members] = relative_isolation_scores(positions[members], kd_tree_threshold)
+
+    i = 0
+    while i < len(small_groups):
+        j = i + 1
+        # Groups are sorted by size, so the block width is the size of its last group
+        while j < len(small_groups) and (j - i + 1) * counts[small_groups[j]] ** 2 <= max_block_elements:
+            j += 1
+        block_groups = np.array(small_groups[i:j])
+        width = counts[block_groups[-1]]
+
+        members = np.concatenate([order[starts[g]:starts[g] + counts[g]] for g in block_groups])
+        row = np.repeat(np.arange(len(block_groups)), counts[block_groups])
+        col = np.arange(len(members)) - np.repeat(np.cumsum(counts[block_groups]) - counts[block_groups], counts[block_groups])
+
+        padded = np.zeros((len(block_groups), width, 2))
+        mask = np.zeros((len(block_groups), width), dtype=bool)
+        padded[row, col] = positions[members]
+        mask[row, col] = True
+
+        dist = np.sqrt(((padded[:, :, None, :] - padded[:, None, :, :]) ** 2).sum(axis=3))
+        pair_mask = mask[:, :, None] & mask[:, None, :] & ~np.eye(width, dtype=bool)[None]
+        n = counts[block_groups].astype(np.float64)
+
+        mean_dist = np.where(pair_mask, dist, 0.0).sum(axis=2) / np.maximum(n - 1, 1)[:, None]
+        nearest = np.where(pair_mask, dist, np.inf).min(axis=2)
+        nearest[~np.isfinite(nearest)] = 0.0
+
+        for values, target in ((mean_dist, distance_scores), (nearest, isolation_scores)):
+            averages = np.where(mask, values, 0.0).sum(axis=1) / n
+            scores = values / np.where(averages > 0, averages, 1.0)[:, None]
+            scores[(n < 2) | (averages <= 0)] = 1.0
+            target[members] = scores[row, col]
+
+        i = j
+
+    return distance_scores, isolation_scores
+
+
+def score_jobs(
+    jobs: List[List[Dict[str, Any]]],
+    kd_tree_threshold: int = KD_TREE_THRESHOLD,
+    max_block_elements: int = MAX_BLOCK_ELEMENTS
+) -> List[List[Dict[str, Any]]]:
+    """
+    Batch API: scores the object sets of many jobs in one call. Scores are always
+    relative within each job's own drawing.
+
+    Args:
+        jobs (List[List[Dict[str, Any]]]): Objects (object_features.json entries) per job.
+        kd_tree_threshold (int): Object count from which a job uses the KD-tree path.
+        max_block_elements (int): Memory bound for the padded distance blocks.
+
+    Returns:
+        List[List[Dict[str, Any]]]: Enriched copies of the objects, per job. Scores that
+        cannot be computed (missing attributes) are None.
+    """
+    sizes, complexities, positions, groups = _flatten(jobs)
+    if len(groups) == 0:
+        return [[] for _ in jobs]
+
+    with span("comparator_scoring"):
+        size_scores = relative_size_scores(sizes, groups, len(jobs))
+        complexity_scores = relative_complexity_scores(complexities, groups, len(jobs))
+        distance_scores, isolation_scores = group_distance_scores(
+            positions, groups, len(jobs), kd_tree_threshold, max_block_elements
+        )
+
+    def _score(value: float) -> Any:
+        return None if np.isnan(value) else round(float(value), 4)
+
+    enriched, flat_idx = [], 0
+    for objects in jobs:
+        job_objects = []
+        for obj in objects:
+            job_objects.append({
+                **obj,
+                "relative_size_score": _score(size_scores[flat_idx]),
+                "relative_distance_score": _score(distance_scores[flat_idx]),
+                "relative_isolation_score": _score(isolation_scores[flat_idx]),
+                "relative_complexity_score": _score(complexity_scores[flat_idx]),
+            })
+            flat_idx += 1
+        enriched.append(job_objects)
+    return enriched
+
+
+def score_objects(objects: List[Dict[str, Any]], kd_tree_threshold: int = KD_TREE_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Scores the objects of a single drawing (wrapper around `score_jobs`).
+    """
+    return score_jobs([objects], kd_tree_threshold)[0]
@@ -0,0 +1,297 @@
+"""
+Module: analytics_export.py
+Purpose: Incremental export of finished jobs' objects into a date-partitioned Parquet dataset for cohort analytics.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional — analytics export is disabled without it
+    pa = None
+    pq = None
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows — the exporter then runs unlocked
+    fcntl = None
+
+from segmentation_service.utils.job_store import JobStore
+
+ANALYTICS_DIRNAME = "analytics"
+STATE_FILENAME = "_export_state.json"
+EXPORT_LOCK_FILENAME = ".export.lock"
+FINAL_FILENAME = "final_objects.json"
+MANIFEST_FILENAME = "segmented_objects.json"
+
+SCORE_FIELDS = (
+    "relative_size_score", "relative_distance_score",
+    "relative_isolation_score", "relative_complexity_score",
+)
+BBOX_FIELDS = ("bbox_x_min", "bbox_y_min", "bbox_x_max", "bbox_y_max")
+
+
+def _schema() -> "pa.Schema":
+    # One row per object; the backend reads the same columns (backend/app/services/analytics.py)
+    return pa.schema(
+        [
+            ("job_id", pa.string()),
+            ("finished_at", pa.timestamp("ms", tz="UTC")),
+            ("object_id", pa.string()),
+            ("label", pa.string()),
+            ("classification_confidence", pa.float32()),
+            ("dominant_colors", pa.list_(pa.string())),
+            ("mapped_colors", pa.list_(pa.string())),
+            ("primary_color", pa.string()),
+            *[(field, pa.float64()) for field in SCORE_FIELDS],
+            ("emotion_tag", pa.string()),
+            ("matched_rule_id", pa.string()),
+            ("rule_set_version", pa.string()),
+            *[(field, pa.int32()) for field in BBOX_FIELDS],
+            ("size", pa.int64()),
+            ("source", pa.string()),
+        ]
+    )
+
+
+def partition_date(timestamp: float) -> str:
+    """
+    UTC date (YYYY-MM-DD) of the partition a job finished at `timestamp` belongs to.
+    """
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def object_rows(
+    job_id: str,
+    finished_at: float,
+    objects: List[Dict[str, Any]],
+    sources: Optional[Dict[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Flattens one job's final_objects.json into analytics rows.
+
+    Args:
+        job_id (str): Bare job id.
+        finished_at (float): When the job finished (epoch seconds).
+        objects (List[Dict[str, Any]]): Entries of final_objects.json.
+        sources (Optional[Dict[str, str]]): {object_id: model suffix} from segmented_objects.json,
+            for jobs whose final objects predate the "source" field.
+
+    Returns:
+        List[Dict[str, Any]]: One row per object, keyed by the schema's column names.
+    """
+    sources = sources or {}
+    finished_ms = int(finished_at * 1000)
+    rows = []
+    for obj in objects:
+        mapped = list(obj.get("mapped_emotional_colors") or [])
+        bbox = obj.get("bounding_box") or [None] * 4
+        row = {
+            "job_id": job_id,
+            "finished_at": finished_ms,
+            "object_id": obj.get("object_id"),
+            "label": obj.get("predicted_label"),
+            "classification_confidence": obj.get("classification_confidence"),
+            "dominant_colors": list(obj.get("dominant_colors") or []),
+            "mapped_colors": mapped,
+            "primary_color": mapped[0] if mapped else None,
+            "emotion_tag": obj.get("emotion_tag"),
+            "matched_rule_id": obj.get("matched_rule_id"),
+            "rule_set_version": obj.get("rule_set_version"),
+            "size": obj.get("size"),
+            "source": obj.get("source") or sources.get(obj.get("object_id")),
+        }
+        row.update({field: obj.get(field) for field in SCORE_FIELDS})
+        row.update(dict(zip(BBOX_FIELDS, bbox)))
+        rows.append(row)
+    return rows
+
+
+class AnalyticsExporter:
+    """
+    Appends the objects of every finished job to shared/analytics/, a Parquet dataset
+    partitioned by the day the job finished (date=YYYY-MM-DD/part-*.parquet).
+
+    Export is incremental: a watermark (the last exported finish_seq, the index's
+    commit-ordered finishing sequence) is kept in _export_state.json, and each pass reads
+    only the jobs the index reports as finished after it — one Parquet file per day
+    touched, whatever the number of jobs. Archived jobs are read from their zip.
+
+    Files are written under a hidden temporary name and renamed into place before the
+    watermark moves, so readers never see partial files. A crash between the two
+    re-exports the last pass, and a job finished again (rerun with new rules, /analyze
+    with new final objects) is exported again: readers keep only the rows of each job's
+    latest finished_at, once per object (backend/app/services/analytics.py).
+    """
+
+    def __init__(self, store: JobStore, output_dir: Optional[str] = None,
+                 interval_seconds: float = 300, batch_size: int = 5000):
+        self.store = store
+        self.output_dir = output_dir or os.path.join(store.base_shared_dir, ANALYTICS_DIRNAME)
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def available() -> bool:
+        return pa is not None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="analytics-export", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ------------------------------------------------------------------ #
+    # Watermark
+    # ------------------------------------------------------------------ #
+
+    def _state_path(self) -> str:
+        return os.path.join(self.output_dir, STATE_FILENAME)
+
+    def load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path(), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if "finish_seq" not in state:
+            # Watermark written before finish_seq: continue from the jobs finished up to it
+            finished_at = state.get("finished_at", 0.0)
+            state["finish_seq"] = self.store.finish_seq_at(finished_at) if finished_at else 0
+        return {"finish_seq": state["finish_seq"], "finished_at": state.get("finished_at", 0.0)}
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        tmp_path = os.path.join(self.output_dir, f".{STATE_FILENAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path())
+
+    # ------------------------------------------------------------------ #
+    # Export
+    # ------------------------------------------------------------------ #
+
+    def _read_json(self, job_id: str, filename: str) -> Any:
+        # From the job folder, or from its zip once the retention worker archived it
+        try:
+            with open(os.path.join(self.store.job_dir(job_id), filename), "rb") as f:
+                payload = f.read()
+        except OSError:
+            payload = self.store.read_archived(job_id, filename)
+        return json.loads(payload) if payload is not None else None
+
+    def _load_job(self, job_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, str]]:
+        try:
+            objects = self._read_json(job_id, FINAL_FILENAME)
+            sources = {}
+            # Final objects written before they carried "source": take it from the manifest
+            if objects and any("source" not in obj for obj in objects):
+                manifest = self._read_json(job_id, MANIFEST_FILENAME) or {}
+                sources = {obj.get("object_id"): obj.get("source") for obj in manifest.get("objects", [])}
+        except ValueError as e:
+            print(f"⚠️ Skipping job {job_id} in analytics export: {e}")
+            return None, {}
+        return objects, sources
+
+    def _write_partition(self, date: str, rows: List[Dict[str, Any]]) -> str:
+        partition_dir = os.path.join(self.output_dir, f"date={date}")
+        os.makedirs(partition_dir, exist_ok=True)
+        name = f"part-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(partition_dir, name)
+        tmp_path = os.path.join(partition_dir, f".{name}.tmp")
+
+        table = pa.Table.from_pylist(rows, schema=_schema())
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return path
+
+    def export_pending(self) -> int:
+        """
+        Exports up to `batch_size` jobs finished since the watermark.
+
+        Returns:
+            int: Number of jobs exported.
+        """
+        if pa is None:
+            return 0
+        state = self.load_state()
+        candidates = self.store.finished_after(state["finish_seq"], self.batch_size)
+        if not candidates:
+            return 0
+
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for row in candidates:
+            objects, sources = self._load_job(row["job_id"])
+            if objects:
+                partitions.setdefault(partition_date(row["finished_at"]), []).extend(
+                    object_rows(row["job_id"], row["finished_at"], objects, sources)
+                )
+
+        for date, rows in sorted(partitions.items()):
+            self._write_partition(date, rows)
+
+        last = candidates[-1]
+        self._save_state({
+            "finish_seq": last["finish_seq"], "finished_at": last["finished_at"], "exported_at": round(time.time(), 3)
+        })
+
+        num_rows = sum(len(rows) for rows in partitions.values())
+        print(f"📊 Exported {len(candidates)} job(s), {num_rows} object(s) to {self.output_dir}")
+        return len(candidates)
+
+    def run_once(self) -> int:
+        """
+        Exports everything finished since the watermark (skipped if another process
+        holds the export lock).
+
+        Returns:
+            int: Number of jobs exported.
+        """
+        if pa is None:
+            return 0
+        os.makedirs(self.output_dir, exist_ok=True)
+        exported = 0
+        with open(os.path.join(self.output_dir, EXPORT_LOCK_FILENAME), "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+            while not self._stop.is_set():
+                count = self.export_pending()
+                exported += count
+                if count < self.batch_size:
+                    break
+        return exported
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Analytics export error: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch analytics export (Parquet, partitioned by date)")
+    parser.add_argument("--shared", default="../shared", help="Path to the shared folder")
+    args = parser.parse_args()
+
+    if pa is None:
+        raise SystemExit("❌ Analytics export requires the pyarrow package")
+    exporter = AnalyticsExporter(JobStore(args.shared))
+    print(f"📊 Exported {exporter.run_once()} job(s); watermark: {exporter.load_state()['finish_seq']}")
@@ -0,0 +1,235 @@
+"""
+Module: emotion_mapper_main.py
+Purpose: Main emotion mapper loop — turns enriched_objects.json into final_objects.json.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import List, Dict, Any, Optional
+
+import yaml
+
+from emotion_mapper.engine.emotion_mapper import RuleSet, map_emotions_batch
+from segmentation_service.utils.progress_events import publish_event, STARTED, COMPLETED, FAILED
+from segmentation_service.utils.stage_claims import claim_job, release_job, record_stage_failure
+from segmentation_service.utils.tracing import configure as configure_tracing, job_trace
+from segmentation_service.utils.job_store import JobStore, resolve_job_dir, SEGMENTED, FINISHED
+from emotion_mapper.analytics_export import AnalyticsExporter
+from segmentation_service.utils.result_cache import store_job_artifacts
+
+ENRICHED_FILENAME = "enriched_objects.json"
+FINAL_FILENAME = "final_objects.json"
+CLAIM_FILENAME = ".emotion_mapper.claim"
+
+
+def load_config(config_path: str = "config.yaml") -> dict:
+    """
+    Loads the configuration YAML file.
+
+    Args:
+        config_path (str): Path to the configuration YAML file.
+
+    Returns:
+        dict: Loaded configuration dictionary.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def find_pending_jobs(job_store: JobStore) -> List[str]:
+    """
+    Lists jobs that have enriched_objects.json but no final_objects.json yet, oldest
+    first. Candidates come from the job index, so only jobs in flight are checked.
+    """
+    pending = []
+    for job_dir in job_store.job_dirs([SEGMENTED]):
+        if os.path.exists(os.path.join(job_dir, ENRICHED_FILENAME)) and \
+                not os.path.exists(os.path.join(job_dir, FINAL_FILENAME)):
+            pending.append(job_dir)
+    return pending
+
+
+def save_final_objects(job_dir: str, objects: List[Dict[str, Any]]) -> str:
+    """
+    Atomically writes final_objects.json into the job folder.
+    """
+    path = os.path.join(job_dir, FINAL_FILENAME)
+    tmp_path = os.path.join(job_dir, f".{FINAL_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(objects, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def process_jobs(
+    job_dirs: List[str],
+    rule_set: RuleSet,
+    errors: Optional[Dict[str, str]] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Tags the objects of several jobs and writes final_objects.json for each.
+    The whole batch uses the rule-set version that is active when it starts.
+
+    Args:
+        job_dirs (List[str]): Job folders with enriched_objects.json.
+        rule_set (RuleSet): Live (hot-reloadable) rule set.
+        errors (Optional[Dict[str, str]]): Filled with {job_dir: error} for the jobs that
+            could not be read or written (their failure is reported by the caller).
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: {job_dir: final objects} for the jobs that succeeded.
+    """
+    errors = {} if errors is None else errors
+    loaded = {}
+    for job_dir in job_dirs:
+        publish_event(job_dir, "emotion_mapper", STARTED)
+        try:
+            with open(os.path.join(job_dir, ENRICHED_FILENAME), "r", encoding="utf-8") as f:
+                loaded[job_dir] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Failed to read {ENRICHED_FILENAME} for {job_dir}: {e}")
+            errors[job_dir] = str(e)
+
+    index = rule_set.index
+    final = map_emotions_batch(list(loaded.values()), index)
+
+    results = {}
+    for job_dir, objects in zip(loaded, final):
+        try:
+            save_final_objects(job_dir, objects)
+        except OSError as e:
+            print(f"❌ Failed to write {FINAL_FILENAME} for {job_dir}: {e}")
+            errors[job_dir] = str(e)
+            continue
+        publish_event(job_dir, "emotion_mapper", COMPLETED, num_objects=len(objects), rule_set_version=index.version)
+        print(f"✅ Wrote {FINAL_FILENAME} with {len(objects)} objects to: {job_dir} (rules {index.version})")
+        results[job_dir] = objects
+    return results
+
+
+def cache_finished_job(job_dir: str) -> None:
+    """
+    Adds the finished job's outputs to its result-cache entry (if segmentation cached it),
+    so a re-upload of the same drawing skips every stage.
+    """
+    try:
+        if store_job_artifacts(job_dir):
+            print(f"⚡ Cached final artifacts of: {job_dir}")
+    except Exception as e:
+        print(f"⚠️ Could not add {job_dir} to the result cache: {e}")
+
+
+def build_rule_set(config: Dict[str, Any]) -> RuleSet:
+    """
+    Creates the live rule set described by the config.
+    """
+    return RuleSet(
+        rules_path=config.get("rules_path", "./rules/mapping_rules.json"),
+        poll_interval=config.get("rules_poll_interval_seconds", 1.0)
+    )
+
+
+def run_emotion_mapper(config_path: str = "config.yaml") -> None:
+    """
+    Main loop: waits for enriched jobs and tags up to `max_jobs_per_batch` of them at a time.
+    """
+    print("💡 Emotion Mapper Started...")
+
+    config = load_config(config_path)
+    configure_tracing(config)
+    base_shared_dir = config["base_shared_dir"]
+    job_store = JobStore(base_shared_dir)
+    check_interval = config.get("check_interval_seconds", 1)
+    max_jobs = max(1, config.get("max_jobs_per_batch", 16))
+    lease_seconds = config.get("job_lease_seconds", 300)
+    max_attempts = max(1, config.get("job_max_attempts", 3))
+    retry_delay = config.get("job_retry_delay_seconds", 5)
+
+    rule_set = build_rule_set(config)
+    rule_set.start()
+
+    if config.get("analytics_export", True):
+        exporter = AnalyticsExporter(
+            job_store,
+            interval_seconds=config.get("analytics_interval_seconds", 300),
+            batch_size=config.get("analytics_batch_size", 5000)
+        )
+        if exporter.available():
+            exporter.start()
+        else:
+            print("⚠️ pyarrow is not installed — analytics export is disabled")
+
+    while True:
+        claimed = []
+        try:
+            for job_dir in find_pending_jobs(job_store):
+                if len(claimed) >= max_jobs:
+                    break
+                if claim_job(job_dir, CLAIM_FILENAME, lease_seconds):
+                    claimed.append(job_dir)
+        except FileNotFoundError:
+            pass
+
+        if not claimed:
+            time.sleep(check_interval)
+            continue
+
+        results, errors, batch_error = {}, {}, ""
+        try:
+            with job_trace(claimed, "emotion_mapper", base_shared_dir):
+                results = process_jobs(claimed, rule_set, errors)
+        except Exception as e:
+            print(f"❌ Error during emotion mapping: {e}")
+            batch_error = str(e)
+
+        # Each job is finished on its own, so one failed index write doesn't fail the batch
+        finished = set()
+        for job_dir in results:
+            try:
+                job_store.set_state(job_dir, FINISHED)
+            except Exception as e:
+                # Without its final file the job is picked up again when it is retried
+                print(f"❌ Could not mark {job_dir} as finished: {e}")
+                errors[job_dir] = str(e)
+                try:
+                    os.remove(os.path.join(job_dir, FINAL_FILENAME))
+                except OSError:
+                    pass
+                continue
+            finished.add(job_dir)
+            cache_finished_job(job_dir)
+
+        # Failed jobs are retried after a backoff, then marked "failed" in the job index
+        for job_dir in claimed:
+            if job_dir not in finished:
+                record_stage_failure(
+                    job_store, job_dir, "emotion_mapper", errors.get(job_dir, batch_error), max_attempts, retry_delay
+                )
+            release_job(job_dir, CLAIM_FILENAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch emotion mapper")
+    parser.add_argument("--job_id", help="Process a single job (shared/job_<id>) and exit")
+    parser.add_argument("--config", default="config.yaml", help="Path to config.yaml")
+    args = parser.parse_args()
+
+    if args.job_id:
+        cfg = load_config(args.config)
+        configure_tracing(cfg)
+        job_dir = resolve_job_dir(cfg["base_shared_dir"], args.job_id)
+        errors = {}
+        with job_trace([job_dir], "emotion_mapper"):
+            if process_jobs([job_dir], build_rule_set(cfg), errors):
+                JobStore(cfg["base_shared_dir"]).set_state(job_dir, FINISHED)
+                cache_finished_job(job_dir)
+        if job_dir in errors:
+            publish_event(job_dir, "emotion_mapper", FAILED, error=errors[job_dir])
+    else:
+        run_emotion_mapper(args.config)
@@ -0,0 +1,146 @@
+"""
+Module: emotion_mapper.py
+Purpose: Assign an emotion tag and explanation to every enriched object using hot-reloadable compiled rules.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import threading
+from typing import List, Dict, Any, Optional, Union
+
+from emotion_mapper.engine.rule_matcher import RuleIndex, load_rule_index
+from segmentation_service.utils.tracing import span
+
+RELATIVE_FIELDS = ("relative_size_score", "relative_distance_score", "relative_complexity_score")
+NEUTRAL_TAG = "neutral"
+UNDEFINED_TAG = "undefined"
+
+
+class RuleSet:
+    """
+    Holds the active compiled rule index and swaps in new versions of the rules file
+    without blocking the processing path.
+
+    A daemon thread polls `load_rule_index`, which recompiles only when the file's
+    mtime/size changed; a new version replaces `self.index` with a single reference
+    assignment. Jobs take a snapshot of `index` when they start, so each job is tagged
+    with exactly one rule-set version. A broken edit (invalid JSON or rules) is logged
+    and the previous version stays active.
+    """
+
+    def __init__(self, rules_path: str, poll_interval: float = 1.0):
+        self.rules_path = rules_path
+        self.poll_interval = poll_interval
+        self._last_error: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        try:
+            self.index: RuleIndex = load_rule_index(rules_path)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"❌ Could not compile rules from {rules_path}: {e}") from e
+
+    def reload_if_changed(self) -> bool:
+        """
+        Swaps in the rules file's index if the file changed to a new version.
+
+        Returns:
+            bool: True if a new version became active.
+        """
+        try:
+            index = load_rule_index(self.rules_path)
+        except (OSError, ValueError) as e:
+            if str(e) != self._last_error:
+                print(f"❌ Failed to compile {self.rules_path}: {e} — keeping the active rule set")
+                self._last_error = str(e)
+            return False
+        self._last_error = None
+        if index is self.index or index.version == self.index.version:
+            return False
+
+        previous = self.index.version
+        self.index = index
+        print(f"🔄 Rule set hot-reloaded: {previous} → {index.version}")
+        return True
+
+    def start(self) -> None:
+        """
+        Starts watching the rules file in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"⚠️ Rules watcher error: {e}")
+
+
+def tag_object(obj: Dict[str, Any], rule: Optional[Dict[str, Any]], version: str = "") -> Dict[str, Any]:
+    """
+    Builds the final_objects.json entry for one object and its matched rule (if any).
+
+    Without a match the object is "neutral", or "undefined" when it has none of the
+    relative scores the rules are written against.
+    """
+    if rule is not None:
+        outcome = rule.get("then", {})
+        tag = outcome.get("emotion_tag", NEUTRAL_TAG)
+        explanation = outcome.get("explanation", "")
+        rule_id = rule.get("id")
+    elif all(obj.get(field) is None for field in RELATIVE_FIELDS):
+        tag, explanation, rule_id = UNDEFINED_TAG, "Missing relative scores", None
+    else:
+        tag, explanation, rule_id = NEUTRAL_TAG, "No rule matched", None
+
+    return {
+        **obj,
+        "emotion_tag": tag,
+        "rule_match_explanation": explanation,
+        "matched_rule_id": rule_id,
+        "rule_set_version": version,
+    }
+
+
+def map_emotions(objects: List[Dict[str, Any]], index: RuleIndex) -> List[Dict[str, Any]]:
+    """
+    Tags all objects of one job.
+
+    Args:
+        objects (List[Dict[str, Any]]): Entries of enriched_objects.json.
+        index (RuleIndex): Compiled rules.
+
+    Returns:
+        List[Dict[str, Any]]: Entries for final_objects.json, stamped with the rule-set version.
+    """
+    with span("rule_evaluation"):
+        rules = index.match_all(objects)
+    return [tag_object(obj, rule, index.version) for obj, rule in zip(objects, rules)]
+
+
+def map_emotions_batch(
+    jobs: List[List[Dict[str, Any]]],
+    rules: Union[RuleSet, RuleIndex]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Tags the objects of several jobs against one rule-set version.
+
+    Args:
+        jobs (List[List[Dict[str, Any]]]): enriched_objects.json entries per job.
+        rules (Union[RuleSet, RuleIndex]): Live rule set (its current version is used
+            for the whole batch) or a fixed compiled index.
+
+    Returns:
+        List[List[Dict[str, Any]]]: final_objects.json entries per job.
+    """
+    index = rules.index if isinstance(rules, RuleSet) else rules
+    return [map_emotions(objects, index) for objects in jobs]
@@ -0,0 +1,306 @@
+"""
+Module: rule_matcher.py
+Purpose: Compile mapping_rules.json into an indexed form and match objects against it.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import hashlib
+import threading
+from bisect import bisect_left
+from typing import List, Dict, Any, Optional, Tuple
+
+COMPARISON_OPS = ("lt", "lte", "gt", "gte", "eq")
+# Condition keys with a dedicated bucket (everything else is a threshold or a residual check)
+LABEL_KEY = "label"
+COLOR_KEY = "color"
+DOMINANT_COLOR_KEY = "dominant_color"
+
+# Compiled indexes, keyed by absolute rules path: (mtime_ns, size, RuleIndex or the
+# error the file raised)
+_index_cache: Dict[str, Tuple[int, int, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_rules(rules_path: str) -> List[Dict[str, Any]]:
+    """
+    Reads mapping_rules.json — either {"rules": [...]} or a bare list of rules.
+
+    Args:
+        rules_path (str): Path to mapping_rules.json.
+
+    Returns:
+        List[Dict[str, Any]]: Rules in file order.
+    """
+    return read_rule_set(rules_path)[0]
+
+
+def read_rule_set(rules_path: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Reads mapping_rules.json and derives its rule-set version.
+
+    The version is the first 12 hex digits of the file's sha256, prefixed with the
+    file's own "version" field when it declares one (e.g. "3+1a2b3c4d5e6f").
+
+    Args:
+        rules_path (str): Path to mapping_rules.json.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], str]: Rules in file order and the version string.
+
+    Raises:
+        ValueError: If the file is not valid JSON.
+    """
+    with open(rules_path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw.decode("utf-8"))
+
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    declared = data.get("version") if isinstance(data, dict) else None
+    version = f"{declared}+{digest}" if declared is not None else digest
+
+    rules = data.get("rules", []) if isinstance(data, dict) else list(data)
+    return rules, version
+
+
+def _as_list(value: Any) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def _is_threshold(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(op in COMPARISON_OPS for op in condition)
+
+
+def check_threshold(value: Any, condition: Dict[str, float]) -> bool:
+    """
+    Checks a numeric value against {"lt"/"lte"/"gt"/"gte"/"eq": bound} conditions.
+    Missing or non-numeric values never match.
+    """
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    checks = {
+        "lt": lambda bound: value < bound,
+        "lte": lambda bound: value <= bound,
+        "gt": lambda bound: value > bound,
+        "gte": lambda bound: value >= bound,
+        "eq": lambda bound: value == bound,
+    }
+    return all(checks[op](bound) for op, bound in condition.items())
+
+
+def match_rule(rule: Dict[str, Any], obj: Dict[str, Any]) -> bool:
+    """
+    Reference (uncompiled) check of one rule against one object.
+
+    Conditions: "label" (one label or a list), "color" (any mapped color in the list),
+    "dominant_color" (first mapped color in the list), threshold dicts on numeric
+    fields, and plain values compared for equality.
+    """
+    colors = obj.get("mapped_emotional_colors") or []
+    for key, condition in rule.get("if", {}).items():
+        if key == LABEL_KEY:
+            if obj.get("predicted_label") not in _as_list(condition):
+                return False
+        elif key == COLOR_KEY:
+            if not set(colors) & set(_as_list(condition)):
+                return False
+        elif key == DOMINANT_COLOR_KEY:
+            if not colors or colors[0] not in _as_list(condition):
+                return False
+        elif _is_threshold(condition):
+            if not check_threshold(obj.get(key), condition):
+                return False
+        elif obj.get(key) != condition:
+            return False
+    return True
+
+
+class IntervalTable:
+    """
+    Sorted interval table for one numeric field.
+
+    All rule bounds on the field are sorted into breakpoints, splitting the number line
+    into 2k+1 elementary segments (open gaps and the breakpoints themselves). Each
+    segment stores the bitmask of rules whose interval contains it, so a lookup is one
+    binary search.
+    """
+
+    def __init__(self, intervals: Dict[int, Dict[str, float]], all_rules_mask: int):
+        self.points: List[float] = sorted({bound for cond in intervals.values() for bound in cond.values()})
+        # Rules without a condition on this field always pass it
+        constrained = 0
+        for bit in intervals:
+            constrained |= 1 << bit
+        self.free_mask = all_rules_mask & ~constrained
+
+        # Representative value per segment: below/between/above points, and the points themselves
+        samples: List[float] = []
+        for idx, point in enumerate(self.points):
+            below = (self.points[idx - 1] + point) / 2.0 if idx else point - 1.0
+            samples.extend([below, point])
+        samples.append(self.points[-1] + 1.0 if self.points else 0.0)
+
+        self.segment_masks: List[int] = []
+        for sample in samples:
+            mask = self.free_mask
+            for bit, condition in intervals.items():
+                if check_threshold(sample, condition):
+                    mask |= 1 << bit
+            self.segment_masks.append(mask)
+
+    def lookup(self, value: Any) -> int:
+        """
+        Returns the bitmask of rules this value satisfies (only unconstrained rules if missing).
+        """
+        if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return self.free_mask
+        idx = bisect_left(self.points, value)
+        if idx < len(self.points) and self.points[idx] == value:
+            return self.segment_masks[2 * idx + 1]
+        return self.segment_masks[2 * idx]
+
+
+class RuleIndex:
+    """
+    Compiled rule set.
+
+    Rules are stored as bits ordered by (priority desc, file order), so the winning rule
+    of an object is the lowest set bit of its candidate mask. Candidate masks come from
+    label buckets, color buckets and one interval table per threshold field; only the
+    rare conditions that fit none of these are checked rule by rule, on candidates only.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], version: str = ""):
+        self.version = version
+        order = sorted(range(len(rules)), key=lambda i: (-rules[i].get("priority", 0), i))
+        self.rules: List[Dict[str, Any]] = [rules[i] for i in order]
+        self.all_mask = (1 << len(self.rules)) - 1
+
+        self.label_buckets: Dict[Any, int] = {}
+        self.label_any = 0
+        self.color_buckets: Dict[str, int] = {}
+        self.color_any = 0
+        self.dominant_buckets: Dict[str, int] = {}
+        self.dominant_any = 0
+        self.residual: Dict[int, List[Tuple[str, Any]]] = {}
+        self.residual_mask = 0
+
+        intervals: Dict[str, Dict[int, Dict[str, float]]] = {}
+        for bit, rule in enumerate(self.rules):
+            conditions = rule.get("if", {})
+            flag = 1 << bit
+
+            for key, buckets, attr in (
+                (LABEL_KEY, self.label_buckets, "label_any"),
+                (COLOR_KEY, self.color_buckets, "color_any"),
+                (DOMINANT_COLOR_KEY, self.dominant_buckets, "dominant_any"),
+            ):
+                if key in conditions:
+                    for value in _as_list(conditions[key]):
+                        buckets[value] = buckets.get(value, 0) | flag
+                else:
+                    setattr(self, attr, getattr(self, attr) | flag)
+
+            for key, condition in conditions.items():
+                if key in (LABEL_KEY, COLOR_KEY, DOMINANT_COLOR_KEY):
+                    continue
+                if _is_threshold(condition):
+                    intervals.setdefault(key, {})[bit] = condition
+                else:
+                    self.residual.setdefault(bit, []).append((key, condition))
+                    self.residual_mask |= flag
+
+        self.tables: Dict[str, IntervalTable] = {
+            field: IntervalTable(field_intervals, self.all_mask) for field, field_intervals in intervals.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def candidate_mask(self, obj: Dict[str, Any]) -> int:
+        """
+        Bitmask of the rules whose bucketed and threshold conditions all hold for the object.
+        """
+        mask = self.label_buckets.get(obj.get("predicted_label"), 0) | self.label_any
+        if not mask:
+            return 0
+
+        colors = obj.get("mapped_emotional_colors") or []
+        color_mask = self.color_any
+        for color in set(colors):
+            color_mask |= self.color_buckets.get(color, 0)
+        mask &= color_mask
+
+        dominant_mask = self.dominant_any
+        if colors:
+            dominant_mask |= self.dominant_buckets.get(colors[0], 0)
+        mask &= dominant_mask
+
+        for field, table in self.tables.items():
+            if not mask:
+                break
+            mask &= table.lookup(obj.get(field))
+        return mask
+
+    def match(self, obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the strongest matching rule (highest priority, then file order), or None.
+        """
+        mask = self.candidate_mask(obj)
+        while mask:
+            bit = (mask & -mask).bit_length() - 1
+            if not (self.residual_mask >> bit) & 1 or all(
+                obj.get(key) == condition for key, condition in self.residual[bit]
+            ):
+                return self.rules[bit]
+            mask &= mask - 1
+        return None
+
+    def match_all(self, objects: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Matches every object of a job (or of several jobs, concatenated).
+        """
+        return [self.match(obj) for obj in objects]
+
+
+def compile_rules(rules: List[Dict[str, Any]], version: str = "") -> RuleIndex:
+    """
+    Compiles a rule list into a `RuleIndex` tagged with its rule-set version.
+    """
+    return RuleIndex(rules, version)
+
+
+def load_rule_index(rules_path: str) -> RuleIndex:
+    """
+    Returns the compiled index for a rules file, recompiling only when the file's
+    mtime (or size) changed since the last call. Unchanged calls cost one stat, so
+    this can be polled; the same RuleIndex object is returned until the file changes.
+
+    Args:
+        rules_path (str): Path to mapping_rules.json.
+
+    Returns:
+        RuleIndex: Compiled rules.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file is not valid JSON or its rules do not compile (raised
+            again, without re-reading, until the file changes).
+    """
+    path = os.path.abspath(rules_path)
+    stat = os.stat(path)
+
+    with _cache_lock:
+        cached = _index_cache.get(path)
+        if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+            try:
+                result = compile_rules(*read_rule_set(path))
+                print(f"📜 Compiled {len(result)} emotion rules (version {result.version})")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                result = ValueError(f"invalid rules ({e})")
+            cached = _index_cache[path] = (stat.st_mtime_ns, stat.st_size, result)
+
+    if isinstance(cached[2], Exception):
+        raise cached[2]
+    return cached[2]
@@ -0,0 +1,257 @@
+"""
+Module: classifier.py
+Purpose: Batched Quick, Draw! CNN classification of object crops (Torch / TorchScript / ONNX Runtime).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+from typing import List, Tuple, Any
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+from segmentation_service.utils.tracing import span, count
+
+try:
+    import onnxruntime
+except ImportError:  # optional — only needed for the "onnx" backend
+    onnxruntime = None
+
+UNKNOWN_LABEL = "unknown"
+BACKENDS = ("torch", "torchscript", "onnx")
+
+
+class QuickDrawCNN(nn.Module):
+    """
+    Custom CNN for grayscale sketches: 3 conv + max-pool blocks and a dense classification head.
+    """
+
+    def __init__(self, num_classes: int = 20, input_size: int = 64):
+        super().__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(1, 32, kernel_size=3, padding=1), nn.ReLU(inplace=True), nn.MaxPool2d(2),
+            nn.Conv2d(32, 64, kernel_size=3, padding=1), nn.ReLU(inplace=True), nn.MaxPool2d(2),
+            nn.Conv2d(64, 128, kernel_size=3, padding=1), nn.ReLU(inplace=True), nn.MaxPool2d(2),
+        )
+        feature_size = 128 * (input_size // 8) ** 2
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(feature_size, 256), nn.ReLU(inplace=True), nn.Dropout(0.3),
+            nn.Linear(256, num_classes),
+        )
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.classifier(self.features(x))
+
+
+def load_class_labels(labels_path: str) -> List[str]:
+    """
+    Loads class_labels.json — either a list of names or an {"index": "name"} mapping.
+
+    Args:
+        labels_path (str): Path to class_labels.json.
+
+    Returns:
+        List[str]: Label names ordered by class index (empty if the file is missing or empty).
+    """
+    try:
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️ Could not read class labels from {labels_path}")
+        return []
+
+    if isinstance(labels, dict):
+        return [labels[k] for k in sorted(labels, key=int)]
+    return list(labels)
+
+
+def preprocess_batch(
+    crops: List[np.ndarray],
+    input_size: int = 64,
+    blank_std: float = 0.02
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts BGR crops to one normalized (N, 1, H, W) float32 batch.
+
+    Each crop is padded to a square with white paper (keeping its aspect ratio) and
+    resized with `INTER_AREA`; inversion, normalization and the blank check then run
+    once over the stacked batch. Strokes become bright on black, like Quick, Draw! data.
+
+    Args:
+        crops (List[np.ndarray]): BGR (or grayscale) object crops.
+        input_size (int): Side of the square CNN input.
+        blank_std (float): Crops whose normalized pixel std is below this are blank.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The batch and a boolean "is blank" array of shape (N,).
+    """
+    batch = np.full((len(crops), input_size, input_size), 255, dtype=np.uint8)
+    for idx, crop in enumerate(crops):
+        if crop is None or crop.size == 0:
+            continue
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        h, w = gray.shape
+        side = max(h, w)
+        square = np.full((side, side), 255, dtype=np.uint8)
+        y0, x0 = (side - h) // 2, (side - w) // 2
+        square[y0:y0 + h, x0:x0 + w] = gray
+        batch[idx] = cv2.resize(square, (input_size, input_size), interpolation=cv2.INTER_AREA)
+
+    tensor = 1.0 - batch.astype(np.float32) / 255.0
+    blank = tensor.reshape(len(crops), -1).std(axis=1) < blank_std
+    return tensor[:, None, :, :], blank
+
+
+class ObjectClassifier:
+    """
+    Classifies many crops per forward pass.
+
+    Crops of a job (or of several jobs) are preprocessed into one tensor and run in chunks
+    of `max_batch_size`. Backends: eager "torch" (state dict), "torchscript" and "onnx"
+    (ONNX Runtime, CPU). If the model cannot be loaded every crop is labelled "unknown".
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        labels_path: str,
+        input_size: int = 64,
+        backend: str = "torch",
+        max_batch_size: int = 64,
+        num_threads: int = 0
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"❌ Unknown classifier backend: {backend} (expected one of {BACKENDS})")
+
+        self.model_path = model_path
+        self.input_size = input_size
+        self.backend = backend
+        self.max_batch_size = max(1, max_batch_size)
+        self.labels = load_class_labels(labels_path)
+        self.model: Any = None
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        try:
+            self.model = self._load_model(num_threads)
+            print(f"✅ Loaded classifier ({backend}): {os.path.basename(model_path)}")
+        except Exception as e:
+            print(f"❌ Failed to load classifier {model_path}: {e} — objects will be labelled '{UNKNOWN_LABEL}'")
+
+    # ------------------------------------------------------------------ #
+    # Loading / export
+    # ------------------------------------------------------------------ #
+
+    def _load_model(self, num_threads: int) -> Any:
+        if self.backend == "onnx":
+            if onnxruntime is None:
+                raise ImportError("onnxruntime is not installed")
+            options = onnxruntime.SessionOptions()
+            if num_threads > 0:
+                options.intra_op_num_threads = num_threads
+            return onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+
+        if self.backend == "torchscript":
+            model = torch.jit.load(self.model_path, map_location="cpu")
+        else:
+            state_dict = torch.load(self.model_path, map_location="cpu")
+            num_classes = state_dict["classifier.4.weight"].shape[0]
+            model = QuickDrawCNN(num_classes=num_classes, input_size=self.input_size)
+            model.load_state_dict(state_dict)
+        model.eval()
+        return model
+
+    def export(self, output_path: str, fmt: str = "torchscript") -> str:
+        """
+        Exports the loaded eager model for faster CPU inference.
+
+        Args:
+            output_path (str): Destination file (.pt for TorchScript, .onnx for ONNX).
+            fmt (str): "torchscript" or "onnx" (dynamic batch dimension).
+
+        Returns:
+            str: The written path.
+        """
+        if not isinstance(self.model, nn.Module):
+            raise RuntimeError("❌ Export needs an eager torch model (backend='torch')")
+
+        example = torch.zeros(1, 1, self.input_size, self.input_size)
+        if fmt == "torchscript":
+            torch.jit.trace(self.model, example).save(output_path)
+        elif fmt == "onnx":
+            torch.onnx.export(
+                self.model, example, output_path,
+                input_names=["input"], output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}
+            )
+        else:
+            raise ValueError(f"❌ Unknown export format: {fmt}")
+
+        print(f"📦 Exported classifier to {output_path}")
+        return output_path
+
+    # ------------------------------------------------------------------ #
+    # Inference
+    # ------------------------------------------------------------------ #
+
+    def _label_name(self, class_idx: int) -> str:
+        if class_idx < len(self.labels):
+            return self.labels[class_idx]
+        return f"class_{class_idx}"
+
+    def _logits(self, batch: np.ndarray) -> np.ndarray:
+        if self.backend == "onnx":
+            input_name = self.model.get_inputs()[0].name
+            return self.model.run(None, {input_name: batch})[0]
+
+        with torch.inference_mode():
+            return self.model(torch.from_numpy(batch)).numpy()
+
+    def classify_batch(self, crops: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """
+        Classifies all crops with as few forward passes as possible.
+
+        Args:
+            crops (List[np.ndarray]): BGR object crops (from one or several jobs).
+
+        Returns:
+            List[Tuple[str, float]]: (predicted_label, confidence) per crop; blank crops and
+            inference errors give ("unknown", 0.0).
+        """
+        results: List[Tuple[str, float]] = [(UNKNOWN_LABEL, 0.0)] * len(crops)
+        if not crops or self.model is None:
+            return results
+
+        with span("classifier_preprocess"):
+            batch, blank = preprocess_batch(crops, self.input_size)
+        todo = np.flatnonzero(~blank)
+        count("soulsketch_objects_classified_total", len(crops), backend=self.backend)
+
+        for start in range(0, len(todo), self.max_batch_size):
+            chunk = todo[start:start + self.max_batch_size]
+            try:
+                with span("classifier_batch", backend=self.backend):
+                    logits = self._logits(np.ascontiguousarray(batch[chunk]))
+            except Exception as e:
+                print(f"❌ Classifier inference failed for {len(chunk)} crops: {e}")
+                continue
+
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            best = probs.argmax(axis=1)
+            for crop_idx, class_idx, prob in zip(chunk, best, probs[np.arange(len(best)), best]):
+                results[crop_idx] = (self._label_name(int(class_idx)), float(prob))
+
+        return results
+
+    def classify(self, crop: np.ndarray) -> Tuple[str, float]:
+        """
+        Classifies a single crop (convenience wrapper around `classify_batch`).
+        """
+        return self.classify_batch([crop])[0]
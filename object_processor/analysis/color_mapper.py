@@ -0,0 +1,221 @@
+"""
+Module: color_mapper.py
+Purpose: Map colors to the 9 psychological color categories through a precomputed lookup table.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+from typing import List, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Color group -> representative RGB
+COLOR_GROUPS: Dict[str, tuple] = {
+    "yellow": (255, 255, 0),
+    "red": (255, 0, 0),
+    "blue": (0, 0, 255),
+    "green": (0, 128, 0),
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "pink": (255, 192, 203),
+    "purple": (128, 0, 128),
+    "brown": (165, 42, 42),
+}
+
+LUT_METRICS = ("rgb", "lab")
+# Generated tables live in a cache folder, never next to the tracked model files
+DEFAULT_LUT_DIR = os.environ.get("SOULSKETCH_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "soulsketch")
+
+_GROUP_NAMES = list(COLOR_GROUPS)
+_GROUP_RGB = np.array(list(COLOR_GROUPS.values()), dtype=np.float32)
+
+# Loaded tables, keyed by (bins, metric)
+_luts: Dict[Tuple[int, str], np.ndarray] = {}
+
+
+def hex_to_rgb(hex_color: str) -> tuple:
+    """
+    Converts "#RRGGBB" to an (R, G, B) tuple.
+    """
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _to_space(rgb: np.ndarray, metric: str) -> np.ndarray:
+    """
+    Converts an (N, 3) RGB array to the distance space of the metric.
+    """
+    rgb = np.asarray(rgb, dtype=np.float32).reshape(-1, 3)
+    if metric == "lab":
+        return cv2.cvtColor((rgb / 255.0).reshape(-1, 1, 3), cv2.COLOR_RGB2Lab).reshape(-1, 3)
+    return rgb
+
+
+def nearest_group_knn(rgb: np.ndarray, metric: str = "rgb") -> np.ndarray:
+    """
+    Exact k=1 nearest-neighbour search against the group colors (reference implementation).
+
+    Args:
+        rgb (np.ndarray): Colors of shape (N, 3), RGB order.
+        metric (str): "rgb" (Euclidean RGB) or "lab" (Euclidean CIELAB, perceptual).
+
+    Returns:
+        np.ndarray: Group index per color, shape (N,).
+    """
+    points, groups = _to_space(rgb, metric), _to_space(_GROUP_RGB, metric)
+    distances = ((points[:, None, :] - groups[None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1).astype(np.uint8)
+
+
+def _check_lut_settings(bins: int, metric: str) -> None:
+    """
+    Raises:
+        ValueError: If `bins` is not a power of two between 1 and 256 (lookups quantize
+            by bit shifts) or the metric is unknown.
+    """
+    if not isinstance(bins, int) or not 1 <= bins <= 256 or bins & (bins - 1):
+        raise ValueError(f"❌ color_lut_bins must be a power of two between 1 and 256, got {bins}")
+    if metric not in LUT_METRICS:
+        raise ValueError(f"❌ Unknown color metric: {metric} (expected one of {LUT_METRICS})")
+
+
+def build_color_lut(bins: int = 64, metric: str = "rgb") -> np.ndarray:
+    """
+    Precomputes the group of every cell of a bins³ quantized RGB cube.
+
+    Each cell holds the KNN answer for its center, so lookups are identical to
+    `nearest_group_knn` on those grid points.
+
+    Args:
+        bins (int): Cells per channel (power of two, e.g. 32 or 64).
+        metric (str): "rgb" or "lab".
+
+    Returns:
+        np.ndarray: uint8 array of shape (bins, bins, bins) with group indices.
+
+    Raises:
+        ValueError: If `bins` is not a power of two or the metric is unknown.
+    """
+    _check_lut_settings(bins, metric)
+
+    step = 256 // bins
+    axis = np.arange(bins, dtype=np.float32) * step + (step - 1) / 2.0
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+    return nearest_group_knn(grid, metric).reshape(bins, bins, bins)
+
+
+def load_color_lut(bins: int = 64, metric: str = "rgb", lut_dir: Optional[str] = None) -> np.ndarray:
+    """
+    Returns the lookup table, memory-mapped from `color_lut_<metric>_<bins>.npy`.
+    The file is built (and saved atomically) on first use; later calls reuse the mapping.
+
+    Args:
+        bins (int): Cells per channel (power of two).
+        metric (str): "rgb" or "lab".
+        lut_dir (Optional[str]): Folder of the .npy file (default: $SOULSKETCH_CACHE_DIR,
+            else ~/.cache/soulsketch).
+
+    Returns:
+        np.ndarray: Read-only (bins, bins, bins) uint8 table.
+
+    Raises:
+        ValueError: If `bins` is not a power of two or the metric is unknown.
+    """
+    _check_lut_settings(bins, metric)
+    cached = _luts.get((bins, metric))
+    if cached is not None:
+        return cached
+
+    lut_dir = lut_dir or DEFAULT_LUT_DIR
+    path = os.path.join(lut_dir, f"color_lut_{metric}_{bins}.npy")
+
+    lut = None
+    if os.path.exists(path):
+        try:
+            lut = np.load(path, mmap_mode="r")
+            if lut.shape != (bins, bins, bins):
+                lut = None
+        except (OSError, ValueError):
+            lut = None
+
+    if lut is None:
+        lut = build_color_lut(bins, metric)
+        try:
+            os.makedirs(lut_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, lut)
+            os.replace(tmp_path, path)
+            lut = np.load(path, mmap_mode="r")
+            print(f"🗺️ Built color lookup table: {path}")
+        except OSError as e:
+            print(f"⚠️ Could not save color lookup table ({e}) — using it in memory")
+
+    _luts[(bins, metric)] = lut
+    return lut
+
+
+def lookup_groups(rgb: np.ndarray, lut: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Maps whole arrays of colors (e.g. every pixel of a crop) to group indices
+    with a single indexing operation.
+
+    Args:
+        rgb (np.ndarray): uint8 array of shape (..., 3), RGB order.
+        lut (Optional[np.ndarray]): Table from `load_color_lut` (default: 64³ RGB).
+
+    Returns:
+        np.ndarray: uint8 group indices of shape rgb.shape[:-1].
+    """
+    lut = load_color_lut() if lut is None else lut
+    shift = 8 - int(np.log2(lut.shape[0]))
+    q = np.asarray(rgb, dtype=np.uint8) >> shift
+    return lut[q[..., 0], q[..., 1], q[..., 2]]
+
+
+def map_colors(hex_colors: List[str], lut: Optional[np.ndarray] = None) -> List[str]:
+    """
+    Assigns each HEX color to its color group.
+
+    Args:
+        hex_colors (List[str]): Colors such as the output of `extract_dominant_colors`.
+        lut (Optional[np.ndarray]): Table from `load_color_lut` (default: 64³ RGB).
+
+    Returns:
+        List[str]: Color group names, one per input color.
+    """
+    if not hex_colors:
+        return []
+
+    rgb = np.array([hex_to_rgb(c) for c in hex_colors], dtype=np.uint8)
+    return [_GROUP_NAMES[i] for i in lookup_groups(rgb, lut)]
+
+
+def color_distribution_batch(
+    pixels: np.ndarray,
+    owner: np.ndarray,
+    num_crops: int,
+    lut: Optional[np.ndarray] = None
+) -> List[Dict[str, float]]:
+    """
+    Share of each color group among the foreground pixels of every crop.
+
+    Args:
+        pixels (np.ndarray): RGB pixels (M, 3) of all crops (see `stack_foreground`).
+        owner (np.ndarray): Crop index of each pixel (M,).
+        num_crops (int): Number of crops.
+        lut (Optional[np.ndarray]): Table from `load_color_lut`.
+
+    Returns:
+        List[Dict[str, float]]: {group: fraction} per crop (non-zero groups only).
+    """
+    num_groups = len(_GROUP_NAMES)
+    key = owner * num_groups + lookup_groups(pixels, lut)
+    counts = np.bincount(key, minlength=num_crops * num_groups).reshape(num_crops, num_groups)
+    totals = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    shares = counts / totals
+
+    return [
+        {_GROUP_NAMES[g]: round(float(shares[crop_idx, g]), 4) for g in np.flatnonzero(counts[crop_idx])}
+        for crop_idx in range(num_crops)
+    ]
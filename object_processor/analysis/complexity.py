@@ -0,0 +1,68 @@
+"""
+Module: complexity.py
+Purpose: Visual complexity of object crops — edge density of the drawn strokes.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import List
+
+import cv2
+import numpy as np
+
+EDGE_KERNEL = np.ones((3, 3), dtype=np.uint8)
+
+
+def foreground_mask(crop: np.ndarray, white_threshold: int = 240) -> np.ndarray:
+    """
+    Returns a uint8 mask (255 = drawn) of a BGR(A) or grayscale crop; white paper,
+    mask background and transparent pixels are background.
+
+    Args:
+        crop (np.ndarray): BGR, BGRA or grayscale crop.
+        white_threshold (int): Pixels with all channels at or above this value are background.
+
+    Returns:
+        np.ndarray: Mask of shape (H, W).
+    """
+    if crop.ndim == 2:
+        drawn = crop < white_threshold
+    else:
+        drawn = np.any(crop[..., :3] < white_threshold, axis=-1)
+        if crop.shape[-1] == 4:
+            drawn &= crop[..., 3] > 0
+    return drawn.astype(np.uint8) * 255
+
+
+def complexity_score(crop: np.ndarray, white_threshold: int = 240) -> float:
+    """
+    Share of the crop's pixels that lie on a stroke edge (morphological gradient of the
+    foreground mask). A plain outline in a large box scores low; dense scribbles, many
+    small parts and filled details score high. Only its ratio to the other objects of the
+    drawing is used (see comparator_engine/comparators/complexity.py).
+
+    Args:
+        crop (np.ndarray): BGR, BGRA or grayscale crop.
+        white_threshold (int): Background threshold.
+
+    Returns:
+        float: Edge density in [0, 1] (0.0 for an empty crop).
+    """
+    mask = foreground_mask(crop, white_threshold)
+    if mask.size == 0:
+        return 0.0
+    edges = cv2.morphologyEx(mask, cv2.MORPH_GRADIENT, EDGE_KERNEL)
+    return round(float(np.count_nonzero(edges)) / mask.size, 4)
+
+
+def complexity_scores_batch(crops: List[np.ndarray], white_threshold: int = 240) -> List[float]:
+    """
+    Computes `complexity_score` for every crop.
+
+    Args:
+        crops (List[np.ndarray]): BGR, BGRA or grayscale crops.
+        white_threshold (int): Background threshold.
+
+    Returns:
+        List[float]: One score per crop, in input order.
+    """
+    return [complexity_score(crop, white_threshold) for crop in crops]
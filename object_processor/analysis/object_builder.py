@@ -0,0 +1,76 @@
+"""
+Module: object_builder.py
+Purpose: Build the per-object feature entries written to object_features.json.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+from typing import List, Dict, Any, Optional
+
+FEATURES_FILENAME = "object_features.json"
+
+
+def build_object_features(
+    obj: Dict[str, Any],
+    predicted_label: str,
+    confidence: float,
+    dominant_colors: List[str],
+    mapped_colors: List[str],
+    color_distribution: Optional[Dict[str, float]] = None,
+    complexity_score: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Combines a segmented object's geometry with its classification and color analysis.
+
+    Args:
+        obj (Dict[str, Any]): Object entry from segmented_objects.json.
+        predicted_label (str): CNN label (or "unknown").
+        confidence (float): CNN softmax confidence.
+        dominant_colors (List[str]): HEX colors in dominance order.
+        mapped_colors (List[str]): Emotional color group per dominant color.
+        color_distribution (Optional[Dict[str, float]]): Share of each color group among
+            the object's pixels (omitted when None).
+        complexity_score (Optional[float]): Edge density of the crop (see
+            analysis/complexity.py; omitted when None).
+
+    Returns:
+        Dict[str, Any]: Feature entry for object_features.json.
+    """
+    center = obj.get("center") or [0, 0]
+    features = {
+        "object_id": obj["object_id"],
+        "predicted_label": predicted_label,
+        "classification_confidence": round(confidence, 4),
+        "dominant_colors": dominant_colors,
+        "mapped_emotional_colors": mapped_colors,
+        "size": obj.get("pixel_area", obj.get("area", 0)),
+        "position": {"x": center[0], "y": center[1]},
+        "bounding_box": obj.get("bounding_box"),
+        "source": obj.get("source"),
+        "cropped_image_path": obj.get("cropped_image_path"),
+    }
+    if color_distribution is not None:
+        features["color_distribution"] = color_distribution
+    if complexity_score is not None:
+        features["complexity_score"] = complexity_score
+    return features
+
+
+def save_object_features(job_dir: str, features: List[Dict[str, Any]]) -> str:
+    """
+    Atomically writes object_features.json into the job folder.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        features (List[Dict[str, Any]]): Entries from `build_object_features`.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path = os.path.join(job_dir, FEATURES_FILENAME)
+    tmp_path = os.path.join(job_dir, f".{FEATURES_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(features, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,127 @@
+"""
+Module: benchmark_colors.py
+Purpose: Compare the color extraction backends against full KMeans on the images/ corpus.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import List, Dict, Any
+
+import cv2
+import numpy as np
+
+from object_processor.analysis.color_extractor import extract_dominant_colors_batch, COLOR_METHODS
+from object_processor.analysis.color_mapper import map_colors, hex_to_rgb
+
+
+def load_corpus(images_dir: str, grid: int = 2) -> List[List[np.ndarray]]:
+    """
+    Loads every drawing and cuts it into grid x grid tiles that stand in for object crops.
+
+    Returns:
+        List[List[np.ndarray]]: One list of crops ("job") per image.
+    """
+    jobs = []
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        image = cv2.imread(os.path.join(images_dir, name))
+        if image is None:
+            continue
+        h, w = image.shape[:2]
+        jobs.append([
+            image[r * h // grid:(r + 1) * h // grid, c * w // grid:(c + 1) * w // grid]
+            for r in range(grid) for c in range(grid)
+        ])
+    return jobs
+
+
+def color_agreement(reference: List[List[str]], candidate: List[List[str]]) -> Dict[str, float]:
+    """
+    Measures how close a backend's colors are to the reference colors.
+
+    Returns:
+        Dict[str, float]: Mean RGB distance from each reference color to the nearest
+        candidate color, share of crops with the same dominant color group, and mean
+        Jaccard overlap of the mapped color groups.
+    """
+    distances, same_dominant, jaccard = [], [], []
+    for ref, cand in zip(reference, candidate):
+        if not ref or not cand:
+            same_dominant.append(float(ref == cand))
+            continue
+        ref_rgb = np.array([hex_to_rgb(c) for c in ref], dtype=np.float64)
+        cand_rgb = np.array([hex_to_rgb(c) for c in cand], dtype=np.float64)
+        distances.extend(np.sqrt(((ref_rgb[:, None] - cand_rgb[None]) ** 2).sum(axis=2)).min(axis=1))
+
+        ref_groups, cand_groups = map_colors(ref), map_colors(cand)
+        same_dominant.append(float(ref_groups[0] == cand_groups[0]))
+        jaccard.append(len(set(ref_groups) & set(cand_groups)) / len(set(ref_groups) | set(cand_groups)))
+
+    return {
+        "mean_rgb_distance": round(float(np.mean(distances)) if distances else 0.0, 2),
+        "dominant_group_agreement": round(float(np.mean(same_dominant)) if same_dominant else 1.0, 4),
+        "group_jaccard": round(float(np.mean(jaccard)) if jaccard else 1.0, 4),
+    }
+
+
+def run_benchmark(
+    images_dir: str,
+    methods: List[str],
+    k: int = 3,
+    grid: int = 2,
+    max_pixels: int = 4096
+) -> Dict[str, Any]:
+    """
+    Times each backend per job (all crops of an image in one call) and scores its
+    agreement with the "kmeans" reference.
+    """
+    jobs = load_corpus(images_dir, grid)
+    num_crops = sum(len(job) for job in jobs)
+    print(f"🖼️ Loaded {len(jobs)} images ({num_crops} crops)")
+
+    outputs: Dict[str, List[List[str]]] = {}
+    report: Dict[str, Any] = {"images": len(jobs), "crops": num_crops, "k": k, "methods": {}}
+
+    for method in ["kmeans"] + [m for m in methods if m != "kmeans"]:
+        colors, timings = [], []
+        for job in jobs:
+            start = time.perf_counter()
+            colors.extend(extract_dominant_colors_batch(job, k=k, method=method, max_pixels=max_pixels))
+            timings.append(time.perf_counter() - start)
+        outputs[method] = colors
+
+        timings_ms = np.array(timings) * 1000
+        report["methods"][method] = {
+            "total_ms": round(float(timings_ms.sum()), 1),
+            "ms_per_crop": round(float(timings_ms.sum()) / max(num_crops, 1), 3),
+            "p50_job_ms": round(float(np.percentile(timings_ms, 50)), 2),
+            "p95_job_ms": round(float(np.percentile(timings_ms, 95)), 2),
+            **color_agreement(outputs["kmeans"], colors),
+        }
+        print(f"⏱️ {method:<10} {report['methods'][method]}")
+
+    reference_ms = report["methods"]["kmeans"]["total_ms"]
+    for stats in report["methods"].values():
+        stats["speedup_vs_kmeans"] = round(reference_ms / max(stats["total_ms"], 1e-6), 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark color extraction backends")
+    parser.add_argument("--images", default="../images", help="Folder with test drawings")
+    parser.add_argument("--methods", nargs="+", default=list(COLOR_METHODS), choices=COLOR_METHODS)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--grid", type=int, default=2, help="Split each image into grid x grid crops")
+    parser.add_argument("--max_pixels", type=int, default=4096)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.images, args.methods, k=args.k, grid=args.grid, max_pixels=args.max_pixels)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Report saved to {args.json}")
@@ -0,0 +1,323 @@
+"""
+Module: object_processor.py
+Purpose: Main object processor loop — batched CNN classification and color analysis of segmented objects.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import time
+import argparse
+from typing import List, Tuple, Dict, Any, Optional
+
+import cv2
+import yaml
+import numpy as np
+
+from object_processor.analysis.classifier import ObjectClassifier
+from object_processor.analysis.color_extractor import extract_dominant_colors_batch, stack_foreground
+from object_processor.analysis.color_mapper import map_colors, load_color_lut, color_distribution_batch
+from object_processor.analysis.complexity import complexity_scores_batch
+from object_processor.analysis.object_builder import build_object_features, save_object_features, FEATURES_FILENAME
+from segmentation_service.utils.crop_saver import MANIFEST_FILENAME, load_manifest_crops
+from segmentation_service.utils.shared_image import release_decoded_image
+from segmentation_service.utils.progress_events import publish_event, STARTED, COMPLETED, FAILED
+from segmentation_service.utils.stage_claims import claim_job, release_job, record_stage_failure
+from segmentation_service.utils.tracing import configure as configure_tracing, job_trace, span
+from segmentation_service.utils.job_store import JobStore, resolve_job_dir, SEGMENTED
+
+SEGMENTATION_DONE_FILENAME = ".done"
+CLAIM_FILENAME = ".object_processor.claim"
+
+
+def load_config(config_path: str = "config.yaml") -> dict:
+    """
+    Loads the configuration YAML file.
+
+    Args:
+        config_path (str): Path to the configuration YAML file.
+
+    Returns:
+        dict: Loaded configuration dictionary.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def load_job_crops(job_dir: str, output_subdir: str = "objects") -> List[Tuple[Dict[str, Any], np.ndarray]]:
+    """
+    Returns (object entry, BGR crop) pairs for a segmented job.
+
+    Uses segmented_objects.json when present; older jobs that only have one PNG per
+    object are read from the crops folder.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        output_subdir (str): Crops folder name.
+
+    Returns:
+        List[Tuple[Dict[str, Any], np.ndarray]]: Objects in manifest order.
+    """
+    if os.path.exists(os.path.join(job_dir, MANIFEST_FILENAME)):
+        return load_manifest_crops(job_dir)
+
+    crops = []
+    crops_dir = os.path.join(job_dir, output_subdir)
+    for name in sorted(os.listdir(crops_dir)) if os.path.isdir(crops_dir) else []:
+        if not name.lower().endswith(".png"):
+            continue
+        crop = cv2.imread(os.path.join(crops_dir, name))
+        if crop is None:
+            print(f"⚠️ Failed to read crop: {name}")
+            continue
+        h, w = crop.shape[:2]
+        obj = {
+            "object_id": "_".join(name.split("_")[:2]),
+            "area": h * w,
+            "cropped_image_path": os.path.join(output_subdir, name),
+        }
+        crops.append((obj, crop))
+    return crops
+
+
+def find_pending_jobs(job_store: JobStore) -> List[str]:
+    """
+    Lists segmented jobs that have no object_features.json yet, oldest first. Candidates
+    come from the job index, so only jobs in flight are checked.
+    """
+    pending = []
+    for job_dir in job_store.job_dirs([SEGMENTED]):
+        if not os.path.exists(os.path.join(job_dir, SEGMENTATION_DONE_FILENAME)):
+            continue
+        if os.path.exists(os.path.join(job_dir, FEATURES_FILENAME)):
+            continue
+        pending.append(job_dir)
+    return pending
+
+
+def analyze_objects(
+    jobs: List[List[Tuple[Dict[str, Any], np.ndarray]]],
+    classifier: ObjectClassifier,
+    config: Dict[str, Any],
+    color_lut: Optional[np.ndarray] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Classifies and color-analyzes the objects of several jobs, without touching disk:
+    every crop of every job goes through one batched classification call and one
+    vectorized color pass.
+
+    Args:
+        jobs (List[List[Tuple[Dict[str, Any], np.ndarray]]]): (object entry, BGR crop) pairs per job.
+        classifier (ObjectClassifier): Loaded classifier.
+        config (Dict[str, Any]): Processor configuration.
+        color_lut (Optional[np.ndarray]): Color lookup table (loaded from the config when None).
+
+    Returns:
+        List[List[Dict[str, Any]]]: object_features.json entries per job.
+    """
+    min_area = config.get("min_object_area", 0)
+    num_colors = config.get("num_dominant_colors", 3)
+    color_method = config.get("color_method", "histogram")
+    white_threshold = config.get("white_threshold", 240)
+    if color_lut is None:
+        color_lut = load_color_lut(
+            bins=config.get("color_lut_bins", 64), metric=config.get("color_lut_metric", "rgb"),
+            lut_dir=config.get("color_lut_dir")
+        )
+
+    kept_jobs = []
+    for objects in jobs:
+        kept = []
+        for obj, crop in objects:
+            if crop.shape[0] * crop.shape[1] < min_area:
+                print(f"⚠️ Skipping very small object {obj['object_id']}")
+                continue
+            kept.append((obj, crop))
+        kept_jobs.append(kept)
+
+    all_crops = [crop for objects in kept_jobs for _, crop in objects]
+    start = time.perf_counter()
+    predictions = classifier.classify_batch(all_crops)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if all_crops:
+        print(f"🧠 Classified {len(all_crops)} objects from {len(kept_jobs)} job(s) "
+              f"in {elapsed_ms:.1f} ms ({elapsed_ms / len(all_crops):.2f} ms/object)")
+
+    start = time.perf_counter()
+    with span("color_extraction", method=color_method):
+        colors = extract_dominant_colors_batch(
+            all_crops, k=num_colors, method=color_method,
+            white_threshold=white_threshold,
+            max_pixels=config.get("color_max_pixels", 4096)
+        )
+    if all_crops:
+        print(f"🎨 Extracted colors ({color_method}) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    distributions = [None] * len(all_crops)
+    if config.get("color_distribution", True) and all_crops:
+        with span("color_distribution"):
+            pixels, owner = stack_foreground(all_crops, white_threshold)
+            distributions = color_distribution_batch(pixels, owner, len(all_crops), color_lut)
+
+    with span("complexity"):
+        complexities = complexity_scores_batch(all_crops, white_threshold)
+
+    results = []
+    offset = 0
+    for objects in kept_jobs:
+        job_predictions = predictions[offset:offset + len(objects)]
+        job_colors = colors[offset:offset + len(objects)]
+        job_distributions = distributions[offset:offset + len(objects)]
+        job_complexities = complexities[offset:offset + len(objects)]
+        offset += len(objects)
+
+        features = []
+        for (obj, _), (label, confidence), dominant_colors, distribution, complexity in zip(
+            objects, job_predictions, job_colors, job_distributions, job_complexities
+        ):
+            features.append(build_object_features(
+                obj, label, confidence, dominant_colors, map_colors(dominant_colors, color_lut),
+                color_distribution=distribution, complexity_score=complexity
+            ))
+        results.append(features)
+
+    return results
+
+
+def process_jobs(
+    job_dirs: List[str],
+    classifier: ObjectClassifier,
+    config: Dict[str, Any],
+    errors: Optional[Dict[str, str]] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Processes several jobs at once (see `analyze_objects`) and writes
+    object_features.json per job.
+
+    Args:
+        job_dirs (List[str]): Job folders to process.
+        classifier (ObjectClassifier): Loaded classifier.
+        config (Dict[str, Any]): Processor configuration.
+        errors (Optional[Dict[str, str]]): Filled with {job_dir: error} for the jobs that
+            could not be read (their failure is reported by the caller).
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: {job_dir: feature entries} for the jobs that succeeded.
+    """
+    errors = {} if errors is None else errors
+    output_subdir = config.get("output_subdir", "objects")
+
+    job_objects: Dict[str, List[Tuple[Dict[str, Any], np.ndarray]]] = {}
+    for job_dir in job_dirs:
+        publish_event(job_dir, "object_processor", STARTED)
+        try:
+            job_objects[job_dir] = load_job_crops(job_dir, output_subdir)
+        except Exception as e:
+            print(f"❌ Failed to load objects for {job_dir}: {e}")
+            errors[job_dir] = str(e)
+
+    analyzed = analyze_objects(list(job_objects.values()), classifier, config)
+
+    results = {}
+    for job_dir, features in zip(job_objects, analyzed):
+        save_object_features(job_dir, features)
+        publish_event(job_dir, "object_processor", COMPLETED, num_objects=len(features))
+        print(f"✅ Wrote {FEATURES_FILENAME} with {len(features)} objects to: {job_dir}")
+        results[job_dir] = features
+
+    return results
+
+
+def build_classifier(config: Dict[str, Any]) -> ObjectClassifier:
+    """
+    Creates the classifier described by the config.
+    """
+    return ObjectClassifier(
+        model_path=config.get("model_path", "./model/quickdraw_cnn.pt"),
+        labels_path=config.get("labels_path", "./model/class_labels.json"),
+        input_size=config.get("input_size", 64),
+        backend=config.get("classifier_backend", "torch"),
+        max_batch_size=config.get("classifier_batch_size", 64),
+        num_threads=config.get("torch_threads", 0)
+    )
+
+
+def run_object_processor(config_path: str = "config.yaml") -> None:
+    """
+    Main loop: waits for segmented jobs and processes up to `max_jobs_per_batch` of them
+    together so their objects share classifier batches.
+    """
+    print("🧪 Object Processor Started...")
+
+    config = load_config(config_path)
+    configure_tracing(config)
+    base_shared_dir = config["base_shared_dir"]
+    job_store = JobStore(base_shared_dir)
+    check_interval = config.get("check_interval_seconds", 1)
+    max_jobs = max(1, config.get("max_jobs_per_batch", 4))
+    lease_seconds = config.get("job_lease_seconds", 300)
+    max_attempts = max(1, config.get("job_max_attempts", 3))
+    retry_delay = config.get("job_retry_delay_seconds", 5)
+
+    classifier = build_classifier(config)
+
+    while True:
+        claimed = []
+        try:
+            for job_dir in find_pending_jobs(job_store):
+                if len(claimed) >= max_jobs:
+                    break
+                if claim_job(job_dir, CLAIM_FILENAME, lease_seconds):
+                    claimed.append(job_dir)
+        except FileNotFoundError:
+            pass
+
+        if not claimed:
+            time.sleep(check_interval)
+            continue
+
+        results, errors, batch_error = {}, {}, ""
+        try:
+            with job_trace(claimed, "object_processor", base_shared_dir):
+                results = process_jobs(claimed, classifier, config, errors)
+        except Exception as e:
+            print(f"❌ Error during object processing: {e}")
+            batch_error = str(e)
+
+        # Failed jobs are retried after a backoff, then marked "failed" in the job index.
+        # This is the last stage reading the decoded image: its buffer is freed once the
+        # job is done here (kept for a retry)
+        for job_dir in claimed:
+            retrying = job_dir not in results and record_stage_failure(
+                job_store, job_dir, "object_processor", errors.get(job_dir, batch_error), max_attempts, retry_delay
+            )
+            release_decoded_image(job_dir, remove_buffer=not retrying)
+            release_job(job_dir, CLAIM_FILENAME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch object processor")
+    parser.add_argument("--job_id", help="Process a single job (shared/job_<id>) and exit")
+    parser.add_argument("--config", default="config.yaml", help="Path to config.yaml")
+    parser.add_argument("--export", choices=["torchscript", "onnx"], help="Export the CNN and exit")
+    parser.add_argument("--export_path", help="Output path for --export")
+    args = parser.parse_args()
+
+    if args.export:
+        cfg = load_config(args.config)
+        default_path = "quickdraw_cnn.ts.pt" if args.export == "torchscript" else "quickdraw_cnn.onnx"
+        build_classifier(cfg).export(args.export_path or default_path, fmt=args.export)
+    elif args.job_id:
+        cfg = load_config(args.config)
+        configure_tracing(cfg)
+        job_dir = resolve_job_dir(cfg["base_shared_dir"], args.job_id)
+        errors = {}
+        with job_trace([job_dir], "object_processor"):
+            process_jobs([job_dir], build_classifier(cfg), cfg, errors)
+        release_decoded_image(job_dir, remove_buffer=True)
+        if job_dir in errors:
+            publish_event(job_dir, "object_processor", FAILED, error=errors[job_dir])
+    else:
+        run_object_processor(args.config)
@@ -0,0 +1,666 @@
+"""
+Module: benchmark_pipeline.py
+Purpose: End-to-end benchmark of every analysis stage on the images/ corpus, with synthetic load and baseline comparison.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from segmentation_service.segment_service import segment_images
+from segmentation_service.utils.model_loader import discover_models, load_models
+from segmentation_service.utils.model_registry import current_rss_mb
+from segmentation_service.utils.crop_saver import build_manifest_objects, save_crop_manifest
+from segmentation_service.utils.tracing import capture_spans
+from object_processor.analysis.color_mapper import load_color_lut
+from comparator_engine.scorer import score_jobs, MAX_BLOCK_ELEMENTS
+from comparator_engine.comparators.distance import KD_TREE_THRESHOLD
+from emotion_mapper.engine.emotion_mapper import map_emotions_batch
+from emotion_mapper.emotion_mapper_main import build_rule_set, save_final_objects
+from pipeline.stage_config import PIPELINE_DIR, load_pipeline_configs
+
+BACKEND_DIR = os.path.join(os.path.dirname(PIPELINE_DIR), "backend")
+VALID_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Stage order of the report. Stages time the services' own entry points; the indented
+# names are the tracing spans recorded inside them (model_load and model_predict get one
+# entry per model suffix)
+STAGES = (
+    "image_decode", "model_load",
+    "segmentation", "inference_prep", "model_predict", "iou_filter",
+    "crop_saving",
+    "object_processing", "classifier_preprocess", "classifier_batch", "color_extraction", "kmeans",
+    "color_distribution",
+    "comparator", "comparator_scoring",
+    "rule_matching", "rule_evaluation",
+    "pdf_rendering", "end_to_end"
+)
+# Object processing and everything after it need the classifier's labels
+CLASSIFIER_STAGES = ("object_processing", "comparator", "rule_matching", "pdf_rendering")
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+class RssSampler:
+    """
+    Samples the process RSS in a background thread and keeps the peak seen while each
+    stage was active (nested stages all count the sample). Stages shorter than the
+    sampling interval still get their start/end samples.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peaks: Dict[str, float] = {}
+        self._active: List[str] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is None:
+            return
+        with self._lock:
+            for stage in self._active:
+                self.peaks[stage] = max(self.peaks.get(stage, 0.0), rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    @contextmanager
+    def track(self, stage: str):
+        with self._lock:
+            self._active.append(stage)
+        self._sample()
+        try:
+            yield
+        finally:
+            self._sample()
+            with self._lock:
+                self._active.remove(stage)
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    """
+    Percentiles of a list of latencies (ms).
+    """
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+class StageStats:
+    """
+    Latency samples of one stage (one sample per call) and the number of items it handled.
+    """
+
+    def __init__(self, unit: str = "image"):
+        self.unit = unit
+        self.samples_ms: List[float] = []
+        self.items = 0
+
+    def add(self, elapsed_ms: float, items: int) -> None:
+        self.samples_ms.append(elapsed_ms)
+        self.items += items
+
+    def summary(self, peak_rss_mb: Optional[float] = None) -> Dict[str, Any]:
+        total_ms = float(np.sum(self.samples_ms))
+        return {
+            "calls": len(self.samples_ms),
+            "items": self.items,
+            "unit": self.unit,
+            "total_ms": round(total_ms, 1),
+            **latency_summary(self.samples_ms),
+            # Items per second of time spent inside the stage (its capacity on one thread)
+            "throughput_per_s": round(self.items / (total_ms / 1000), 2) if total_ms > 0 else None,
+            "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+        }
+
+
+def load_corpus(images_dir: str, limit: int = 0) -> List[Tuple[str, str]]:
+    """
+    Lists the drawings of the corpus (sorted, optionally the first `limit`).
+
+    Returns:
+        List[Tuple[str, str]]: (file name, path) per drawing.
+    """
+    names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith(VALID_EXTENSIONS))
+    if limit > 0:
+        names = names[:limit]
+    return [(name, os.path.join(images_dir, name)) for name in names]
+
+
+def grid_detections(image: np.ndarray, grid: int) -> List[Tuple[Any, ...]]:
+    """
+    Stand-in detections (grid x grid tiles) for runs without segmentation models,
+    so the downstream stages still get realistic crops.
+    """
+    h, w = image.shape[:2]
+    return [
+        (np.array([c * w // grid, r * h // grid, (c + 1) * w // grid, (r + 1) * h // grid], dtype=np.float32),
+         "grid", 1.0, 0)
+        for r in range(grid) for c in range(grid)
+    ]
+
+
+class PipelineBenchmark:
+    """
+    Replays drawings through every stage of the analysis, timing each stage separately.
+
+    Each stage times the entry point its service calls (segment_images, analyze_objects,
+    score_jobs, map_emotions_batch, generate_report) with the settings from the
+    containers' config.yaml files; the tracing spans recorded inside them (per-model
+    predict, IoU filter, classifier batches, color passes, ...) are reported as extra
+    rows. A stage whose dependency is missing in this environment (e.g. no YOLO
+    checkpoints, no torch, no PDF renderer) is reported as skipped with the reason — it
+    is never replaced by a fake. Without detection models, the downstream stages
+    receive grid tiles as detections.
+    """
+
+    def __init__(
+        self,
+        config_path: str = os.path.join(PIPELINE_DIR, "config.yaml"),
+        grid: int = 3,
+        pdf_backend: Optional[str] = None,
+        render_pdf: bool = True
+    ):
+        _, stage_configs = load_pipeline_configs(config_path)
+        self.segmentation_config = stage_configs["segmentation_config"]
+        self.object_config = stage_configs["object_processor_config"]
+        self.comparator_config = stage_configs["comparator_config"]
+        self.emotion_config = stage_configs["emotion_mapper_config"]
+        self.grid = grid
+        self.pdf_backend = pdf_backend
+        self.render_pdf = render_pdf
+
+        self.models: Dict[str, Any] = {}
+        self.classifier = None
+        self.analyze_objects = None
+        self.generate_report = None
+        self.skipped: Dict[str, str] = {}
+        self.stats: Dict[str, StageStats] = {}
+        self.rss = RssSampler()
+        self.track_rss = True
+        self.recording = True
+        self._lock = threading.Lock()
+        self.work_dir = tempfile.mkdtemp(prefix="soulsketch_bench_")
+
+    @contextmanager
+    def measure(self, stage: str, items: int = 1, unit: str = "image"):
+        """
+        Times the enclosed block as one call of `stage`.
+        """
+        start = time.perf_counter()
+        if self.track_rss and self.recording:
+            with self.rss.track(stage):
+                yield
+        else:
+            yield
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.recording:
+            with self._lock:
+                self.stats.setdefault(stage, StageStats(unit)).add(elapsed_ms, items)
+
+    def setup(self) -> None:
+        """
+        Loads the detection models (one timed load per suffix), the classifier, the color
+        LUT, the compiled rules and the PDF renderer.
+        """
+        models_dir = self.segmentation_config["models_dir"]
+        enabled = self.segmentation_config.get("enabled_models") or None
+        suffixes = [s for s in discover_models(models_dir) if enabled is None or s in enabled]
+        if not suffixes:
+            self.skipped["model_load"] = self.skipped["segmentation"] = f"no YOLO checkpoints in {models_dir}"
+        for suffix in suffixes:
+            try:
+                with self.measure(f"model_load.{suffix}", unit="model"):
+                    loaded = load_models(models_dir, suffixes=[suffix])
+            except ImportError as e:
+                self.skipped["model_load"] = self.skipped["segmentation"] = f"ultralytics unavailable ({e})"
+                break
+            self.models.update(loaded)
+
+        try:
+            from object_processor.object_processor import build_classifier, analyze_objects
+            with self.measure("model_load.classifier", unit="model"):
+                self.classifier = build_classifier(self.object_config)
+            self.analyze_objects = analyze_objects
+        except (ImportError, OSError, RuntimeError) as e:
+            for stage in CLASSIFIER_STAGES:
+                self.skipped[stage] = f"classifier unavailable ({e})"
+
+        self.color_lut = load_color_lut(
+            bins=self.object_config.get("color_lut_bins", 64),
+            metric=self.object_config.get("color_lut_metric", "rgb"),
+            lut_dir=self.object_config.get("color_lut_dir")
+        )
+        self.rule_index = build_rule_set(self.emotion_config).index
+
+        if self.render_pdf:
+            self._setup_pdf()
+        else:
+            self.skipped["pdf_rendering"] = "disabled (--no_pdf)"
+
+    def _setup_pdf(self) -> None:
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        try:
+            from app.main import load_config as load_backend_config
+            from app.services.pdf_generator import generate_report
+        except ImportError as e:
+            self.skipped["pdf_rendering"] = f"backend dependencies unavailable ({e})"
+            return
+
+        backend_config = load_backend_config(os.path.join(BACKEND_DIR, "config.yaml"))
+        self.pdf_backend = self.pdf_backend or backend_config.get("report_backend", "wkhtmltopdf")
+        self.wkhtmltopdf_path = backend_config.get("wkhtmltopdf_path", "wkhtmltopdf")
+        self.pdf_timeout = backend_config.get("report_timeout_seconds", 60)
+        if self.pdf_backend == "wkhtmltopdf" and shutil.which(self.wkhtmltopdf_path) is None:
+            self.skipped["pdf_rendering"] = f"{self.wkhtmltopdf_path} not found (try --pdf_backend xhtml2pdf)"
+            return
+        self.generate_report = generate_report
+
+    def close(self) -> None:
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def decode(self, path: str) -> np.ndarray:
+        with self.measure("image_decode"):
+            image = cv2.imread(path)
+        if image is None:
+            raise ValueError(f"❌ Could not read image: {path}")
+        return image
+
+    def run_image(self, name: str, image: np.ndarray) -> int:
+        """
+        Sends one decoded drawing through every stage.
+
+        Returns:
+            int: Number of tagged objects.
+        """
+        with capture_spans() as trace:
+            try:
+                return self._run_stages(name, image)
+            finally:
+                if trace is not None and self.recording:
+                    self._record_spans(trace.records)
+
+    def _run_stages(self, name: str, image: np.ndarray) -> int:
+        seg = self.segmentation_config
+        if self.models:
+            with self.measure("segmentation"):
+                filtered, _ = segment_images([image], self.models, seg)[0]
+        else:
+            filtered = grid_detections(image, self.grid)
+
+        job_dir = os.path.join(self.work_dir, f"job_{uuid.uuid4()}")
+        os.makedirs(job_dir)
+        try:
+            with self.measure("crop_saving", items=len(filtered), unit="object"):
+                save_crop_manifest(
+                    image, filtered, job_dir, source_image=name,
+                    output_subdir=seg.get("output_subdir", "objects"),
+                    save_png=seg.get("save_png_crops", False),
+                    save_atlas=seg.get("save_crop_atlas", False)
+                )
+            if self.analyze_objects is None:
+                return 0   # later stages are reported as skipped
+
+            pairs = build_manifest_objects(image, filtered)
+            with self.measure("object_processing", items=len(pairs), unit="object"):
+                features = self.analyze_objects([pairs], self.classifier, self.object_config, self.color_lut)[0]
+
+            with self.measure("comparator", items=len(features), unit="object"):
+                enriched = score_jobs(
+                    [features],
+                    kd_tree_threshold=self.comparator_config.get("kd_tree_threshold", KD_TREE_THRESHOLD),
+                    max_block_elements=self.comparator_config.get("max_block_elements", MAX_BLOCK_ELEMENTS)
+                )[0]
+
+            with self.measure("rule_matching", items=len(enriched), unit="object"):
+                final = map_emotions_batch([enriched], self.rule_index)[0]
+
+            if self.generate_report is not None:
+                save_final_objects(job_dir, final)
+                with self.measure("pdf_rendering"):
+                    self.generate_report(
+                        os.path.basename(job_dir)[len("job_"):], job_dir,
+                        self.pdf_backend, self.wkhtmltopdf_path, self.pdf_timeout
+                    )
+            return len(final)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _record_spans(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Adds the tracing spans recorded inside the stages as one call each
+        (model_predict per model suffix).
+        """
+        with self._lock:
+            for record in records:
+                if "span" not in record:
+                    continue
+                stage = f"{record['span']}.{record['model']}" if "model" in record else record["span"]
+                self.stats.setdefault(stage, StageStats("call")).add(record["ms"], 1)
+
+    def stage_report(self) -> Dict[str, Any]:
+        """
+        Per-stage summaries in pipeline order, plus the skipped stages and why.
+        """
+        order = {stage: idx for idx, stage in enumerate(STAGES)}
+        names = sorted(self.stats, key=lambda s: (order.get(s.split(".")[0], len(order)), s))
+        report = {name: self.stats[name].summary(self.rss.peaks.get(name)) for name in names}
+        for stage, reason in self.skipped.items():
+            if not any(name.split(".")[0] == stage for name in report):
+                report[stage] = {"skipped": reason}
+        return report
+
+    def run_corpus(self, corpus: List[Tuple[str, str]], repeat: int = 1, warmup: int = 1) -> Dict[str, Any]:
+        """
+        Replays the corpus `repeat` times, one drawing at a time, after `warmup`
+        unrecorded drawings.
+
+        Returns:
+            Dict[str, Any]: Per-stage summaries.
+        """
+        images = [(name, self.decode(path)) for name, path in corpus]
+        print(f"🖼️ Loaded {len(images)} drawings")
+
+        self.recording = False
+        for name, image in images[:warmup]:
+            self.run_image(name, image)
+        self.recording = True
+
+        objects = 0
+        for _ in range(repeat):
+            for name, image in images:
+                with self.measure("end_to_end"):
+                    objects += self.run_image(name, image)
+        print(f"✅ Replayed {len(images)} drawings x {repeat} ({objects} objects tagged)")
+        return self.stage_report()
+
+    def run_load(
+        self,
+        corpus: List[Tuple[str, str]],
+        requests: int,
+        concurrency: int = 4,
+        rate: float = 0.0,
+        seed: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Synthetic load: `requests` drawings arrive as a Poisson process of `rate` per second
+        (0 = all at once, i.e. saturation) and are served by `concurrency` workers.
+        Latency is measured from arrival, so it includes queueing.
+
+        Returns:
+            Dict[str, Any]: Load settings, throughput, latency/queue-wait percentiles,
+            process peak RSS and per-stage summaries under load.
+        """
+        images = [(name, cv2.imread(path)) for name, path in corpus]
+        rng = random.Random(seed)
+
+        # Stages overlap across workers, so only the whole run gets an RSS peak
+        self.stats, self.track_rss = {}, False
+        latencies, waits, errors = [], [], 0
+
+        def serve(name: str, image: np.ndarray, arrival: float) -> Tuple[float, float]:
+            started = time.perf_counter()
+            self.run_image(name, image)
+            done = time.perf_counter()
+            return (done - arrival) * 1000, (started - arrival) * 1000
+
+        print(f"🚦 Synthetic load: {requests} requests, concurrency {concurrency}, "
+              f"rate {rate if rate > 0 else 'unbounded'}/s")
+        with self.rss.track("load"), ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = []
+            start = next_arrival = time.perf_counter()
+            for i in range(requests):
+                if rate > 0:
+                    next_arrival += rng.expovariate(rate)
+                    delay = next_arrival - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                name, image = images[i % len(images)]
+                futures.append(executor.submit(serve, name, image, time.perf_counter()))
+
+            for future in futures:
+                try:
+                    latency_ms, wait_ms = future.result()
+                    latencies.append(latency_ms)
+                    waits.append(wait_ms)
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ Request failed: {e}")
+            duration = time.perf_counter() - start
+
+        report = {
+            "requests": requests,
+            "concurrency": concurrency,
+            "arrival_rate_per_s": rate,
+            "errors": errors,
+            "duration_s": round(duration, 3),
+            "throughput_per_s": round(len(latencies) / duration, 2) if duration > 0 else None,
+            "peak_rss_mb": round(self.rss.peaks["load"], 1) if "load" in self.rss.peaks else None,
+        }
+        if latencies:
+            report["latency"] = latency_summary(latencies)
+            report["queue_wait"] = latency_summary(waits)
+        report["stages"] = self.stage_report()
+        self.track_rss = True
+        return report
+
+
+def compare_stats(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.10,
+    min_delta_ms: float = 1.0
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compares the latency percentiles, throughput and peak RSS of one stage.
+
+    A latency percentile regresses when it grows by more than `tolerance` (relative) and
+    by more than `min_delta_ms` (absolute, so sub-millisecond stages do not flap);
+    throughput regresses when it drops by more than `tolerance`; peak RSS when it grows
+    by more than `tolerance`.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {metric: {"baseline", "current", "ratio", "regressed"}}.
+    """
+    checks = {metric: lambda c, b: c > b * (1 + tolerance) and c - b > min_delta_ms for metric in LATENCY_METRICS}
+    # Throughput of very fast stages is as noisy as their latency: same absolute floor
+    slower = current.get("mean_ms", 0) - baseline.get("mean_ms", 0) > min_delta_ms if "mean_ms" in current else True
+    checks["throughput_per_s"] = lambda c, b: c < b * (1 - tolerance) and slower
+    checks["peak_rss_mb"] = lambda c, b: c > b * (1 + tolerance)
+
+    rows = {}
+    for metric, regressed in checks.items():
+        cur, base = current.get(metric), baseline.get(metric)
+        if cur is None or base is None:
+            continue
+        rows[metric] = {
+            "baseline": base,
+            "current": cur,
+            "ratio": round(cur / base, 3) if base else None,
+            "regressed": bool(regressed(cur, base)),
+        }
+    return rows
+
+
+def compare_reports(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.10,
+    min_delta_ms: float = 1.0
+) -> Dict[str, Any]:
+    """
+    Compares a benchmark report with a stored baseline report, stage by stage
+    (see `compare_stats`), including the load phase when both reports have one.
+
+    Returns:
+        Dict[str, Any]: {"tolerance", "min_delta_ms", "regressions": ["<stage>.<metric>", ...],
+        "stages": {stage: metric rows, or a note if the stage was only measured in one run}}.
+    """
+    pairs = [(stage, current.get("stages", {}).get(stage), baseline.get("stages", {}).get(stage))
+             for stage in sorted(set(current.get("stages", {})) | set(baseline.get("stages", {})))]
+
+    cur_load, base_load = current.get("load") or {}, baseline.get("load") or {}
+    if "latency" in cur_load and "latency" in base_load:
+        pairs.append(("load", {**cur_load, **cur_load["latency"]}, {**base_load, **base_load["latency"]}))
+        pairs.extend(
+            (f"load.{stage}", cur_load["stages"].get(stage), base_load["stages"].get(stage))
+            for stage in sorted(set(cur_load.get("stages", {})) | set(base_load.get("stages", {})))
+        )
+
+    comparison: Dict[str, Any] = {"tolerance": tolerance, "min_delta_ms": min_delta_ms, "regressions": [], "stages": {}}
+    cur_meta, base_meta = current.get("meta", {}), baseline.get("meta", {})
+    differing = [key for key in ("images", "repeat", "detections", "models", "pdf_backend", "cpu_count")
+                 if cur_meta.get(key) != base_meta.get(key)]
+    if differing:
+        comparison["warning"] = f"runs are not comparable on: {', '.join(differing)}"
+    for stage, cur, base in pairs:
+        if not cur or not base or "p50_ms" not in cur or "p50_ms" not in base:
+            missing = "current" if not cur or "p50_ms" not in cur else "baseline"
+            comparison["stages"][stage] = {"note": f"not measured in the {missing} run"}
+            continue
+        rows = compare_stats(cur, base, tolerance, min_delta_ms)
+        comparison["stages"][stage] = rows
+        comparison["regressions"].extend(f"{stage}.{metric}" for metric, row in rows.items() if row["regressed"])
+    return comparison
+
+
+def run_benchmark(
+    images_dir: str,
+    config_path: str = os.path.join(PIPELINE_DIR, "config.yaml"),
+    limit: int = 0,
+    repeat: int = 1,
+    warmup: int = 1,
+    grid: int = 3,
+    pdf_backend: Optional[str] = None,
+    render_pdf: bool = True,
+    requests: int = 0,
+    concurrency: int = 4,
+    rate: float = 0.0,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Runs the corpus replay (and the synthetic load phase when `requests` > 0).
+
+    Returns:
+        Dict[str, Any]: {"meta", "stages"[, "load"]} — JSON-serializable.
+    """
+    corpus = load_corpus(images_dir, limit)
+    bench = PipelineBenchmark(config_path, grid=grid, pdf_backend=pdf_backend, render_pdf=render_pdf)
+    bench.rss.start()
+    try:
+        bench.setup()
+        report: Dict[str, Any] = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "images": len(corpus),
+                "repeat": repeat,
+                "warmup": warmup,
+                "models": list(bench.models),
+                "detections": "models" if bench.models else f"grid {grid}x{grid}",
+                "dedup_method": bench.segmentation_config.get("dedup_method", "first"),
+                "color_method": bench.object_config.get("color_method", "histogram"),
+                "pdf_backend": bench.pdf_backend if bench.generate_report is not None else None,
+            },
+            "stages": bench.run_corpus(corpus, repeat=repeat, warmup=warmup),
+        }
+        if requests > 0:
+            report["load"] = bench.run_load(corpus, requests, concurrency=concurrency, rate=rate, seed=seed)
+    finally:
+        bench.rss.stop()
+        bench.close()
+
+    for stage, stats in report["stages"].items():
+        if "skipped" in stats:
+            print(f"⏭️ {stage:<24} skipped: {stats['skipped']}")
+        else:
+            print(f"⏱️ {stage:<24} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+                  f"p99 {stats['p99_ms']:>9.2f} ms  {stats['throughput_per_s']} {stats['unit']}/s  "
+                  f"peak RSS {stats['peak_rss_mb']} MB")
+    if "load" in report and "latency" in report["load"]:
+        load = report["load"]
+        print(f"🚦 Load: {load['throughput_per_s']} req/s, latency p50 {load['latency']['p50_ms']} ms, "
+              f"p99 {load['latency']['p99_ms']} ms, peak RSS {load['peak_rss_mb']} MB")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the SoulSketch pipeline")
+    parser.add_argument("--images", default=os.path.join(os.path.dirname(PIPELINE_DIR), "images"),
+                        help="Folder with test drawings")
+    parser.add_argument("--config", default=os.path.join(PIPELINE_DIR, "config.yaml"), help="Pipeline config.yaml")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N drawings (0 = all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the corpus N times")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded drawings before measuring")
+    parser.add_argument("--grid", type=int, default=3, help="Stand-in detections per side when no models are available")
+    parser.add_argument("--pdf_backend", choices=["wkhtmltopdf", "xhtml2pdf"], help="Default: backend/config.yaml")
+    parser.add_argument("--no_pdf", action="store_true", help="Skip the PDF rendering stage")
+    parser.add_argument("--requests", type=int, default=0, help="Synthetic load: number of requests (0 = no load phase)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Synthetic load: parallel workers")
+    parser.add_argument("--rate", type=float, default=0.0, help="Synthetic load: Poisson arrivals per second (0 = unbounded)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against this stored report; exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown")
+    parser.add_argument("--min_delta_ms", type=float, default=1.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        args.images, args.config, limit=args.limit, repeat=args.repeat, warmup=args.warmup, grid=args.grid,
+        pdf_backend=args.pdf_backend, render_pdf=not args.no_pdf,
+        requests=args.requests, concurrency=args.concurrency, rate=args.rate, seed=args.seed
+    )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            result["comparison"] = compare_reports(result, json.load(f), args.tolerance, args.min_delta_ms)
+        regressions = result["comparison"]["regressions"]
+        if "warning" in result["comparison"]:
+            print(f"⚠️ Baseline {result['comparison']['warning']}")
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) vs {args.baseline}: {', '.join(regressions)}")
+        else:
+            print(f"✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Report saved to {args.json}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,227 @@
+"""
+Module: in_memory_pipeline.py
+Purpose: Single-process pipeline chaining segmentation, object processing, comparison and emotion mapping in memory.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import List, Dict, Any, Optional, Union
+
+import numpy as np
+
+from segmentation_service.segment_service import setup_models, segment_images, save_job_telemetry
+from segmentation_service.utils.image_utils import load_image
+from segmentation_service.utils.crop_saver import build_manifest_objects, save_crop_manifest
+from segmentation_service.utils.job_queue import DONE_FILENAME, find_uploaded_image
+from segmentation_service.utils.job_store import JobStore, resolve_job_dir, FINISHED
+from segmentation_service.utils.progress_events import publish_event, COMPLETED
+from segmentation_service.utils.tracing import configure as configure_tracing, job_trace
+from object_processor.object_processor import analyze_objects, build_classifier
+from object_processor.analysis.color_mapper import load_color_lut
+from object_processor.analysis.object_builder import save_object_features
+from comparator_engine.scorer import score_jobs, MAX_BLOCK_ELEMENTS
+from comparator_engine.comparators.distance import KD_TREE_THRESHOLD
+from comparator_engine.comparator_engine import save_enriched_objects
+from emotion_mapper.engine.emotion_mapper import map_emotions_batch
+from emotion_mapper.emotion_mapper_main import build_rule_set, save_final_objects
+from pipeline.stage_config import PIPELINE_DIR, load_pipeline_configs
+
+VALID_EXTENSIONS = [".png", ".jpg", ".jpeg"]
+
+
+class InMemoryPipeline:
+    """
+    Runs all four analysis stages in one process.
+
+    Models, the classifier, the color lookup table and the compiled rules are loaded
+    once; objects and crops are handed from stage to stage in memory, so no intermediate
+    JSON is written or re-parsed. The per-stage JSON files are only written as optional
+    checkpoints (same format as the container services, so a checkpointed job can be
+    resumed or inspected with them).
+    """
+
+    def __init__(self, config_path: str = os.path.join(PIPELINE_DIR, "config.yaml")):
+        self.config, stage_configs = load_pipeline_configs(config_path)
+        configure_tracing(self.config)
+        self.segmentation_config = stage_configs["segmentation_config"]
+        self.object_config = stage_configs["object_processor_config"]
+        self.comparator_config = stage_configs["comparator_config"]
+        self.emotion_config = stage_configs["emotion_mapper_config"]
+
+        print("🔗 Loading pipeline stages...")
+        self.models, self.ensemble_pool = setup_models(self.segmentation_config)
+        self.classifier = build_classifier(self.object_config)
+        self.color_lut = load_color_lut(
+            bins=self.object_config.get("color_lut_bins", 64),
+            metric=self.object_config.get("color_lut_metric", "rgb"),
+            lut_dir=self.object_config.get("color_lut_dir")
+        )
+        self.rule_set = build_rule_set(self.emotion_config)
+        if self.config.get("watch_rules", False):
+            self.rule_set.start()
+
+    def close(self) -> None:
+        """
+        Stops the rules watcher and the ensemble pool (if any).
+        """
+        self.rule_set.stop()
+        if self.ensemble_pool is not None:
+            self.ensemble_pool.close()
+
+    def __enter__(self) -> "InMemoryPipeline":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def run_batch(
+        self,
+        images: List[Union[str, np.ndarray]],
+        job_dirs: Optional[List[Optional[str]]] = None,
+        checkpoint: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyzes several drawings together: one detection pass, one classifier/color
+        pass, one scoring call and one rule-matching call for the whole batch.
+
+        Args:
+            images (List[Union[str, np.ndarray]]): Image paths or decoded BGR images.
+            job_dirs (Optional[List[Optional[str]]]): Job folder per image for checkpoints.
+            checkpoint (Optional[bool]): Write the per-stage JSON files into the job folders
+                (default: `checkpoint_json` from the config; ignored for images without a job folder).
+
+        Returns:
+            List[Dict[str, Any]]: Per image: {"segmentation": telemetry, "objects": final objects,
+            "timings_ms": per-stage wall time of the batch}.
+        """
+        if checkpoint is None:
+            checkpoint = self.config.get("checkpoint_json", False)
+        job_dirs = job_dirs or [None] * len(images)
+        sources = [image if isinstance(image, str) else None for image in images]
+        decoded = [load_image(image) if isinstance(image, str) else image for image in images]
+        timings = {}
+
+        start = time.perf_counter()
+        segmented = segment_images(decoded, self.models, self.segmentation_config, self.ensemble_pool)
+        timings["segmentation"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        crops = [build_manifest_objects(image, boxes) for image, (boxes, _) in zip(decoded, segmented)]
+        features = analyze_objects(crops, self.classifier, self.object_config, self.color_lut)
+        timings["object_processor"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        enriched = score_jobs(
+            features,
+            kd_tree_threshold=self.comparator_config.get("kd_tree_threshold", KD_TREE_THRESHOLD),
+            max_block_elements=self.comparator_config.get("max_block_elements", MAX_BLOCK_ELEMENTS)
+        )
+        timings["comparator"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        final = map_emotions_batch(enriched, self.rule_set)
+        timings["emotion_mapper"] = (time.perf_counter() - start) * 1000
+
+        timings = {stage: round(ms, 1) for stage, ms in timings.items()}
+        print(f"⏱️ Pipeline batch of {len(decoded)} image(s): "
+              + ", ".join(f"{stage} {ms} ms" for stage, ms in timings.items()))
+
+        results = []
+        for idx, job_dir in enumerate(job_dirs):
+            boxes, telemetry = segmented[idx]
+            if checkpoint and job_dir:
+                self._write_checkpoint(
+                    job_dir, decoded[idx], boxes, telemetry, sources[idx],
+                    features[idx], enriched[idx], final[idx]
+                )
+            results.append({"segmentation": telemetry, "objects": final[idx], "timings_ms": timings})
+        return results
+
+    def run(
+        self,
+        image: Union[str, np.ndarray],
+        job_dir: Optional[str] = None,
+        checkpoint: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyzes one drawing (see `run_batch`).
+        """
+        return self.run_batch([image], [job_dir], checkpoint)[0]
+
+    def run_job(self, job_dir: str, checkpoint: bool = True) -> Dict[str, Any]:
+        """
+        Analyzes the uploaded image of a shared/job_<uuid>/ folder.
+
+        Raises:
+            FileNotFoundError: If the job folder has no uploaded image.
+        """
+        image_path = find_uploaded_image(job_dir, VALID_EXTENSIONS)
+        if image_path is None:
+            raise FileNotFoundError(f"❌ No uploaded image in {job_dir}")
+        with job_trace([job_dir], "pipeline"):
+            return self.run(image_path, job_dir, checkpoint)
+
+    def _write_checkpoint(
+        self,
+        job_dir: str,
+        image: np.ndarray,
+        boxes: List[Any],
+        telemetry: Dict[str, Any],
+        source_path: Optional[str],
+        features: List[Dict[str, Any]],
+        enriched: List[Dict[str, Any]],
+        final: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Writes the same files the container services would, and marks the job as segmented.
+        """
+        os.makedirs(job_dir, exist_ok=True)
+        save_job_telemetry(job_dir, telemetry)
+        save_crop_manifest(
+            image, boxes, job_dir,
+            source_image=os.path.basename(source_path) if source_path else None,
+            output_subdir=self.segmentation_config.get("output_subdir", "objects"),
+            save_png=self.segmentation_config.get("save_png_crops", False),
+            save_atlas=self.segmentation_config.get("save_crop_atlas", False)
+        )
+        with open(os.path.join(job_dir, DONE_FILENAME), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+        save_object_features(job_dir, features)
+        save_enriched_objects(job_dir, enriched)
+        save_final_objects(job_dir, final)
+        for stage in ("segmentation", "object_processor", "comparator", "emotion_mapper"):
+            publish_event(job_dir, stage, COMPLETED, num_objects=len(final), in_memory=True)
+        print(f"💾 Checkpointed all stage outputs to: {job_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch single-process pipeline")
+    parser.add_argument("--image", nargs="*", default=[], help="Image file(s) to analyze")
+    parser.add_argument("--job_id", nargs="*", default=[], help="Job(s) in the shared folder (shared/job_<id>)")
+    parser.add_argument("--config", default=os.path.join(PIPELINE_DIR, "config.yaml"), help="Path to config.yaml")
+    parser.add_argument("--output", help="Write the results of --image runs to this JSON file")
+    args = parser.parse_args()
+
+    with InMemoryPipeline(args.config) as pipeline:
+        shared_dir = pipeline.segmentation_config["base_shared_dir"]
+        job_store = JobStore(shared_dir) if args.job_id else None
+        for job_id in args.job_id:
+            job_dir = resolve_job_dir(shared_dir, job_id)
+            result = pipeline.run_job(job_dir, checkpoint=True)
+            job_store.set_state(job_dir, FINISHED)
+            print(f"✅ {os.path.basename(job_dir)}: {len(result['objects'])} objects tagged")
+
+        if args.image:
+            batch_size = max(1, pipeline.config.get("batch_size", 4))
+            outputs = {}
+            for i in range(0, len(args.image), batch_size):
+                paths = args.image[i:i + batch_size]
+                for path, result in zip(paths, pipeline.run_batch(paths)):
+                    outputs[path] = result
+                    print(f"✅ {path}: {len(result['objects'])} objects tagged")
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump(outputs, f, indent=2)
@@ -0,0 +1,63 @@
+"""
+Module: stage_config.py
+Purpose: Load the pipeline config and the per-container stage configs it points to (no model imports).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+from typing import Dict, Any, Tuple
+
+from segmentation_service.segment_service import load_config
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Config keys holding paths relative to their container folder, per stage
+PATH_KEYS = {
+    "segmentation_config": ("base_shared_dir", "models_dir", "result_cache_dir"),
+    "object_processor_config": ("base_shared_dir", "model_path", "labels_path", "color_lut_dir"),
+    "comparator_config": ("base_shared_dir",),
+    "emotion_mapper_config": ("base_shared_dir", "rules_path"),
+}
+
+
+def load_stage_config(config_path: str, path_keys: tuple) -> Dict[str, Any]:
+    """
+    Loads a container's config.yaml and makes its relative paths absolute,
+    so the stage behaves the same when run from the pipeline.
+
+    Args:
+        config_path (str): Path to the container's config.yaml.
+        path_keys (tuple): Keys whose values are paths relative to the container folder.
+
+    Returns:
+        Dict[str, Any]: Configuration with resolved paths.
+    """
+    config = load_config(config_path) or {}
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    for key in path_keys:
+        value = config.get(key)
+        if isinstance(value, str) and value and not os.path.isabs(value):
+            config[key] = os.path.normpath(os.path.join(base_dir, value))
+    return config
+
+
+def load_pipeline_configs(config_path: str) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Loads pipeline/config.yaml and every stage config it references.
+
+    Args:
+        config_path (str): Path to the pipeline config.yaml.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]: (pipeline config, {PATH_KEYS key: stage config}).
+    """
+    config = load_config(config_path)
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+
+    stage_configs = {}
+    for key, path_keys in PATH_KEYS.items():
+        stage_path = config[key]
+        if not os.path.isabs(stage_path):
+            stage_path = os.path.join(config_dir, stage_path)
+        stage_configs[key] = load_stage_config(stage_path, path_keys)
+    return config, stage_configs
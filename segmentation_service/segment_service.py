@@ -5,15 +5,44 @@ Author: Itay Vazana (SoulSketch Project)
 """
 
 import os
-import time
+import json
 import yaml
-from typing import List
+from typing import List, Tuple, Any, Dict, Optional
+
+from segmentation_service.utils.model_loader import load_models, discover_models
+from segmentation_service.utils.image_utils import load_image, decode_image_bytes
+from segmentation_service.utils.segmentor import detect_objects
+from segmentation_service.utils.crop_saver import save_crop_manifest
+from segmentation_service.utils.iou_utils import filter_detections
+from segmentation_service.utils.job_queue import JobQueue
+from segmentation_service.utils.job_store import JobStore, RetentionWorker, FINISHED
+from segmentation_service.utils.ensemble_pool import EnsemblePool
+from segmentation_service.utils.model_registry import ModelRegistry
+from segmentation_service.utils.cascade import run_cascade
+from segmentation_service.utils.inference_prep import plan_inference, inference_settings, restore_detections
+from segmentation_service.utils.result_cache import ResultCache, compute_versions_fingerprint, stage_version_files
+from segmentation_service.utils.shared_image import publish_decoded_image
+from segmentation_service.utils.progress_events import publish_event, STARTED, COMPLETED, FAILED, RETRYING
+from segmentation_service.utils.tracing import configure as configure_tracing, job_trace, span
+
+# Cached artifact -> pipeline stage it completes (for progress events on cache hits)
+CACHED_STAGE_OUTPUTS = [
+    ("segmented_objects.json", "segmentation"),
+    ("object_features.json", "object_processor"),
+    ("enriched_objects.json", "comparator"),
+    ("final_objects.json", "emotion_mapper"),
+]
+
+# Configs of the later stages (relative to the working directory, like base_shared_dir)
+# and their version-relevant paths: classifier checkpoint/labels and the emotion rules
+# (the rule-set version is the hash of that file)
+DEFAULT_STAGE_CONFIGS = {
+    "object_processor": "../object_processor/config.yaml",
+    "comparator": "../comparator_engine/config.yaml",
+    "emotion_mapper": "../emotion_mapper/config.yaml",
+}
+STAGE_PATH_KEYS = ("model_path", "labels_path", "rules_path")
 
-from segmentation_service.utils.model_loader import load_models
-from segmentation_service.utils.image_utils import load_image
-from segmentation_service.utils.segmentor import extract_bboxes
-from segmentation_service.utils.crop_saver import save_crop_from_bbox
-from segmentation_service.utils.iou_utils import filter_duplicates
 
 def load_config(config_path: str = "config.yaml") -> dict:
     """
@@ -31,58 +60,168 @@ def load_config(config_path: str = "config.yaml") -> dict:
     with open(config_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def find_latest_job_dir(base_shared_dir: str) -> str:
+def save_job_telemetry(shared_dir: str, telemetry: Dict[str, Any]) -> None:
+    """
+    Writes the per-job segmentation telemetry (mode, tier, models used, counts).
+
+    Args:
+        shared_dir (str): Path to the shared/job_<uuid>/ folder.
+        telemetry (Dict[str, Any]): Telemetry values for the job.
+    """
+    with open(os.path.join(shared_dir, "segmentation_stats.json"), "w", encoding="utf-8") as f:
+        json.dump(telemetry, f, indent=2)
+
+def setup_models(config: Dict[str, Any]) -> Tuple[Any, Optional[EnsemblePool]]:
     """
-    Finds the latest job_<uuid> directory inside the base shared directory.
+    Loads the ensemble described by the config: in this process (eagerly or through the
+    lazy ModelRegistry), or warm inside the workers of a started EnsemblePool.
 
     Args:
-        base_shared_dir (str): Path to the base shared directory.
+        config (Dict[str, Any]): Segmentation configuration.
 
     Returns:
-        str: Full path to the latest job directory.
+        Tuple[Any, Optional[EnsemblePool]]: (models, None) or (None, started pool).
     """
-    job_dirs = [
-        os.path.join(base_shared_dir, d)
-        for d in os.listdir(base_shared_dir)
-        if os.path.isdir(os.path.join(base_shared_dir, d)) and d.startswith("job_")
-    ]
+    models_base_path = config["models_dir"]
+    enabled_models = config.get("enabled_models") or None
+
+    if config.get("execution_mode", "sequential") == "process_pool":
+        ensemble_pool = EnsemblePool(
+            models_base_path=models_base_path,
+            num_workers=config.get("pool_workers", 3),
+            torch_threads=config.get("torch_threads_per_worker", 1),
+            enabled_models=enabled_models,
+            task_timeout=config.get("pool_task_timeout_seconds", 120),
+            start_timeout=config.get("pool_start_timeout_seconds", 300)
+        )
+        ensemble_pool.start()
+        return None, ensemble_pool
 
-    if not job_dirs:
-        raise FileNotFoundError(f"❌ No job directories found in {base_shared_dir}")
+    if config.get("lazy_models", True):
+        models = ModelRegistry(
+            models_base_path=models_base_path,
+            enabled_models=enabled_models,
+            max_models=config.get("max_warm_models", 0),
+            max_memory_mb=config.get("max_model_memory_mb", 0)
+        )
+        if config.get("prewarm_models", True):
+            models.prewarm(background=True)
+        return models, None
 
-    job_dirs.sort(key=lambda d: os.path.getmtime(d))
-    latest_job_dir = job_dirs[-1]
-    print(f"📂 Latest job detected: {latest_job_dir}")
-    return latest_job_dir
+    return load_models(models_base_path=models_base_path, suffixes=enabled_models), None
 
-def wait_for_uploaded_image(shared_dir: str, valid_extensions: List[str], check_interval: int) -> str:
+def segment_images(
+    images: List[Any],
+    models: Any,
+    config: Dict[str, Any],
+    ensemble_pool: Optional[EnsemblePool] = None
+) -> List[Tuple[List[Tuple[Any, ...]], Dict[str, Any]]]:
     """
-    Waits until an image file appears in the shared directory.
+    Detects and de-duplicates the objects of several decoded images, without touching disk.
+
+    Each image is first downscaled to `inference_max_side` (or cut into overlapping tiles
+    when `tiling_enabled` and it exceeds `tile_threshold_side`); the boxes are mapped back
+    to original coordinates, so crops keep full resolution. Runs the early-exit cascade
+    when enabled (not available with the process pool or for tiled images), otherwise
+    the full ensemble followed by `filter_detections`.
 
     Args:
-        shared_dir (str): Path to the shared/job_<uuid>/ folder.
-        valid_extensions (List[str]): List of accepted image file extensions.
-        check_interval (int): Seconds between each check.
+        images (List[np.ndarray]): Decoded BGR images.
+        models (Any): Loaded models (dict or ModelRegistry); ignored when a pool is given.
+        config (Dict[str, Any]): Segmentation configuration.
+        ensemble_pool (Optional[EnsemblePool]): Started process pool to run the ensemble in.
 
     Returns:
-        str: Path to the detected image file.
+        List[Tuple[List[Tuple[Any, ...]], Dict[str, Any]]]: (filtered detections, telemetry) per image.
     """
-    print(f"🔵 Waiting for uploaded image in: {shared_dir} ...")
-    while True:
-        for file in os.listdir(shared_dir):
-            if any(file.lower().endswith(ext) for ext in valid_extensions):
-                image_path = os.path.join(shared_dir, file)
-                print(f"📥 Image detected: {image_path}")
-                return image_path
-        time.sleep(check_interval)
+    conf_threshold = config.get("confidence_threshold", 0.25)
+    iou_threshold = config.get("iou_threshold", 0.5)
+    dedup_method = config.get("dedup_method", "first")
+    dedup_per_class = config.get("dedup_per_class", False)
+    batch_size = max(1, config.get("batch_size", 1))
+    use_masks = config.get("use_masks", False)
+    merge_ios = config.get("tile_merge_ios", 0.6)
+
+    # Downscale once (or tile) per image; every model then sees the same small input
+    plans = [plan_inference(image, **inference_settings(config)) for image in images]
+    outcomes: List[Optional[Tuple[List[Tuple[Any, ...]], Dict[str, Any]]]] = [None] * len(images)
+    pending = list(range(len(images)))
+
+    cascade_idx = [idx for idx in pending if not plans[idx].tiled]
+    if config.get("cascade_enabled", False) and ensemble_pool is None and cascade_idx:
+        # The cascade scores one view per image; tiled images run the full ensemble
+        cascade_outcomes = run_cascade(
+            models, [plans[idx].views[0] for idx in cascade_idx], conf_threshold, iou_threshold,
+            score_threshold=config.get("cascade_score_threshold", 0.6),
+            tiers=config.get("cascade_tiers") or None,
+            dedup_method=dedup_method, per_class=dedup_per_class, max_batch_size=batch_size,
+            return_masks=use_masks, scales=[plans[idx].scale for idx in cascade_idx]
+        )
+        for idx, (boxes, telemetry) in zip(cascade_idx, cascade_outcomes):
+            print(f"🪜 Cascade answered at tier {telemetry.get('tier')} "
+                  f"(score {telemetry.get('score', 0.0):.3f})")
+            outcomes[idx] = (restore_detections([boxes], plans[idx]), telemetry)
+        pending = [idx for idx in pending if plans[idx].tiled]
+
+    if pending:
+        views = [view for idx in pending for view in plans[idx].views]
+        if ensemble_pool is not None:
+            # Per-model spans are recorded inside the pool workers; this is the whole pool call
+            with span("model_predict", model="ensemble_pool"):
+                detections = ensemble_pool.detect(
+                    views, conf_threshold, max_batch_size=batch_size, return_masks=use_masks
+                )
+        else:
+            detections = detect_objects(
+                models, views, conf_threshold, max_batch_size=batch_size, return_masks=use_masks
+            )
+
+        position = 0
+        for idx in pending:
+            plan = plans[idx]
+            per_view = detections[position:position + len(plan.views)]
+            position += len(plan.views)
+            num_raw = sum(len(boxes) for boxes in per_view)
+            print(f"🧠 Total detections before filtering: {num_raw}")
+
+            # Back to original coordinates (tiles merged), then filter duplicate boxes
+            boxes = restore_detections(per_view, plan, merge_ios=merge_ios, per_class=dedup_per_class)
+            filtered_boxes = filter_detections(
+                boxes, iou_threshold=iou_threshold, method=dedup_method, per_class=dedup_per_class
+            )
+            outcomes[idx] = (filtered_boxes, {
+                "mode": "ensemble",
+                "models_used": sorted({det[1] for det in boxes}),
+                "num_raw_detections": num_raw
+            })
+
+    for (filtered_boxes, telemetry), plan in zip(outcomes, plans):
+        telemetry["inference_scale"] = round(plan.scale, 4)
+        telemetry["tiles"] = len(plan.views) if plan.tiled else 0
+        print(f"🔍 After filtering duplicates: {len(filtered_boxes)} objects")
+        telemetry["num_objects"] = len(filtered_boxes)
+    return outcomes
+
+def fail_job(job_queue: JobQueue, shared_dir: str, error: str) -> None:
+    """
+    Releases a job that failed segmentation and tells the UI whether it will be retried
+    ("retrying") or gave up ("failed").
+    """
+    if job_queue.release(shared_dir, error=error):
+        publish_event(shared_dir, "segmentation", RETRYING, error=error)
+    else:
+        publish_event(shared_dir, "segmentation", FAILED, error=error)
+
 
 def run_segmentation_service():
     """
     Runs the main segmentation service loop based on bounding boxes.
+    Jobs are taken from the event-driven JobQueue in FIFO order, optionally in batches.
     """
     print("🧠 Segmentation Service Started...")
 
     config = load_config()
+    configure_tracing(config)
 
     base_shared_dir = config["base_shared_dir"]
     models_base_path = config["models_dir"]
@@ -91,53 +230,160 @@ def run_segmentation_service():
     check_interval = config.get("check_interval_seconds", 5)
     conf_threshold = config.get("confidence_threshold", 0.25)
     iou_threshold = config.get("iou_threshold", 0.5)
+    dedup_method = config.get("dedup_method", "first")
+    dedup_per_class = config.get("dedup_per_class", False)
+    batch_size = max(1, config.get("batch_size", 1))
+    batch_max_wait = config.get("batch_max_wait_ms", 200) / 1000.0
+    save_png_crops = config.get("save_png_crops", False)
+    save_crop_atlas = config.get("save_crop_atlas", False)
+    use_masks = config.get("use_masks", False)
+    decoded_handoff = config.get("decoded_image_handoff", "off")
+    cascade_enabled = config.get("cascade_enabled", False)
+    cascade_tiers = config.get("cascade_tiers") or None
+    cascade_threshold = config.get("cascade_score_threshold", 0.6)
 
-    # Load models
-    models = load_models(models_base_path=models_base_path)
+    enabled_models = config.get("enabled_models") or None
 
-    while True:
-        try:
-            shared_dir = find_latest_job_dir(base_shared_dir)
-            output_dir = os.path.join(shared_dir, output_subdir_name)
-
-            # Check if objects folder already exists and is non-empty
-            if os.path.exists(output_dir) and os.listdir(output_dir):
-                print(f"⚠️ Objects already exist for {shared_dir}. Skipping...")
-                time.sleep(check_interval)
-                continue
+    models, ensemble_pool = setup_models(config)
+    if ensemble_pool is not None and cascade_enabled:
+        print("⚠️ Cascade mode is not available with the process pool — running the full ensemble")
+        cascade_enabled = False
+
+    result_cache = None
+    if config.get("result_cache_enabled", False):
+        model_paths = {
+            suffix: path for suffix, path in discover_models(models_base_path).items()
+            if not enabled_models or suffix in enabled_models
+        }
+        settings = {
+            "confidence_threshold": conf_threshold,
+            "iou_threshold": iou_threshold,
+            "dedup_method": dedup_method,
+            "dedup_per_class": dedup_per_class,
+            "use_masks": use_masks,
+            "cascade": [cascade_threshold, cascade_tiers] if cascade_enabled else None,
+            "inference": [inference_settings(config), config.get("tile_merge_ios", 0.6)],
+        }
+        result_cache = ResultCache(
+            cache_dir=config.get("result_cache_dir", os.path.join(base_shared_dir, ".cache")),
+            versions_fingerprint=compute_versions_fingerprint(model_paths, settings),
+            output_subdir=output_subdir_name,
+            max_bytes=int(config.get("result_cache_max_mb", 2048) * 1024 * 1024),
+            link_mode=config.get("result_cache_link_mode", "hardlink"),
+            near_duplicate_distance=config.get("result_cache_near_duplicate_bits", 0),
+            # Entries also hold the later stages' outputs, so their versions count too
+            version_files=stage_version_files(
+                config.get("result_cache_stage_configs") or DEFAULT_STAGE_CONFIGS, STAGE_PATH_KEYS
+            )
+        )
+
+    job_store = JobStore(base_shared_dir)
+    if config.get("retention_enabled", True):
+        RetentionWorker(
+            job_store,
+            archive_after_seconds=config.get("archive_after_hours", 24) * 3600,
+            retention_seconds=config.get("retention_days", 0) * 86400,
+            interval_seconds=config.get("retention_interval_minutes", 10) * 60,
+            batch_size=config.get("archive_batch_size", 500)
+        ).start()
 
-            image_path = wait_for_uploaded_image(shared_dir, valid_extensions, check_interval)
-            image = load_image(image_path)
+    job_queue = JobQueue(
+        base_shared_dir=base_shared_dir,
+        valid_extensions=valid_extensions,
+        output_subdir=output_subdir_name,
+        lease_seconds=config.get("job_lease_seconds", 300),
+        scan_interval=config.get("job_scan_interval_seconds", 0.5),
+        use_inotify=config.get("use_inotify", True),
+        job_store=job_store,
+        max_attempts=config.get("job_max_attempts", 3),
+        retry_delay=config.get("job_retry_delay_seconds", 5)
+    )
+    job_queue.start()
 
-            all_boxes = []
+    while True:
+        batch = job_queue.get_batch(
+            max_batch_size=batch_size,
+            max_wait=batch_max_wait if batch_size > 1 else 0,
+            timeout=check_interval
+        )
+        if not batch:
+            continue
+
+        with job_trace([shared_dir for shared_dir, _ in batch], "segmentation", base_shared_dir):
+            jobs = []
+            for shared_dir, image_path in batch:
+                publish_event(shared_dir, "segmentation", STARTED)
+                try:
+                    image_bytes = None
+                    if result_cache is not None:
+                        with open(image_path, "rb") as f:
+                            image_bytes = f.read()
+                        cache_key = result_cache.lookup(image_bytes)
+                        if cache_key is not None:
+                            restored = result_cache.restore(
+                                cache_key, shared_dir, source_image=os.path.basename(image_path)
+                            )
+                            job_queue.complete(shared_dir)
+                            if "final_objects.json" in restored:
+                                job_store.set_state(shared_dir, FINISHED)
+                            for artifact, stage in CACHED_STAGE_OUTPUTS:
+                                if artifact in restored:
+                                    publish_event(shared_dir, stage, COMPLETED, cached=True)
+                            print(f"⚡ Cache hit for {shared_dir}: restored {', '.join(restored)}\n")
+                            continue
+                    if image_bytes is not None:
+                        image = decode_image_bytes(image_bytes, source=image_path)
+                    else:
+                        image = load_image(image_path)
+                    jobs.append((shared_dir, image_path, image, image_bytes))
+                except Exception as e:
+                    print(f"❌ Failed to load image for {shared_dir}: {e}")
+                    fail_job(job_queue, shared_dir, str(e))
 
-            # Run all models
-            for model_suffix, model in models.items():
-                bboxes = extract_bboxes(model, image, conf_threshold=conf_threshold)
-                for bbox in bboxes:
-                    all_boxes.append((bbox, model_suffix))
+            if not jobs:
+                continue
 
-            print(f"🧠 Total detections before filtering: {len(all_boxes)}")
+            if len(jobs) > 1:
+                print(f"📦 Running batched inference for {len(jobs)} jobs")
 
-            # Filter duplicate boxes
-            filtered_boxes = filter_duplicates(all_boxes, iou_threshold=iou_threshold)
-            print(f"🔍 After filtering duplicates: {len(filtered_boxes)} objects")
+            try:
+                outcomes = segment_images(
+                    [image for _, _, image, _ in jobs], models, config, ensemble_pool=ensemble_pool
+                )
+            except Exception as e:
+                print(f"❌ Error during segmentation service: {e}")
+                for shared_dir, _, _, _ in jobs:
+                    fail_job(job_queue, shared_dir, str(e))
+                continue
 
-            # Prepare output directory
-            os.makedirs(output_dir, exist_ok=True)
+            for (shared_dir, image_path, image, image_bytes), (filtered_boxes, telemetry) in zip(jobs, outcomes):
+                try:
+                    save_job_telemetry(shared_dir, telemetry)
+                    if decoded_handoff != "off":
+                        publish_decoded_image(
+                            image, shared_dir, mode=decoded_handoff,
+                            max_segments=config.get("decoded_image_max_segments", 8)
+                        )
 
-            # Save crops
-            for idx, (bbox, source_tag) in enumerate(filtered_boxes, start=1):
-                save_filename = f"obj_{idx:03}_{source_tag}.png"
-                save_path = os.path.join(output_dir, save_filename)
-                save_crop_from_bbox(image, bbox, save_path)
+                    with span("crop_saving"):
+                        save_crop_manifest(
+                            image, filtered_boxes, shared_dir,
+                            source_image=os.path.basename(image_path),
+                            output_subdir=output_subdir_name,
+                            save_png=save_png_crops,
+                            save_atlas=save_crop_atlas
+                        )
 
-            print("✅ Segmentation for job completed successfully!\n")
+                    if result_cache is not None:
+                        result_cache.store(image_bytes, shared_dir)
 
-        except Exception as e:
-            print(f"❌ Error during segmentation service: {e}")
-            time.sleep(5)
+                    job_queue.complete(shared_dir)
+                    publish_event(shared_dir, "segmentation", COMPLETED, num_objects=len(filtered_boxes))
+                    print("✅ Segmentation for job completed successfully!\n")
 
+                except Exception as e:
+                    print(f"❌ Error during segmentation service: {e}")
+                    fail_job(job_queue, shared_dir, str(e))
 
 if __name__ == "__main__":
     run_segmentation_service()
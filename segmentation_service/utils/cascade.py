@@ -0,0 +1,130 @@
+"""
+Module: cascade.py
+Purpose: Adaptive early-exit ensemble — run cheap models first, escalate only on low quality.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import List, Dict, Any, Tuple, Mapping, Optional
+
+from segmentation_service.utils.segmentor import detect_objects
+from segmentation_service.utils.iou_utils import filter_detections
+from segmentation_service.utils.scorer import score_segmentation
+
+DEFAULT_TIERS = [["n08"], ["n11", "n12"], ["s08", "s11", "s12"]]
+
+
+def build_tiers(models: Mapping[str, Any], tiers: Optional[List[List[str]]] = None) -> List[List[str]]:
+    """
+    Keeps only the configured tiers' models that are actually available.
+
+    Args:
+        models (Mapping[str, YOLO]): {model_suffix: YOLO model} (dict or ModelRegistry).
+        tiers (Optional[List[List[str]]]): Model suffixes per tier, cheapest first.
+
+    Returns:
+        List[List[str]]: Non-empty tiers. Available models missing from every tier
+        are appended as a final tier so the full ensemble is always reachable.
+    """
+    tiers = tiers or DEFAULT_TIERS
+    available = [[suffix for suffix in tier if suffix in models] for tier in tiers]
+    available = [tier for tier in available if tier]
+
+    covered = {suffix for tier in available for suffix in tier}
+    leftovers = [suffix for suffix in models if suffix not in covered]
+    if leftovers:
+        available.append(leftovers)
+    return available
+
+
+def detections_to_objects(detections: List[Tuple[Any, str, float, int]]) -> List[Dict[str, Any]]:
+    """
+    Converts filtered detections to the object dicts expected by `score_segmentation`.
+    """
+    return [
+        {"bbox": [float(v) for v in bbox], "confidence": float(confidence)}
+        for bbox, _, confidence, *_ in detections
+    ]
+
+
+def run_cascade(
+    models: Mapping[str, Any],
+    images: List[Any],
+    conf_threshold: float,
+    iou_threshold: float,
+    score_threshold: float = 0.6,
+    tiers: Optional[List[List[str]]] = None,
+    dedup_method: str = "nms",
+    per_class: bool = False,
+    max_batch_size: int = 1,
+    return_masks: bool = False,
+    scales: Optional[List[float]] = None
+) -> List[Tuple[List[Tuple[Any, str, float, int]], Dict[str, Any]]]:
+    """
+    Runs the ensemble tier by tier and stops early for images that already look good.
+
+    Tier detections accumulate: when an image escalates, the next tier's boxes are added
+    to the ones found so far and the combined set is deduplicated and re-scored. Only
+    images still below `score_threshold` are sent to the next tier.
+
+    Args:
+        models (Mapping[str, YOLO]): {model_suffix: YOLO model} (dict or ModelRegistry).
+        images (List[np.ndarray]): Loaded BGR images.
+        conf_threshold (float): Minimum confidence score to keep a detection.
+        iou_threshold (float): IoU threshold for duplicate removal.
+        score_threshold (float): Minimum `score_segmentation` value to stop escalating.
+        tiers (Optional[List[List[str]]]): Model suffixes per tier, cheapest first.
+        dedup_method (str): Method passed to `filter_detections`.
+        per_class (bool): Per-class deduplication.
+        max_batch_size (int): Maximum number of images per `predict` call.
+        return_masks (bool): Carry each detection's mask entry through to the result.
+        scales (Optional[List[float]]): Per image, its size / the original size when the
+            images are downscaled views (boxes are then scored by original-pixel area).
+
+    Returns:
+        List[Tuple[list, dict]]: Per image, the filtered detections and a telemetry dict
+        with the answering tier, the models used and the score after each tier.
+    """
+    tier_list = build_tiers(models, tiers)
+    raw: List[List[Tuple[Any, str, float, int]]] = [[] for _ in images]
+    results: List[Optional[Tuple[list, Dict[str, Any]]]] = [None for _ in images]
+    telemetry = [{"mode": "cascade", "tier_scores": [], "models_used": []} for _ in images]
+    active = list(range(len(images)))
+
+    for tier_idx, tier in enumerate(tier_list, start=1):
+        tier_models = {suffix: models[suffix] for suffix in tier}
+        tier_detections = detect_objects(
+            tier_models, [images[i] for i in active], conf_threshold,
+            max_batch_size=max_batch_size, return_masks=return_masks
+        )
+
+        still_active = []
+        for image_idx, detections in zip(active, tier_detections):
+            raw[image_idx].extend(detections)
+            filtered = filter_detections(
+                raw[image_idx], iou_threshold=iou_threshold, method=dedup_method, per_class=per_class
+            )
+            score = score_segmentation(
+                detections_to_objects(filtered), scale=scales[image_idx] if scales else 1.0
+            )
+
+            info = telemetry[image_idx]
+            info["models_used"].extend(tier)
+            info["tier_scores"].append(round(score, 4))
+            info["tier"] = tier_idx
+            info["score"] = round(score, 4)
+            results[image_idx] = (filtered, info)
+
+            if score < score_threshold:
+                still_active.append(image_idx)
+
+        active = still_active
+        if not active:
+            break
+
+    for image_idx in range(len(images)):
+        telemetry[image_idx]["num_tiers"] = len(tier_list)
+        telemetry[image_idx]["escalated_to_full"] = telemetry[image_idx].get("tier") == len(tier_list)
+        if results[image_idx] is None:
+            results[image_idx] = ([], telemetry[image_idx])
+
+    return results
@@ -5,10 +5,15 @@ Author: Itay Vazana (SoulSketch Project)
 """
 
 import os
+import json
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from segmentation_service.utils.image_utils import save_image, load_image
+from segmentation_service.utils.shared_image import attach_decoded_image
+
+MANIFEST_FILENAME = "segmented_objects.json"
+ATLAS_FILENAME = "crops_atlas.npy"
 
 def save_crops(
     objects: List[Dict[str, Any]],
@@ -72,28 +77,45 @@ def save_crops(
 
     return starting_index + len(objects)
 
-def save_crop_from_bbox(image: np.ndarray, bbox: np.ndarray, save_path: str) -> None:
+def clamp_bbox(bbox: np.ndarray, image_shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
     """
-    Save a simple crop from a bounding box area (no mask).
+    Converts a bbox to integer pixel coordinates clipped to the image.
 
     Args:
-        image (np.ndarray): The original loaded image (BGR).
         bbox (np.ndarray): Bounding box [x_min, y_min, x_max, y_max].
-        save_path (str): Full path to save the cropped image.
+        image_shape (Tuple[int, ...]): Shape of the image (h, w, ...).
+
+    Returns:
+        Optional[Tuple[int, int, int, int]]: Clipped (x_min, y_min, x_max, y_max), or None if empty.
     """
     x_min, y_min, x_max, y_max = map(int, bbox)
 
     # Sanity check for bbox coordinates
-    h, w = image.shape[:2]
+    h, w = image_shape[:2]
     x_min = max(0, min(w - 1, x_min))
     y_min = max(0, min(h - 1, y_min))
     x_max = max(0, min(w, x_max))
     y_max = max(0, min(h, y_max))
 
     if x_min >= x_max or y_min >= y_max:
+        return None
+    return x_min, y_min, x_max, y_max
+
+def save_crop_from_bbox(image: np.ndarray, bbox: np.ndarray, save_path: str) -> None:
+    """
+    Save a simple crop from a bounding box area (no mask).
+
+    Args:
+        image (np.ndarray): The original loaded image (BGR).
+        bbox (np.ndarray): Bounding box [x_min, y_min, x_max, y_max].
+        save_path (str): Full path to save the cropped image.
+    """
+    coords = clamp_bbox(bbox, image.shape)
+    if coords is None:
         print(f"⚠️ Skipping invalid bbox: {bbox}")
         return
 
+    x_min, y_min, x_max, y_max = coords
     crop = image[y_min:y_max, x_min:x_max]
 
     if crop.size == 0:
@@ -103,6 +125,236 @@ def save_crop_from_bbox(image: np.ndarray, bbox: np.ndarray, save_path: str) ->
     save_image(crop, save_path)
     print(f"✅ Saved crop to: {save_path}")
 
+def encode_mask(mask: np.ndarray) -> Dict[str, Any]:
+    """
+    Run-length encodes a boolean mask (row-major, counts start with a run of zeros).
+
+    Args:
+        mask (np.ndarray): 2-D boolean mask.
+
+    Returns:
+        Dict[str, Any]: {"encoding": "rle", "shape": [h, w], "counts": [...]}.
+    """
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return {"encoding": "rle", "shape": list(mask.shape), "counts": []}
+
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], change, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"encoding": "rle", "shape": list(mask.shape), "counts": counts.tolist()}
+
+def decode_mask(encoded: Dict[str, Any]) -> np.ndarray:
+    """
+    Decodes a mask produced by `encode_mask`.
+
+    Args:
+        encoded (Dict[str, Any]): Encoded mask.
+
+    Returns:
+        np.ndarray: 2-D boolean mask.
+    """
+    counts = np.asarray(encoded["counts"], dtype=np.int64)
+    values = (np.arange(len(counts)) % 2).astype(bool)
+    return np.repeat(values, counts).reshape(encoded["shape"])
+
+def apply_mask(crop: np.ndarray, mask: np.ndarray, background: int = 255) -> np.ndarray:
+    """
+    Replaces pixels outside the object mask with the background value.
+
+    Args:
+        crop (np.ndarray): BGR crop.
+        mask (np.ndarray): Boolean mask with the crop's height and width.
+        background (int): Fill value for pixels outside the mask (white paper by default).
+
+    Returns:
+        np.ndarray: Masked crop (new array).
+    """
+    return np.where(mask[..., None], crop, np.asarray(background, dtype=crop.dtype))
+
+def _align_mask(mask_entry: Any, coords: Tuple[int, int, int, int]) -> Optional[np.ndarray]:
+    """
+    Places a (mask window, x_min, y_min) entry into the frame of the final crop coordinates.
+    The window can differ from the crop when boxes were fused (WBF).
+    """
+    if mask_entry is None:
+        return None
+
+    window, win_x, win_y = mask_entry
+    x_min, y_min, x_max, y_max = coords
+    aligned = np.zeros((y_max - y_min, x_max - x_min), dtype=bool)
+
+    x0, y0 = max(x_min, win_x), max(y_min, win_y)
+    x1 = min(x_max, win_x + window.shape[1])
+    y1 = min(y_max, win_y + window.shape[0])
+    if x0 < x1 and y0 < y1:
+        aligned[y0 - y_min:y1 - y_min, x0 - x_min:x1 - x_min] = window[y0 - win_y:y1 - win_y, x0 - win_x:x1 - win_x]
+    return aligned
+
+def build_manifest_objects(
+    image: np.ndarray,
+    detections: List[Tuple[Any, ...]],
+    apply_masks: bool = True
+) -> List[Tuple[Dict[str, Any], np.ndarray]]:
+    """
+    Turns filtered detections into manifest objects and their crops, without touching disk.
+
+    Args:
+        image (np.ndarray): The original loaded image (BGR).
+        detections (List[Tuple[np.ndarray, str, float, int]]): (bbox, model_suffix, confidence, class_id),
+            optionally followed by a (mask window, x_min, y_min) entry.
+        apply_masks (bool): Blank out pixels outside each object's mask (mask mode only).
+            Unmasked crops are views into `image`.
+
+    Returns:
+        List[Tuple[Dict[str, Any], np.ndarray]]: (manifest object, BGR crop) pairs.
+    """
+    pairs = []
+    for idx, detection in enumerate(detections, start=1):
+        bbox, source_tag = detection[0], detection[1]
+        coords = clamp_bbox(bbox, image.shape)
+        if coords is None:
+            print(f"⚠️ Skipping invalid bbox: {bbox}")
+            continue
+
+        x_min, y_min, x_max, y_max = coords
+        obj = {
+            "object_id": f"obj_{idx:03}",
+            "source": source_tag,
+            "confidence": float(detection[2]) if len(detection) > 2 else None,
+            "class_id": int(detection[3]) if len(detection) > 3 else None,
+            "bounding_box": [x_min, y_min, x_max, y_max],
+            "center": [(x_min + x_max) // 2, (y_min + y_max) // 2],
+            "area": (x_max - x_min) * (y_max - y_min),
+            "cropped_image_path": None,
+        }
+
+        mask = _align_mask(detection[4], coords) if len(detection) > 4 else None
+        crop = image[y_min:y_max, x_min:x_max]
+        if mask is not None:
+            obj["mask"] = encode_mask(mask)
+            obj["pixel_area"] = int(np.count_nonzero(mask))
+            if apply_masks:
+                crop = apply_mask(crop, mask)
+
+        pairs.append((obj, crop))
+    return pairs
+
+def save_crop_manifest(
+    image: np.ndarray,
+    detections: List[Tuple[Any, ...]],
+    job_dir: str,
+    source_image: str,
+    output_subdir: str = "objects",
+    save_png: bool = False,
+    save_atlas: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Writes segmented_objects.json: one entry per detection with its bbox, score and
+    model suffix over the original uploaded image, instead of one PNG per object.
+
+    Downstream stages slice the crops straight from the decoded source image (or from the
+    optional memory-mapped crop atlas). PNG crops are only written in debug mode.
+    In mask mode each object also gets its RLE mask and true `pixel_area`, and the
+    PNG/atlas crops are masked.
+
+    Args:
+        image (np.ndarray): The original loaded image (BGR).
+        detections (List[Tuple[np.ndarray, str, float, int]]): (bbox, model_suffix, confidence, class_id),
+            optionally followed by a (mask window, x_min, y_min) entry.
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        source_image (str): File name of the uploaded image inside the job folder.
+        output_subdir (str): Folder for debug PNG crops.
+        save_png (bool): Also write obj_<index>_<model_suffix>.png crops.
+        save_atlas (bool): Also write all crops into one .npy atlas for zero-copy mmap reads.
+
+    Returns:
+        List[Dict[str, Any]]: The manifest objects.
+    """
+    objects = []
+    atlas_chunks = []
+    atlas_offset = 0
+
+    for obj, crop in build_manifest_objects(image, detections, apply_masks=save_png or save_atlas):
+        if save_png:
+            rel_path = os.path.join(output_subdir, f"{obj['object_id']}_{obj['source']}.png")
+            save_image(crop, os.path.join(job_dir, rel_path))
+            obj["cropped_image_path"] = rel_path
+
+        if save_atlas:
+            crop = np.ascontiguousarray(crop)
+            obj["atlas_offset"] = atlas_offset
+            obj["crop_shape"] = list(crop.shape)
+            atlas_chunks.append(crop.reshape(-1))
+            atlas_offset += crop.size
+
+        objects.append(obj)
+
+    manifest = {
+        "source_image": source_image,
+        "image_shape": list(image.shape),
+        "atlas": ATLAS_FILENAME if save_atlas else None,
+        "objects": objects,
+    }
+
+    if save_atlas:
+        atlas = np.concatenate(atlas_chunks) if atlas_chunks else np.empty(0, dtype=np.uint8)
+        np.save(os.path.join(job_dir, ATLAS_FILENAME), atlas)
+
+    tmp_path = os.path.join(job_dir, f".{MANIFEST_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(job_dir, MANIFEST_FILENAME))
+
+    print(f"✅ Saved crop manifest with {len(objects)} objects to: {job_dir}")
+    return objects
+
+def load_manifest_crops(
+    job_dir: str,
+    image: Optional[np.ndarray] = None,
+    apply_masks: bool = True
+) -> List[Tuple[Dict[str, Any], np.ndarray]]:
+    """
+    Reads segmented_objects.json and returns every object with its crop.
+
+    Crops come from the memory-mapped atlas when present, otherwise they are views
+    sliced from the source image — attached zero-copy from the shared decoded buffer
+    when the segmentation service published one, decoded once from disk otherwise.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        image (Optional[np.ndarray]): Already decoded source image, if the caller has it.
+        apply_masks (bool): Blank out pixels outside each object's mask (mask mode only;
+            atlas crops are stored masked already).
+
+    Returns:
+        List[Tuple[Dict[str, Any], np.ndarray]]: (manifest object, BGR crop) pairs.
+    """
+    with open(os.path.join(job_dir, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    objects = manifest.get("objects", [])
+    if manifest.get("atlas"):
+        atlas = np.load(os.path.join(job_dir, manifest["atlas"]), mmap_mode="r")
+        return [
+            (obj, atlas[obj["atlas_offset"]:obj["atlas_offset"] + int(np.prod(obj["crop_shape"]))]
+             .reshape(obj["crop_shape"]))
+            for obj in objects
+        ]
+
+    if image is None:
+        image = attach_decoded_image(job_dir, fallback_path=os.path.join(job_dir, manifest["source_image"]))
+
+    crops = []
+    for obj in objects:
+        x_min, y_min, x_max, y_max = obj["bounding_box"]
+        crop = image[y_min:y_max, x_min:x_max]
+        if apply_masks and obj.get("mask"):
+            crop = apply_mask(crop, decode_mask(obj["mask"]))
+        crops.append((obj, crop))
+    return crops
+
 if __name__ == "__main__":
     # No standalone test here
     pass
@@ -0,0 +1,269 @@
+"""
+Module: ensemble_pool.py
+Purpose: Run the YOLO ensemble in parallel by sharding models across worker processes.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import time
+import queue
+import itertools
+import multiprocessing as mp
+from typing import List, Dict, Tuple, Any, Optional
+
+from segmentation_service.utils.model_loader import discover_models
+
+# How often a wait for results checks that the workers it waits for are still alive
+LIVENESS_CHECK_SECONDS = 1.0
+
+
+def shard_models(model_suffixes: List[str], num_workers: int) -> List[List[str]]:
+    """
+    Splits the model suffixes into balanced shards.
+
+    Suffixes are dealt round-robin in canonical order, so nano and small models
+    (which differ a lot in cost) end up spread across the workers.
+
+    Args:
+        model_suffixes (List[str]): Suffixes in canonical order (e.g. n08 ... s12).
+        num_workers (int): Number of worker processes.
+
+    Returns:
+        List[List[str]]: One non-empty list of suffixes per worker.
+    """
+    num_workers = max(1, min(num_workers, len(model_suffixes)))
+    shards: List[List[str]] = [[] for _ in range(num_workers)]
+    for idx, suffix in enumerate(model_suffixes):
+        shards[idx % num_workers].append(suffix)
+    return shards
+
+
+def _worker_main(
+    worker_idx: int,
+    models_base_path: str,
+    suffixes: List[str],
+    torch_threads: int,
+    task_queue: "mp.Queue",
+    result_queue: "mp.Queue"
+) -> None:
+    """
+    Worker entry point: loads its models once and serves detection tasks until told to stop.
+    """
+    # Limit intra-op threads before torch is imported so workers don't oversubscribe cores
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+
+    import torch
+    torch.set_num_threads(torch_threads)
+
+    from segmentation_service.utils.model_loader import load_models
+    from segmentation_service.utils.segmentor import detect_objects
+
+    try:
+        models = load_models(models_base_path=models_base_path, suffixes=suffixes)
+    except Exception as e:
+        result_queue.put((None, worker_idx, RuntimeError(f"model loading failed: {e}")))
+        return
+    result_queue.put((None, worker_idx, list(models)))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        task_id, images, conf_threshold, max_batch_size, return_masks = task
+        try:
+            detections = detect_objects(
+                models, images, conf_threshold, max_batch_size=max_batch_size, return_masks=return_masks
+            )
+            result_queue.put((task_id, worker_idx, detections))
+        except Exception as e:
+            result_queue.put((task_id, worker_idx, RuntimeError(str(e))))
+
+
+class EnsemblePool:
+    """
+    Keeps one warm worker process per model shard and fans each job out to all of them.
+
+    Per-image detections are merged back in canonical model order, so the input to
+    `filter_detections` is the same as with the sequential ensemble.
+
+    Waits for workers are bounded: a worker that dies (e.g. killed for memory) or does
+    not answer within `task_timeout` seconds fails the current task, and the pool is
+    restarted so the next task gets a full set of warm workers.
+    """
+
+    def __init__(
+        self,
+        models_base_path: str,
+        num_workers: int = 3,
+        torch_threads: int = 1,
+        enabled_models: Optional[List[str]] = None,
+        task_timeout: float = 120.0,
+        start_timeout: float = 300.0
+    ):
+        self.models_base_path = models_base_path
+        self.enabled_models = enabled_models
+        self.num_workers = num_workers
+        self.torch_threads = max(1, torch_threads)
+        self.task_timeout = task_timeout
+        self.start_timeout = start_timeout
+
+        self.model_order: List[str] = []
+        self._workers: List[mp.Process] = []
+        self._task_queues: List["mp.Queue"] = []
+        self._result_queue: Optional["mp.Queue"] = None
+        self._task_ids = itertools.count()
+
+    def start(self) -> None:
+        """
+        Spawns the workers and waits until every one of them has loaded its models.
+
+        Raises:
+            RuntimeError: If no models are available or a worker fails, dies or does not
+                finish loading within `start_timeout` seconds.
+        """
+        self.model_order = [
+            suffix for suffix in discover_models(self.models_base_path)
+            if not self.enabled_models or suffix in self.enabled_models
+        ]
+        if not self.model_order:
+            raise RuntimeError(f"❌ No models found in {self.models_base_path}")
+
+        ctx = mp.get_context("spawn")
+        self._result_queue = ctx.Queue()
+        shards = shard_models(self.model_order, self.num_workers)
+
+        for worker_idx, suffixes in enumerate(shards):
+            task_queue = ctx.Queue()
+            worker = ctx.Process(
+                target=_worker_main,
+                args=(worker_idx, self.models_base_path, suffixes, self.torch_threads,
+                      task_queue, self._result_queue),
+                name=f"ensemble-worker-{worker_idx}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+            self._task_queues.append(task_queue)
+
+        try:
+            results = self._collect(None, self.start_timeout)
+        except RuntimeError as e:
+            self.close()
+            raise RuntimeError(f"❌ Ensemble pool failed to start: {e}")
+
+        loaded = []
+        for worker_idx, payload in sorted(results.items()):
+            if isinstance(payload, Exception):
+                self.close()
+                raise RuntimeError(f"❌ Ensemble worker {worker_idx} failed: {payload}")
+            loaded.extend(payload)
+            print(f"✅ Ensemble worker {worker_idx} ready with models: {', '.join(payload)}")
+
+        self.model_order = [suffix for suffix in self.model_order if suffix in loaded]
+        print(f"🔵 Ensemble pool started: {len(self._workers)} workers, "
+              f"{self.torch_threads} torch thread(s) each")
+
+    def detect(
+        self,
+        images: List[Any],
+        conf_threshold: float,
+        max_batch_size: int = 1,
+        return_masks: bool = False
+    ) -> List[List[Tuple[Any, str, float, int]]]:
+        """
+        Runs all models on the images in parallel (same contract as `detect_objects`).
+
+        Args:
+            images (List[np.ndarray]): Loaded BGR images.
+            conf_threshold (float): Minimum confidence score to keep a detection.
+            max_batch_size (int): Maximum number of images per `predict` call.
+            return_masks (bool): Append each detection's mask entry (segmentation models).
+
+        Returns:
+            List[List[Tuple[np.ndarray, str, float, int]]]: (bbox, model_suffix, confidence, class_id)
+        tuples per image.
+
+        Raises:
+            RuntimeError: If a worker fails, dies or times out (the pool is then restarted).
+        """
+        if not self._workers:
+            self.start()   # an earlier restart failed
+        task_id = next(self._task_ids)
+        for task_queue in self._task_queues:
+            task_queue.put((task_id, images, conf_threshold, max_batch_size, return_masks))
+
+        try:
+            results = self._collect(task_id, self.task_timeout)
+        except RuntimeError as e:
+            print(f"⚠️ Ensemble pool lost a worker ({e}) — restarting the pool")
+            self.close()
+            self.start()
+            raise RuntimeError(f"❌ Ensemble pool failed: {e}")
+
+        by_suffix: List[Dict[str, List[Tuple[Any, ...]]]] = [{} for _ in images]
+        error = None
+        for worker_idx, payload in sorted(results.items()):
+            if isinstance(payload, Exception):
+                error = f"worker {worker_idx}: {payload}"
+                continue
+            for image_groups, image_boxes in zip(by_suffix, payload):
+                for detection in image_boxes:
+                    image_groups.setdefault(detection[1], []).append(detection)
+
+        if error is not None:
+            raise RuntimeError(f"❌ Ensemble pool failed on {error}")
+
+        return [
+            [box for suffix in self.model_order for box in image_groups.get(suffix, [])]
+            for image_groups in by_suffix
+        ]
+
+    def _collect(self, task_id: Optional[int], timeout: float) -> Dict[int, Any]:
+        """
+        Waits for one result of `task_id` from every worker, checking regularly that the
+        workers still missing are alive. Results of earlier (abandoned) tasks are dropped.
+
+        Args:
+            task_id (Optional[int]): Task to wait for (None: the startup handshake).
+            timeout (float): Seconds to wait for all results.
+
+        Returns:
+            Dict[int, Any]: {worker index: payload}.
+
+        Raises:
+            RuntimeError: If a missing worker died or the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        results: Dict[int, Any] = {}
+        while len(results) < len(self._workers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                missing = sorted(set(range(len(self._workers))) - set(results))
+                raise RuntimeError(f"no result from worker(s) {missing} within {timeout:.0f}s")
+            try:
+                result_id, worker_idx, payload = self._result_queue.get(
+                    timeout=min(LIVENESS_CHECK_SECONDS, remaining)
+                )
+            except queue.Empty:
+                for worker_idx, worker in enumerate(self._workers):
+                    if worker_idx not in results and not worker.is_alive():
+                        raise RuntimeError(f"worker {worker_idx} died (exit code {worker.exitcode})")
+                continue
+            if result_id == task_id:
+                results[worker_idx] = payload
+        return results
+
+    def close(self) -> None:
+        """
+        Stops all workers.
+        """
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers.clear()
+        self._task_queues.clear()
@@ -8,6 +8,8 @@ import os
 import cv2
 import numpy as np
 
+from segmentation_service.utils.tracing import span
+
 
 def load_image(image_path: str) -> np.ndarray:
     """
@@ -25,13 +27,36 @@ def load_image(image_path: str) -> np.ndarray:
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"❌ Image file not found: {image_path}")
 
-    image = cv2.imread(image_path)
+    with span("image_decode"):
+        image = cv2.imread(image_path)
     if image is None:
         raise ValueError(f"❌ Failed to read image: {image_path}")
 
     return image
 
 
+def decode_image_bytes(image_bytes: bytes, source: str = "<bytes>") -> np.ndarray:
+    """
+    Decodes an already-read image file, avoiding a second read from disk.
+
+    Args:
+        image_bytes (bytes): Raw bytes of the image file.
+        source (str): Name used in error messages.
+
+    Returns:
+        np.ndarray: Decoded image in BGR format (OpenCV standard).
+
+    Raises:
+        ValueError: If the bytes cannot be decoded.
+    """
+    with span("image_decode"):
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"❌ Failed to read image: {source}")
+
+    return image
+
+
 def save_image(image: np.ndarray, save_path: str) -> None:
     """
     Saves an image array to a file path.
@@ -44,7 +69,8 @@ def save_image(image: np.ndarray, save_path: str) -> None:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    cv2.imwrite(save_path, image)
+    with span("image_encode"):
+        cv2.imwrite(save_path, image)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,259 @@
+"""
+Module: inference_prep.py
+Purpose: Resolution-adaptive inference input — one shared downscale or overlapping tiles — and mapping boxes back.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import math
+from typing import List, Dict, Any, Tuple
+
+import cv2
+import numpy as np
+
+from segmentation_service.utils.tracing import span
+
+
+class InferencePlan:
+    """
+    What the models see for one image: either a single (possibly downscaled) view or
+    overlapping tiles of the (possibly downscaled) image.
+
+    Attributes:
+        views (List[np.ndarray]): Images to run the models on.
+        offsets (List[Tuple[int, int]]): (x, y) of each view in the scaled image.
+        scale (float): Scaled size / original size (1.0 = original resolution).
+        tiled (bool): Whether the views are tiles.
+    """
+
+    def __init__(self, views: List[np.ndarray], offsets: List[Tuple[int, int]], scale: float, tiled: bool):
+        self.views = views
+        self.offsets = offsets
+        self.scale = scale
+        self.tiled = tiled
+
+
+def inference_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reads the preprocessing keys of the segmentation config (arguments of `plan_inference`).
+    """
+    return {
+        "max_side": config.get("inference_max_side", 0),
+        "tiling": config.get("tiling_enabled", False),
+        "tile_threshold": config.get("tile_threshold_side", 1920),
+        "tile_size": config.get("tile_size", 640),
+        "overlap": config.get("tile_overlap", 0.2),
+        "max_tiles": config.get("max_tiles", 16),
+    }
+
+
+def tile_origins(length: int, tile_size: int, stride: int) -> List[int]:
+    """
+    Start positions of tiles covering [0, length); the last tile is aligned to the end.
+    """
+    if length <= tile_size:
+        return [0]
+    count = 1 + math.ceil((length - tile_size) / stride)
+    return [min(i * stride, length - tile_size) for i in range(count)]
+
+
+def _resize(image: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return image
+    h, w = image.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def plan_inference(
+    image: np.ndarray,
+    max_side: int = 0,
+    tiling: bool = False,
+    tile_threshold: int = 1920,
+    tile_size: int = 640,
+    overlap: float = 0.2,
+    max_tiles: int = 16
+) -> InferencePlan:
+    """
+    Prepares the model input for one image, with a bounded cost whatever its size.
+
+    - Below the tiling threshold (or with tiling off) the image is downscaled once to
+      `max_side` (longest side), so every model of the ensemble gets the same small
+      image instead of letterbox-resizing the full scan itself.
+    - Above the threshold it is cut into overlapping `tile_size` tiles, so small objects
+      keep their resolution. If the grid would exceed `max_tiles`, the image is first
+      downscaled until it fits.
+
+    Args:
+        image (np.ndarray): Decoded BGR image (original resolution).
+        max_side (int): Longest side of the single view (0 = keep the original size).
+        tiling (bool): Enable tiled inference for large images.
+        tile_threshold (int): Longest side above which tiles are used.
+        tile_size (int): Tile side in pixels.
+        overlap (float): Fraction of a tile shared with its neighbour.
+        max_tiles (int): Maximum tiles per image.
+
+    Returns:
+        InferencePlan: The views and how to map their boxes back.
+    """
+    h, w = image.shape[:2]
+    longest = max(h, w)
+
+    with span("inference_prep", tiled=tiling and longest > tile_threshold):
+        if tiling and longest > tile_threshold:
+            stride = max(1, int(tile_size * (1 - overlap)))
+
+            def num_tiles(scale: float) -> int:
+                return len(tile_origins(int(round(w * scale)), tile_size, stride)) * \
+                    len(tile_origins(int(round(h * scale)), tile_size, stride))
+
+            scale = 1.0
+            if num_tiles(scale) > max(1, max_tiles):
+                low, high = min(1.0, tile_size / longest), 1.0
+                for _ in range(20):                      # largest scale whose grid fits
+                    mid = (low + high) / 2
+                    low, high = (mid, high) if num_tiles(mid) <= max_tiles else (low, mid)
+                scale = low
+
+            scaled = _resize(image, scale)
+            sh, sw = scaled.shape[:2]
+            views, offsets = [], []
+            for y0 in tile_origins(sh, tile_size, stride):
+                for x0 in tile_origins(sw, tile_size, stride):
+                    views.append(np.ascontiguousarray(scaled[y0:y0 + tile_size, x0:x0 + tile_size]))
+                    offsets.append((x0, y0))
+            return InferencePlan(views, offsets, scale, tiled=True)
+
+        scale = max_side / longest if max_side and longest > max_side else 1.0
+        return InferencePlan([_resize(image, scale)], [(0, 0)], scale, tiled=False)
+
+
+def _restore_mask(entry: Any, offset: Tuple[int, int], scale: float) -> Any:
+    """
+    Maps a (mask window, x_min, y_min) entry of a view back to original image pixels.
+    """
+    if entry is None:
+        return None
+    window, x_min, y_min = entry
+    x_min, y_min = x_min + offset[0], y_min + offset[1]
+    if scale == 1.0:
+        return window, x_min, y_min
+
+    size = (max(1, int(round(window.shape[1] / scale))), max(1, int(round(window.shape[0] / scale))))
+    resized = cv2.resize(window.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST).astype(bool)
+    return resized, int(round(x_min / scale)), int(round(y_min / scale))
+
+
+def restore_detections(
+    per_view: List[List[Tuple[Any, ...]]],
+    plan: InferencePlan,
+    merge_ios: float = 0.6,
+    per_class: bool = False
+) -> List[Tuple[Any, ...]]:
+    """
+    Maps the detections of every view back to original image coordinates (crops are cut
+    from the original image) and merges objects split across tiles.
+
+    Args:
+        per_view (List[List[Tuple]]): (bbox, model_suffix, confidence, class_id[, mask entry]) per view.
+        plan (InferencePlan): The plan the views came from.
+        merge_ios (float): Cross-tile merge threshold (see `merge_tile_detections`).
+        per_class (bool): Only merge boxes with the same class.
+
+    Returns:
+        List[Tuple]: Detections in original coordinates, in view order.
+    """
+    restored, tile_ids = [], []
+    for view_idx, (detections, offset) in enumerate(zip(per_view, plan.offsets)):
+        shift = np.array([offset[0], offset[1], offset[0], offset[1]], dtype=np.float64)
+        for detection in detections:
+            bbox = ((np.asarray(detection[0], dtype=np.float64) + shift) / plan.scale).astype(np.float32)
+            extra = tuple(detection[2:4])
+            if len(detection) > 4:
+                extra += (_restore_mask(detection[4], offset, plan.scale),) + tuple(detection[5:])
+            restored.append((bbox, detection[1], *extra))
+            tile_ids.append(view_idx)
+
+    if plan.tiled and len(plan.views) > 1:
+        return merge_tile_detections(restored, tile_ids, merge_ios, per_class)
+    return restored
+
+
+def merge_tile_detections(
+    detections: List[Tuple[Any, ...]],
+    tile_ids: List[int],
+    ios_threshold: float = 0.6,
+    per_class: bool = False
+) -> List[Tuple[Any, ...]]:
+    """
+    Merges boxes of the same object found in different tiles.
+
+    An object in the overlap band is seen by both tiles; an object crossing a tile
+    border is seen in pieces. Boxes from different tiles whose intersection covers more
+    than `ios_threshold` of the smaller box (intersection over smaller, so a clipped piece
+    still matches the whole) are greedily merged, most confident first, into their
+    union box (and mask) with the fields of the most confident member. Duplicates within one tile
+    are left for `filter_detections`.
+
+    Args:
+        detections (List[Tuple]): Detections in original coordinates.
+        tile_ids (List[int]): Tile index of each detection.
+        ios_threshold (float): Intersection-over-smaller threshold.
+        per_class (bool): Only merge boxes with the same class.
+
+    Returns:
+        List[Tuple]: Merged detections.
+    """
+    if len(detections) < 2:
+        return list(detections)
+
+    boxes = np.array([det[0] for det in detections], dtype=np.float64).reshape(-1, 4)
+    scores = np.array([det[2] for det in detections], dtype=np.float64)
+    tiles = np.asarray(tile_ids)
+
+    x_min = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y_min = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x_max = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y_max = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x_max - x_min, 0, None) * np.clip(y_max - y_min, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    ios = inter / (np.minimum(areas[:, None], areas[None, :]) + 1e-6)
+
+    candidates = (ios > ios_threshold) & (tiles[:, None] != tiles[None, :])
+    if per_class:
+        class_ids = np.array([det[3] for det in detections])
+        candidates &= class_ids[:, None] == class_ids[None, :]
+
+    merged = []
+    assigned = np.zeros(len(detections), dtype=bool)
+    for head in np.argsort(-scores, kind="stable"):
+        if assigned[head]:
+            continue
+        members = np.flatnonzero(candidates[head] & ~assigned)
+        assigned[head] = True
+        assigned[members] = True
+
+        group = boxes[np.append(members, head)]
+        union = np.array([group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max()], dtype=np.float32)
+        fields = list(detections[head][1:])
+        if len(fields) > 3 and len(members):
+            fields[3] = _union_mask([detections[idx] for idx in np.append(members, head)])
+        merged.append((union, *fields))
+    return merged
+
+
+def _union_mask(group: List[Tuple[Any, ...]]) -> Any:
+    """
+    ORs the mask entries of merged detections into one window covering all of them.
+    """
+    entries = [det[4] for det in group if len(det) > 4 and det[4] is not None]
+    if not entries:
+        return None
+    x_min = min(x for _, x, _ in entries)
+    y_min = min(y for _, _, y in entries)
+    x_max = max(x + window.shape[1] for window, x, _ in entries)
+    y_max = max(y + window.shape[0] for window, _, y in entries)
+
+    union = np.zeros((y_max - y_min, x_max - x_min), dtype=bool)
+    for window, x, y in entries:
+        union[y - y_min:y - y_min + window.shape[0], x - x_min:x - x_min + window.shape[1]] |= window.astype(bool)
+    return union, x_min, y_min
@@ -5,7 +5,11 @@ Author: Itay Vazana (SoulSketch Project)
 """
 
 import numpy as np
-from typing import List, Tuple
+from typing import List, Tuple, Optional
+
+from segmentation_service.utils.tracing import span, count
+
+DEDUP_METHODS = ("first", "nms", "wbf")
 
 def calculate_iou(boxA: np.ndarray, boxB: np.ndarray) -> float:
     """
@@ -30,12 +34,197 @@ def calculate_iou(boxA: np.ndarray, boxB: np.ndarray) -> float:
     iou = interArea / float(boxAArea + boxBArea - interArea + 1e-6)
     return iou
 
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Vectorized pairwise IoU (same formula as `calculate_iou`).
+
+    Args:
+        boxes_a (np.ndarray): Array of shape (N, 4) in [x_min, y_min, x_max, y_max].
+        boxes_b (np.ndarray): Array of shape (M, 4) in [x_min, y_min, x_max, y_max].
+
+    Returns:
+        np.ndarray: IoU matrix of shape (N, M).
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+
+    x_min = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y_min = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x_max = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y_max = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+
+    inter = np.clip(x_max - x_min, 0, None) * np.clip(y_max - y_min, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+def _offset_by_class(boxes: np.ndarray, class_ids: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Shifts boxes of different classes apart so they can never overlap (per-class NMS).
+    """
+    if class_ids is None or len(boxes) == 0:
+        return boxes
+    offset = boxes.max() + 1.0
+    return boxes + (np.asarray(class_ids, dtype=np.float64) * offset)[:, None]
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float = 0.5,
+    class_ids: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression over a precomputed IoU matrix.
+
+    Boxes are visited in descending score order (ties keep their input order); a box is
+    kept unless it overlaps an already kept box by more than `iou_threshold`.
+
+    Args:
+        boxes (np.ndarray): Array of shape (N, 4).
+        scores (np.ndarray): Array of shape (N,), higher is better.
+        iou_threshold (float): IoU above which two boxes are duplicates.
+        class_ids (Optional[np.ndarray]): If given, only boxes of the same class suppress each other.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, in descending score order.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    sorted_boxes = _offset_by_class(boxes, class_ids)[order]
+    overlaps = iou_matrix(sorted_boxes, sorted_boxes) > iou_threshold
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        suppressed[i + 1:] |= overlaps[i, i + 1:]
+
+    return order[~suppressed]
+
+def weighted_box_fusion(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float = 0.5,
+    class_ids: Optional[np.ndarray] = None,
+    num_sources: int = 1
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fuses overlapping ensemble boxes instead of discarding them.
+
+    Cluster heads are the boxes kept by `nms`; every other box joins the head it
+    overlaps most. Each cluster becomes one box whose coordinates are the
+    score-weighted mean of its members, with a score scaled by how many of the
+    `num_sources` models contributed.
+
+    Args:
+        boxes (np.ndarray): Array of shape (N, 4).
+        scores (np.ndarray): Array of shape (N,).
+        iou_threshold (float): IoU above which boxes belong to the same cluster.
+        class_ids (Optional[np.ndarray]): If given, only boxes of the same class are fused.
+        num_sources (int): Number of ensemble members (used for score scaling).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Fused boxes (K, 4), fused scores (K,),
+        and the index of each cluster's head box in the input (K,).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    heads = nms(boxes, scores, iou_threshold, class_ids)
+    if len(heads) == 0:
+        return np.empty((0, 4)), np.empty(0), heads
+
+    shifted = _offset_by_class(boxes, class_ids)
+    overlaps = iou_matrix(shifted, shifted[heads])
+    overlaps[heads, np.arange(len(heads))] = np.inf   # heads always belong to themselves
+    cluster = np.argmax(overlaps, axis=1)
+    member = overlaps[np.arange(len(boxes)), cluster] > iou_threshold
+
+    weights = np.where(member, scores, 0.0)
+    weight_sum = np.bincount(cluster, weights=weights, minlength=len(heads))
+    fused = np.zeros((len(heads), 4))
+    np.add.at(fused, cluster, boxes * weights[:, None])
+    fused /= np.maximum(weight_sum, 1e-12)[:, None]
+
+    counts = np.bincount(cluster, weights=member.astype(np.float64), minlength=len(heads))
+    fused_scores = (weight_sum / counts) * np.minimum(counts, num_sources) / max(num_sources, 1)
+
+    return fused, fused_scores, heads
+
+def filter_detections(
+    detections: List[Tuple[np.ndarray, str, float, int]],
+    iou_threshold: float = 0.5,
+    method: str = "nms",
+    per_class: bool = False
+) -> List[Tuple[np.ndarray, str, float, int]]:
+    """
+    Deduplicates ensemble detections.
+
+    Methods:
+    - "first": keep whichever box arrived first (original behaviour).
+    - "nms": keep the most confident box of each overlapping group.
+    - "wbf": fuse each overlapping group into one score-weighted box, tagged with
+      the model suffix (and mask, if any) of its most confident member.
+
+    Args:
+        detections (List[Tuple[np.ndarray, str, float, int]]): (bbox, model_suffix, confidence, class_id),
+            optionally followed by extra fields (e.g. a mask) that are carried through.
+        iou_threshold (float): IoU above which two boxes are duplicates.
+        method (str): One of "first", "nms", "wbf".
+        per_class (bool): Only deduplicate boxes with the same predicted class.
+
+    Returns:
+        List[Tuple[np.ndarray, str, float, int]]: Filtered detections.
+    """
+    if method not in DEDUP_METHODS:
+        raise ValueError(f"❌ Unknown dedup method: {method} (expected one of {DEDUP_METHODS})")
+    if not detections:
+        return []
+
+    with span("iou_filter", method=method):
+        kept = _filter_detections(detections, iou_threshold, method, per_class)
+    count("soulsketch_detections_before_dedup_total", len(detections), method=method)
+    count("soulsketch_detections_after_dedup_total", len(kept), method=method)
+    return kept
+
+def _filter_detections(
+    detections: List[Tuple[np.ndarray, str, float, int]],
+    iou_threshold: float,
+    method: str,
+    per_class: bool
+) -> List[Tuple[np.ndarray, str, float, int]]:
+    boxes = np.array([det[0] for det in detections], dtype=np.float64).reshape(-1, 4)
+    scores = np.array([det[2] for det in detections], dtype=np.float64)
+    class_ids = np.array([det[3] for det in detections]) if per_class else None
+
+    if method == "first":
+        keep = nms(boxes, -np.arange(len(detections), dtype=np.float64), iou_threshold, class_ids)
+        return [detections[i] for i in sorted(keep)]
+
+    if method == "nms":
+        keep = nms(boxes, scores, iou_threshold, class_ids)
+        return [detections[i] for i in keep]
+
+    num_sources = len({det[1] for det in detections})
+    fused, fused_scores, heads = weighted_box_fusion(
+        boxes, scores, iou_threshold, class_ids, num_sources=num_sources
+    )
+    return [
+        (fused[k].astype(np.float32), detections[head][1], float(fused_scores[k]), detections[head][3],
+         *detections[head][4:])
+        for k, head in enumerate(heads)
+    ]
+
 def filter_duplicates(
     boxes_sources: List[Tuple[np.ndarray, str]],
     iou_threshold: float = 0.5
 ) -> List[Tuple[np.ndarray, str]]:
     """
     Filter out duplicate bounding boxes based on IoU threshold.
+    (Compatibility wrapper — first-arrival wins, computed with the vectorized IoU matrix.)
 
     Args:
         boxes_sources (List[Tuple[np.ndarray, str]]): List of (bbox, model_source_tag).
@@ -44,17 +233,8 @@ def filter_duplicates(
     Returns:
         List[Tuple[np.ndarray, str]]: Filtered list of boxes.
     """
-    filtered = []
-    for box_src in boxes_sources:
-        box, src = box_src
-        duplicate = False
-        for kept_box, _ in filtered:
-            if calculate_iou(box, kept_box) > iou_threshold:
-                duplicate = True
-                break
-        if not duplicate:
-            filtered.append((box, src))
-    return filtered
+    detections = [(box, src, 0.0, 0) for box, src in boxes_sources]
+    return [(box, src) for box, src, _, _ in filter_detections(detections, iou_threshold, method="first")]
 
 if __name__ == "__main__":
     # No standalone test here — used internally
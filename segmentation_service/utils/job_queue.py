@@ -0,0 +1,475 @@
+"""
+Module: job_queue.py
+Purpose: Event-driven FIFO intake of job_<uuid> folders with claim/lease files.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import threading
+from typing import List, Optional, Tuple, Dict
+
+from segmentation_service.utils.job_store import JobStore, INDEX_FILENAME, CREATED, UPLOADED, SEGMENTED
+from segmentation_service.utils.stage_claims import claim_job
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Linux-only optional dependency — fall back to scanning
+    INotify = None
+    inotify_flags = None
+
+CLAIM_FILENAME = ".claim"
+DONE_FILENAME = ".done"
+INDEX_QUERY_LIMIT = 10000
+
+
+def find_uploaded_image(job_dir: str, valid_extensions: List[str]) -> Optional[str]:
+    """
+    Returns the uploaded image inside a job folder, if one exists.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        valid_extensions (List[str]): List of accepted image file extensions.
+
+    Returns:
+        Optional[str]: Path to the image, or None if nothing was uploaded yet.
+    """
+    try:
+        entries = os.listdir(job_dir)
+    except FileNotFoundError:
+        return None
+
+    for file in sorted(entries):
+        if file.startswith("."):
+            continue
+        if any(file.lower().endswith(ext) for ext in valid_extensions):
+            return os.path.join(job_dir, file)
+    return None
+
+
+def is_job_done(job_dir: str, output_subdir: str) -> bool:
+    """
+    Checks whether a job was already processed (done marker or non-empty output folder).
+
+    Args:
+        job_dir (str): Path to the job folder.
+        output_subdir (str): Name of the crops subfolder.
+
+    Returns:
+        bool: True if the job should not be processed again.
+    """
+    if os.path.exists(os.path.join(job_dir, DONE_FILENAME)):
+        return True
+    output_dir = os.path.join(job_dir, output_subdir)
+    return os.path.isdir(output_dir) and bool(os.listdir(output_dir))
+
+
+class JobQueue:
+    """
+    Hands every new job to the service exactly once, in arrival order.
+
+    New jobs are detected with inotify when `inotify_simple` is installed (O(1) per event)
+    and by a lightweight periodic check otherwise. A job is only queued once its uploaded
+    image is fully written. Before processing, a job is claimed by atomically creating a
+    `.claim` lease file, so several service replicas can share one volume; leases older
+    than `lease_seconds` are considered stale and may be re-claimed.
+
+    With a `job_store`, the index says which jobs are ready (the backend marks a job
+    "uploaded" once its image is in place) and inotify on the index only wakes the queue
+    up: every commit touches shared/jobs/index.sqlite*, so a new upload is picked up
+    as soon as it is recorded, with no polling. Job folders dropped straight into shared/
+    (no index row) are still followed and registered as "uploaded" once their image is
+    complete. Completed jobs move to "segmented".
+
+    The queue only remembers jobs in flight in this process (queued, claimed or waiting
+    for a retry): a job is forgotten once it completes or gives up, and with a job store
+    every index check also drops jobs that are no longer "uploaded" (e.g. taken by
+    another replica). The `.claim` lease and the index state prevent re-processing.
+
+    A job released after a failure is retried after `retry_delay` seconds (doubling per
+    attempt). After `max_attempts` failures it is marked "failed" in the job index, so a
+    poison job is not retried forever, nor again after a restart.
+    """
+
+    def __init__(
+        self,
+        base_shared_dir: str,
+        valid_extensions: List[str],
+        output_subdir: str = "objects",
+        lease_seconds: int = 300,
+        scan_interval: float = 1.0,
+        use_inotify: bool = True,
+        job_store: Optional[JobStore] = None,
+        max_attempts: int = 3,
+        retry_delay: float = 5.0
+    ):
+        self.base_shared_dir = base_shared_dir
+        self.valid_extensions = valid_extensions
+        self.output_subdir = output_subdir
+        self.lease_seconds = lease_seconds
+        self.scan_interval = scan_interval
+        self.job_store = job_store
+        self.use_inotify = use_inotify and INotify is not None
+        self.resync_interval = max(30.0, scan_interval)   # safety re-check of the index with inotify
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+
+        self._ready: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._known = set()      # job dirs in flight here (queued, claimed or waiting for a retry)
+        self._seen = set()       # job_* entries of shared/ at the last scan (scan mode)
+        self._pending = {}       # job dir -> last seen image size (waiting for upload)
+        self._retry_at = {}      # job dir -> monotonic time of its next attempt
+        self._failures = {}      # job dir -> failed attempts (without a job store)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    # ------------------------------------------------------------------ #
+    # Lifecycle
+    # ------------------------------------------------------------------ #
+
+    def start(self) -> None:
+        """
+        Recovers the existing backlog (oldest first) and starts the watcher thread.
+        """
+        os.makedirs(self.base_shared_dir, exist_ok=True)
+
+        if self.use_inotify:
+            # Register the watches before recovering so nothing slips between the two.
+            self._inotify = INotify()
+            self._wd_to_dir: Dict[int, str] = {}
+            base_mask = inotify_flags.CREATE | inotify_flags.MOVED_TO | inotify_flags.ONLYDIR
+            self._base_wd = self._inotify.add_watch(self.base_shared_dir, base_mask)
+            self._index_wd = None
+            if self.job_store is not None:
+                index_mask = inotify_flags.MODIFY | inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+                self._index_wd = self._inotify.add_watch(self.job_store.jobs_dir, index_mask)
+
+        # Indexed uploads first, then folders dropped into shared/ without an index row
+        backlog = self.job_store.job_dirs([UPLOADED]) if self.job_store is not None else []
+        indexed = set(backlog)
+        entries = [
+            (entry.stat().st_mtime, entry.path) for entry in os.scandir(self.base_shared_dir)
+            if entry.is_dir() and entry.name.startswith("job_")
+        ]
+        if not self.use_inotify:
+            self._seen = {path for _, path in entries}
+        backlog += [path for _, path in sorted(entries) if path not in indexed]
+
+        for job_dir in backlog:
+            if is_job_done(job_dir, self.output_subdir):
+                if self.job_store is not None:
+                    self.job_store.set_state(job_dir, SEGMENTED)   # done before the index was updated
+                continue
+            self._track_job_dir(job_dir, trust_existing=True)
+
+        mode = "inotify" if self.use_inotify else "scan"
+        print(f"📋 Job queue recovered {self._ready.qsize()} pending job(s) ({mode} mode)")
+
+        target = self._watch_inotify if self.use_inotify else self._watch_scan
+        self._thread = threading.Thread(target=target, name="job-queue-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the watcher thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.scan_interval + 1)
+
+    # ------------------------------------------------------------------ #
+    # Consumer API
+    # ------------------------------------------------------------------ #
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Blocks until the next job is ready and claimed by this process.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, or None to wait forever.
+
+        Returns:
+            Optional[Tuple[str, str]]: (job_dir, image_path), or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                job_dir, image_path = self._ready.get(timeout=remaining)
+            except queue.Empty:
+                return None
+
+            if is_job_done(job_dir, self.output_subdir):
+                self._forget(job_dir)
+                continue
+            if self.claim(job_dir):
+                print(f"📂 Job claimed: {job_dir}")
+                return job_dir, image_path
+
+    def get_batch(
+        self,
+        max_batch_size: int,
+        max_wait: float,
+        timeout: Optional[float] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Blocks for the first job, then keeps collecting jobs for up to `max_wait`
+        seconds or until `max_batch_size` jobs are claimed.
+
+        Args:
+            max_batch_size (int): Maximum number of jobs to return.
+            max_wait (float): Seconds to wait for more jobs after the first one.
+            timeout (Optional[float]): Seconds to wait for the first job.
+
+        Returns:
+            List[Tuple[str, str]]: Claimed (job_dir, image_path) pairs in FIFO order.
+        """
+        first = self.get(timeout=timeout)
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            job = self.get(timeout=remaining)
+            if job is None:
+                break
+            batch.append(job)
+        return batch
+
+    def claim(self, job_dir: str) -> bool:
+        """
+        Atomically claims a job by creating its lease file (stale leases are taken over).
+
+        Args:
+            job_dir (str): Path to the job folder.
+
+        Returns:
+            bool: True if this process now owns the job.
+        """
+        if claim_job(job_dir, CLAIM_FILENAME, self.lease_seconds, owner=self._owner):
+            return True
+        if os.path.isdir(job_dir):
+            print(f"⚠️ Job already claimed by another worker: {job_dir}")
+        return False
+
+    def complete(self, job_dir: str) -> None:
+        """
+        Marks a claimed job as done and releases its lease.
+
+        Args:
+            job_dir (str): Path to the job folder.
+        """
+        with open(os.path.join(job_dir, DONE_FILENAME), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"owner": self._owner, "completed_at": time.time()}))
+        if self.job_store is not None:
+            self.job_store.set_state(job_dir, SEGMENTED)
+        self._remove_claim(job_dir)
+        self._forget(job_dir)
+
+    def release(self, job_dir: str, error: str = "") -> bool:
+        """
+        Releases a claimed job after a failure. The job is queued again after a backoff
+        delay, or marked "failed" for good once it used up `max_attempts`.
+
+        Args:
+            job_dir (str): Path to the job folder.
+            error (str): What went wrong (kept in the job index).
+
+        Returns:
+            bool: True if the job will be retried.
+        """
+        self._remove_claim(job_dir)
+        if self.job_store is not None:
+            attempts = self.job_store.record_failure(job_dir, error, self.max_attempts, self.retry_delay)
+        else:
+            attempts = self._failures[job_dir] = self._failures.get(job_dir, 0) + 1
+
+        if attempts >= self.max_attempts:
+            print(f"❌ Job failed {attempts} time(s), giving up: {job_dir}")
+            with self._lock:
+                self._known.discard(job_dir)
+            return False
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        with self._lock:
+            self._retry_at[job_dir] = time.monotonic() + delay
+        print(f"🔁 Job failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {job_dir}")
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+
+    def _remove_claim(self, job_dir: str) -> None:
+        try:
+            os.remove(os.path.join(job_dir, CLAIM_FILENAME))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, job_dir: str) -> None:
+        # The job left this process for good (completed or done elsewhere)
+        with self._lock:
+            self._known.discard(job_dir)
+            self._failures.pop(job_dir, None)
+
+    def _enqueue(self, job_dir: str, image_path: str) -> None:
+        with self._lock:
+            if job_dir in self._known:
+                return
+            self._pending.pop(job_dir, None)
+        self._unwatch(job_dir)
+
+        if self.job_store is not None:
+            # A folder dropped into shared/ by hand gets its index row once the image is complete
+            record = self.job_store.get(job_dir)
+            if record is None or record["state"] == CREATED:
+                self.job_store.set_state(job_dir, UPLOADED)
+            elif record["state"] != UPLOADED:
+                return
+
+        with self._lock:
+            if job_dir in self._known:
+                return
+            self._known.add(job_dir)
+        self._ready.put((job_dir, image_path))
+        print(f"📥 Job queued: {job_dir}")
+
+    def _unwatch(self, job_dir: str) -> None:
+        if not self.use_inotify:
+            return
+        for wd, watched_dir in list(self._wd_to_dir.items()):
+            if watched_dir == job_dir:
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    pass
+                self._wd_to_dir.pop(wd, None)
+
+    def _track_job_dir(self, job_dir: str, trust_existing: bool = False) -> None:
+        """
+        Starts following a job folder. Images found by listing (rather than by a
+        close/rename event) are only queued once their size is stable, unless they
+        were already on disk when the service started.
+        """
+        image_path = find_uploaded_image(job_dir, self.valid_extensions)
+        if image_path is not None and (trust_existing or self._is_stable(job_dir, image_path)):
+            self._enqueue(job_dir, image_path)
+            return
+
+        # Still uploading: watch the folder (an image landing before the watch is
+        # registered is caught by the pending sweep)
+        if self.use_inotify and job_dir not in self._wd_to_dir.values():
+            dir_mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+            try:
+                wd = self._inotify.add_watch(job_dir, dir_mask)
+                self._wd_to_dir[wd] = job_dir
+            except OSError:
+                return
+        with self._lock:
+            self._pending.setdefault(job_dir, -1)
+
+    def _is_stable(self, job_dir: str, image_path: str) -> bool:
+        """
+        An image found by listing counts as uploaded once its size stops changing.
+        """
+        try:
+            size = os.path.getsize(image_path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            previous = self._pending.get(job_dir)
+            self._pending[job_dir] = size
+        return previous == size and size > 0
+
+    def _watch_inotify(self) -> None:
+        timeout_ms = int(self.scan_interval * 1000)
+        last_index_check = time.monotonic()
+        while not self._stop.is_set():
+            index_changed = False
+            for event in self._inotify.read(timeout=timeout_ms):
+                if event.wd == self._base_wd:
+                    if event.name.startswith("job_"):
+                        self._track_job_dir(os.path.join(self.base_shared_dir, event.name))
+                    continue
+                if event.wd == self._index_wd:
+                    # index.sqlite, -wal or -shm: some service committed a state change
+                    index_changed = index_changed or event.name.startswith(INDEX_FILENAME)
+                    continue
+
+                job_dir = self._wd_to_dir.get(event.wd)
+                if job_dir is None or job_dir in self._known:
+                    continue
+                if any(event.name.lower().endswith(ext) for ext in self.valid_extensions):
+                    self._enqueue(job_dir, os.path.join(job_dir, event.name))
+
+            # One query per burst of index writes (plus a rare safety re-check)
+            if index_changed or time.monotonic() - last_index_check >= self.resync_interval:
+                last_index_check = time.monotonic()
+                self._check_index()
+            self._sweep_pending()
+
+    def _sweep_pending(self) -> None:
+        with self._lock:
+            pending_dirs = list(self._pending)
+            now = time.monotonic()
+            due = [job_dir for job_dir, retry_at in self._retry_at.items() if retry_at <= now]
+            for job_dir in due:
+                del self._retry_at[job_dir]
+                self._known.discard(job_dir)
+
+        for job_dir in pending_dirs:
+            image_path = find_uploaded_image(job_dir, self.valid_extensions)
+            if image_path is not None and self._is_stable(job_dir, image_path):
+                self._enqueue(job_dir, image_path)
+        for job_dir in due:
+            self._track_job_dir(job_dir, trust_existing=True)
+
+    def _check_index(self) -> None:
+        # The backend marks a job "uploaded" only after the image was renamed into place
+        if self.job_store is None:
+            return
+        try:
+            job_dirs = self.job_store.job_dirs([UPLOADED], limit=INDEX_QUERY_LIMIT)
+        except Exception as e:
+            print(f"⚠️ Job index query failed: {e}")
+            return
+        if len(job_dirs) < INDEX_QUERY_LIMIT:
+            # Jobs in flight here are still "uploaded" (or waiting for their retry)
+            with self._lock:
+                self._known.intersection_update(set(job_dirs).union(self._retry_at))
+        for job_dir in job_dirs:
+            if job_dir not in self._known and job_dir not in self._pending:
+                self._track_job_dir(job_dir, trust_existing=True)
+
+    def _watch_scan(self) -> None:
+        while not self._stop.wait(self.scan_interval):
+            self._check_index()
+            try:
+                entries = os.scandir(self.base_shared_dir)
+            except FileNotFoundError:
+                continue
+
+            # Only folders that appeared since the last scan are followed (like inotify's
+            # CREATE events); the set holds what is in shared/ now, so it stays bounded
+            present, new_dirs = set(), []
+            for entry in entries:
+                if not entry.name.startswith("job_"):
+                    continue
+                present.add(entry.path)
+                if entry.path in self._seen or entry.path in self._known or entry.path in self._pending:
+                    continue
+                if entry.is_dir():
+                    new_dirs.append((entry.stat().st_mtime, entry.path))
+            self._seen = present
+
+            for _, job_dir in sorted(new_dirs):
+                self._track_job_dir(job_dir)
+            self._sweep_pending()
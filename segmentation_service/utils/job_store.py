@@ -0,0 +1,585 @@
+"""
+Module: job_store.py
+Purpose: Hash-sharded job folders with a SQLite state index, plus archiving and expiry of old jobs.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import zipfile
+import hashlib
+import argparse
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows — the retention worker then runs unlocked
+    fcntl = None
+
+JOBS_DIRNAME = "jobs"
+INDEX_FILENAME = "index.sqlite"
+ARCHIVE_DIRNAME = "archive"
+RETENTION_LOCK_FILENAME = ".retention.lock"
+
+# Job lifecycle in the index ("failed": a stage gave up after its retry budget)
+CREATED, UPLOADED, SEGMENTED, FINISHED, ARCHIVED = "created", "uploaded", "segmented", "finished", "archived"
+FAILED = "failed"
+JOB_STATES = (CREATED, UPLOADED, SEGMENTED, FINISHED, ARCHIVED, FAILED)
+
+# Already-compressed outputs are stored as is; everything else is deflated
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".pdf", ".npy", ".raw")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    archive TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL,
+    error TEXT,
+    finish_seq INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created_at);
+CREATE INDEX IF NOT EXISTS jobs_state_finished ON jobs (state, finished_at);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+"""
+
+# Columns added after the first release (indexes created before them are upgraded in place)
+ADDED_COLUMNS = {
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "retry_at": "REAL",
+    "error": "TEXT",
+    "finish_seq": "INTEGER",
+}
+
+# Next finishing sequence number, taken inside the write transaction (writers are serialized)
+NEXT_FINISH_SEQ = "(SELECT COALESCE(MAX(finish_seq), 0) + 1 FROM jobs)"
+
+
+def bare_job_id(job_id: str) -> str:
+    """
+    Accepts "<id>", "job_<id>" or a job folder path and returns "<id>".
+    """
+    name = os.path.basename(os.path.normpath(job_id))
+    return name[len("job_"):] if name.startswith("job_") else name
+
+
+def shard_dir(base_shared_dir: str, job_id: str) -> str:
+    """
+    Sharded folder of a job: shared/jobs/<aa>/<bb>/job_<id>/, where aabb are the first
+    hex digits of the id's SHA-1. 65536 leaf folders keep every directory small, so
+    creating or looking up a job costs the same with a hundred or a million jobs.
+    """
+    job_id = bare_job_id(job_id)
+    digest = hashlib.sha1(job_id.encode("utf-8")).hexdigest()
+    return os.path.join(base_shared_dir, JOBS_DIRNAME, digest[:2], digest[2:4], f"job_{job_id}")
+
+
+def resolve_job_dir(base_shared_dir: str, job_id: str) -> str:
+    """
+    Folder of an existing job: the sharded location, or shared/job_<id>/ for jobs created
+    before sharding (not migrated yet). Returns the sharded path if neither exists.
+    """
+    path = shard_dir(base_shared_dir, job_id)
+    if os.path.isdir(path):
+        return path
+    legacy_path = os.path.join(base_shared_dir, f"job_{bare_job_id(job_id)}")
+    return legacy_path if os.path.isdir(legacy_path) else path
+
+
+class JobStore:
+    """
+    Job folders under shared/jobs/ plus shared/jobs/index.sqlite with each job's state
+    and timestamps.
+
+    Services find their work with an indexed query on the state ("all segmented jobs")
+    instead of listing and stat-ing every job folder, so polling costs grow with the
+    number of jobs in flight, not with the history kept on the volume. Finished jobs are
+    compacted into zip archives by `RetentionWorker` and deleted once expired.
+
+    The index is shared by all containers on the volume (WAL mode, one connection per
+    thread). The backend uses this class too (backend/app/services/storage.py).
+    """
+
+    def __init__(self, base_shared_dir: str):
+        self.base_shared_dir = base_shared_dir
+        self.jobs_dir = os.path.join(base_shared_dir, JOBS_DIRNAME)
+        self.archive_dir = os.path.join(self.jobs_dir, ARCHIVE_DIRNAME)
+        self.index_path = os.path.join(self.jobs_dir, INDEX_FILENAME)
+        self._local = threading.local()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ #
+    # Index
+    # ------------------------------------------------------------------ #
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+                    except sqlite3.OperationalError:
+                        continue   # added concurrently by another process
+                    if name == "finish_seq":
+                        self._number_finished_jobs(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finish_seq ON jobs (finish_seq)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _number_finished_jobs(conn: sqlite3.Connection) -> None:
+        # Indexes created before finish_seq: number the jobs finished so far in finishing order
+        rows = conn.execute(
+            "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at, job_id"
+        ).fetchall()
+        with conn:
+            conn.executemany(
+                "UPDATE jobs SET finish_seq = ? WHERE job_id = ?",
+                ((seq, row["job_id"]) for seq, row in enumerate(rows, start=1))
+            )
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def job_dir(self, job_id: str) -> str:
+        return resolve_job_dir(self.base_shared_dir, job_id)
+
+    def create(self, job_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Creates a sharded job folder and registers it as "created".
+
+        Returns:
+            Tuple[str, str]: (job id, job folder).
+        """
+        job_id = bare_job_id(job_id) if job_id else str(uuid.uuid4())
+        job_dir = shard_dir(self.base_shared_dir, job_id)
+        os.makedirs(job_dir)
+        self.register(job_id, CREATED)
+        return job_id, job_dir
+
+    def register(self, job_id: str, state: str, created_at: Optional[float] = None) -> None:
+        """
+        Adds a job to the index (or resets the state of a known one).
+        """
+        now, finished = time.time(), state == FINISHED
+        with self.db:
+            self.db.execute(
+                "INSERT INTO jobs (job_id, state, created_at, updated_at, finished_at, finish_seq) "
+                f"VALUES (?, ?, ?, ?, ?, CASE WHEN ? THEN {NEXT_FINISH_SEQ} END) "
+                "ON CONFLICT (job_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, "
+                "finished_at = excluded.finished_at, finish_seq = excluded.finish_seq",
+                (bare_job_id(job_id), state, created_at or now, now, now if finished else None, finished)
+            )
+
+    def set_state(self, job_id: str, state: str) -> None:
+        """
+        Moves a job (id or folder) to a new state. Unknown jobs are registered. Moving to
+        another state resets the job's failure count.
+
+        Finishing a job also gives it the next `finish_seq`. Unlike finished_at (a clock
+        read before the write lock, by several processes), the sequence grows in commit
+        order, so `finished_after` never returns a job behind one it already returned.
+        """
+        job_id, now, finished = bare_job_id(job_id), time.time(), state == FINISHED
+        with self.db:
+            cursor = self.db.execute(
+                "UPDATE jobs SET finished_at = CASE WHEN ? THEN ? ELSE finished_at END, "
+                f"finish_seq = CASE WHEN ? THEN {NEXT_FINISH_SEQ} ELSE finish_seq END, "
+                "attempts = CASE WHEN state = ? THEN attempts ELSE 0 END, "
+                "retry_at = CASE WHEN state = ? THEN retry_at ELSE NULL END, "
+                "state = ?, updated_at = ? WHERE job_id = ?",
+                (finished, now, finished, state, state, state, now, job_id)
+            )
+        if cursor.rowcount == 0:
+            self.register(job_id, state)
+
+    def record_failure(self, job_id: str, error: str, max_attempts: int = 3, retry_delay: float = 5.0) -> int:
+        """
+        Counts a failed attempt at the job's current stage. The job is hidden from
+        `list_jobs` for `retry_delay` seconds (doubling with every attempt); once
+        `max_attempts` attempts failed it moves to "failed" and is never picked up again.
+
+        Returns:
+            int: Failed attempts so far (>= max_attempts: the job gave up).
+        """
+        job_id, now = bare_job_id(job_id), time.time()
+        with self.db:
+            self.db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, error = ?, updated_at = ? WHERE job_id = ?",
+                (error, now, job_id)
+            )
+            row = self.db.execute("SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return max_attempts
+            attempts = row["attempts"]
+            if attempts >= max_attempts:
+                self.db.execute("UPDATE jobs SET state = ?, retry_at = NULL WHERE job_id = ?", (FAILED, job_id))
+            else:
+                self.db.execute(
+                    "UPDATE jobs SET retry_at = ? WHERE job_id = ?",
+                    (now + retry_delay * 2 ** (attempts - 1), job_id)
+                )
+        return attempts
+
+    def delete(self, job_id: str) -> None:
+        """
+        Removes a job's folder and index entry (e.g. after a rejected upload).
+        """
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        with self.db:
+            self.db.execute("DELETE FROM jobs WHERE job_id = ?", (bare_job_id(job_id),))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (bare_job_id(job_id),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_jobs(self, states: Iterable[str], limit: int = 10000) -> List[str]:
+        """
+        Ids of the jobs in the given states, oldest first (one indexed range per state).
+        Jobs waiting out a retry delay after a failure are left out.
+        """
+        states = list(states)
+        rows = self.db.execute(
+            f"SELECT job_id FROM jobs WHERE state IN ({','.join('?' * len(states))}) "
+            "AND (retry_at IS NULL OR retry_at <= ?) ORDER BY created_at LIMIT ?",
+            (*states, time.time(), limit)
+        ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def job_dirs(self, states: Iterable[str], limit: int = 10000) -> List[str]:
+        """
+        Folders of the jobs in the given states, oldest first.
+        """
+        return [self.job_dir(job_id) for job_id in self.list_jobs(states, limit)]
+
+    def finished_after(self, finish_seq: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Jobs finished (or archived) with a `finish_seq` above the given one, in finishing order.
+
+        Returns:
+            List[Dict[str, Any]]: {"job_id", "finished_at", "finish_seq"} rows.
+        """
+        rows = self.db.execute(
+            "SELECT job_id, finished_at, finish_seq FROM jobs WHERE finish_seq > ? AND state IN (?, ?) "
+            "ORDER BY finish_seq LIMIT ?",
+            (finish_seq, FINISHED, ARCHIVED, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def finish_seq_at(self, finished_at: float) -> int:
+        """
+        Highest `finish_seq` of the jobs finished at or before `finished_at` (0 if none) —
+        converts a finished_at watermark into a sequence one.
+        """
+        row = self.db.execute(
+            "SELECT MAX(finish_seq) AS seq FROM jobs WHERE finished_at <= ?", (finished_at,)
+        ).fetchone()
+        return row["seq"] or 0
+
+    def latest_job_dir(self) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT job_id FROM jobs WHERE state != ? ORDER BY created_at DESC LIMIT 1", (ARCHIVED,)
+        ).fetchone()
+        return self.job_dir(row["job_id"]) if row is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    # ------------------------------------------------------------------ #
+    # Archives
+    # ------------------------------------------------------------------ #
+
+    def read_archived(self, job_id: str, filename: str) -> Optional[bytes]:
+        """
+        Reads one file of an archived job (None if the job or the file is not archived).
+        """
+        record = self.get(job_id)
+        if record is None or not record["archive"]:
+            return None
+        try:
+            with zipfile.ZipFile(os.path.join(self.archive_dir, record["archive"])) as archive:
+                return archive.read(f"job_{record['job_id']}/{filename}")
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def restore(self, job_id: str) -> Optional[str]:
+        """
+        Extracts an archived job back into its folder (e.g. to render a report it does not
+        have yet). Its finished_at and finish_seq are kept (the analytics export is keyed
+        on them); the fresh updated_at keeps the folder around for another archive period.
+
+        Returns:
+            Optional[str]: The job folder, or None if the job is not archived.
+        """
+        record = self.get(job_id)
+        if record is None or record["state"] != ARCHIVED or not record["archive"]:
+            return None
+
+        job_dir = shard_dir(self.base_shared_dir, record["job_id"])
+        prefix = f"job_{record['job_id']}/"
+        with zipfile.ZipFile(os.path.join(self.archive_dir, record["archive"])) as archive:
+            for member in archive.infolist():
+                if not member.filename.startswith(prefix) or member.is_dir():
+                    continue
+                target = os.path.join(job_dir, *member.filename[len(prefix):].split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(member) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "UPDATE jobs SET state = ?, archive = NULL, updated_at = ? WHERE job_id = ?",
+                (FINISHED, now, record["job_id"])
+            )
+        print(f"📦 Restored archived job {record['job_id']}")
+        return job_dir
+
+    def compact(self, older_than_seconds: float, max_jobs: int = 500) -> int:
+        """
+        Moves up to `max_jobs` jobs finished (and last restored) more than
+        `older_than_seconds` ago into one new zip archive, then deletes their folders.
+        Thousands of small files per day become one file, and the archive keeps every
+        output readable.
+
+        The archive is written under a temporary name and renamed before the index is
+        updated and the folders are removed, so an interruption never loses a job.
+
+        Returns:
+            int: Number of jobs archived.
+        """
+        cutoff = time.time() - older_than_seconds
+        rows = self.db.execute(
+            "SELECT job_id FROM jobs WHERE state = ? AND finished_at < ? AND updated_at < ? "
+            "ORDER BY finished_at LIMIT ?",
+            (FINISHED, cutoff, cutoff, max_jobs)
+        ).fetchall()
+        if not rows:
+            return 0
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = f"jobs_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}.zip"
+        path = os.path.join(self.archive_dir, name)
+        tmp_path = f"{path}.tmp"
+
+        archived, missing = [], []
+        with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as archive:
+            for row in rows:
+                job_dir = self.job_dir(row["job_id"])
+                if not os.path.isdir(job_dir):
+                    missing.append(row["job_id"])
+                    continue
+                for root, dirs, files in os.walk(job_dir):
+                    dirs[:] = [d for d in dirs if not d.startswith(".")]
+                    for file in sorted(files):
+                        if file.startswith("."):
+                            continue       # claim/done markers and temp files
+                        file_path = os.path.join(root, file)
+                        arcname = f"job_{row['job_id']}/" + os.path.relpath(file_path, job_dir).replace(os.sep, "/")
+                        compression = zipfile.ZIP_STORED if file.lower().endswith(STORED_EXTENSIONS) \
+                            else zipfile.ZIP_DEFLATED
+                        archive.write(file_path, arcname, compress_type=compression)
+                archived.append((row["job_id"], job_dir))
+
+        if archived:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "UPDATE jobs SET state = ?, archive = ?, updated_at = ? WHERE job_id = ?",
+                [(ARCHIVED, name, now, job_id) for job_id, _ in archived]
+            )
+            self.db.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in missing])
+        for _, job_dir in archived:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+        if archived:
+            print(f"🗜️ Archived {len(archived)} finished job(s) into {name}")
+        return len(archived)
+
+    def expire(self, older_than_seconds: float, max_jobs: int = 5000) -> int:
+        """
+        Deletes finished, failed and archived jobs created more than `older_than_seconds` ago:
+        folders, index rows and archives whose jobs have all expired (an archive is never
+        newer than its jobs' expiry, so its mtime tells when it can go). Jobs still in
+        flight are never touched, however old.
+
+        Returns:
+            int: Number of jobs deleted.
+        """
+        cutoff = time.time() - older_than_seconds
+        rows = self.db.execute(
+            "SELECT job_id, state FROM jobs WHERE state IN (?, ?, ?) AND created_at < ? ORDER BY created_at LIMIT ?",
+            (FINISHED, ARCHIVED, FAILED, cutoff, max_jobs)
+        ).fetchall()
+
+        for row in rows:
+            if row["state"] != ARCHIVED:
+                shutil.rmtree(self.job_dir(row["job_id"]), ignore_errors=True)
+        with self.db:
+            self.db.executemany("DELETE FROM jobs WHERE job_id = ?", [(row["job_id"],) for row in rows])
+
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(self.archive_dir, name)
+            if not name.endswith(".zip") or os.path.getmtime(path) >= cutoff:
+                continue
+            if self.db.execute("SELECT 1 FROM jobs WHERE archive = ? LIMIT 1", (name,)).fetchone() is None:
+                os.remove(path)
+                print(f"🧹 Deleted expired archive {name}")
+
+        if rows:
+            print(f"🧹 Deleted {len(rows)} expired job(s)")
+        return len(rows)
+
+    def migrate_flat_jobs(self) -> int:
+        """
+        Moves legacy shared/job_<id>/ folders into their shards and indexes them, with a
+        state inferred from the outputs present (one-off; lists the shared folder once).
+
+        Returns:
+            int: Number of jobs migrated.
+        """
+        migrated = 0
+        for entry in os.scandir(self.base_shared_dir):
+            if not (entry.is_dir() and entry.name.startswith("job_")):
+                continue
+            target = shard_dir(self.base_shared_dir, entry.name)
+            if os.path.exists(target):
+                continue
+
+            files = set(os.listdir(entry.path))
+            if "final_objects.json" in files:
+                state = FINISHED
+            elif "segmented_objects.json" in files:
+                state = SEGMENTED
+            elif any(f.lower().endswith((".png", ".jpg", ".jpeg")) and not f.startswith(".") for f in files):
+                state = UPLOADED
+            else:
+                state = CREATED
+
+            created_at = entry.stat().st_mtime
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(entry.path, target)
+            self.register(entry.name, state, created_at=created_at)
+            migrated += 1
+        print(f"📦 Migrated {migrated} job folder(s) into {self.jobs_dir}")
+        return migrated
+
+
+class RetentionWorker:
+    """
+    Background thread that compacts finished jobs into archives and deletes expired ones.
+
+    Several services may run a worker on the same volume; an exclusive lock file makes
+    sure only one of them works at a time.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        archive_after_seconds: float = 24 * 3600,
+        retention_seconds: float = 0,
+        interval_seconds: float = 600,
+        batch_size: int = 500
+    ):
+        self.store = store
+        self.archive_after_seconds = archive_after_seconds
+        self.retention_seconds = retention_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="job-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        One retention pass (skipped if another process holds the lock).
+
+        Returns:
+            Dict[str, int]: Number of jobs archived and deleted.
+        """
+        result = {"archived": 0, "deleted": 0}
+        lock_path = os.path.join(self.store.jobs_dir, RETENTION_LOCK_FILENAME)
+        with open(lock_path, "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return result
+
+            if self.retention_seconds:
+                while not self._stop.is_set():
+                    deleted = self.store.expire(self.retention_seconds, max_jobs=self.batch_size * 10)
+                    result["deleted"] += deleted
+                    if deleted < self.batch_size * 10:
+                        break
+            if self.archive_after_seconds:
+                while not self._stop.is_set():
+                    archived = self.store.compact(self.archive_after_seconds, max_jobs=self.batch_size)
+                    result["archived"] += archived
+                    if archived < self.batch_size:
+                        break
+        return result
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Job retention error: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SoulSketch job store maintenance")
+    parser.add_argument("--shared", default="../shared", help="Path to the shared folder")
+    parser.add_argument("--migrate", action="store_true", help="Move legacy shared/job_<id>/ folders into shards")
+    parser.add_argument("--archive_after_hours", type=float, default=0, help="Archive jobs finished before this")
+    parser.add_argument("--retention_days", type=float, default=0, help="Delete jobs created before this")
+    args = parser.parse_args()
+
+    job_store = JobStore(args.shared)
+    if args.migrate:
+        job_store.migrate_flat_jobs()
+    if args.archive_after_hours or args.retention_days:
+        print(RetentionWorker(
+            job_store,
+            archive_after_seconds=args.archive_after_hours * 3600,
+            retention_seconds=args.retention_days * 86400
+        ).run_once())
+    print(f"📊 Jobs by state: {job_store.counts()}")
@@ -5,46 +5,68 @@ Author: Itay Vazana (SoulSketch Project)
 """
 
 import os
-from ultralytics import YOLO
+from typing import Dict, List, Optional
 
-def load_models(models_base_path: str) -> dict:
+LAYERS = {
+    "nano": "n",
+    "small": "s"
+    #"medium": "m",
+}
+VERSIONS = ["v08", "v11", "v12"]
+
+def discover_models(models_base_path: str) -> Dict[str, str]:
     """
-    Loads YOLOv8 segmentation models from the given base path.
+    Finds the available YOLO checkpoints without loading them.
 
     Args:
         models_base_path (str): Path to the 'models/' directory.
 
     Returns:
-        dict: Dictionary structured as {model_suffix: YOLO model}
+        Dict[str, str]: Dictionary structured as {model_suffix: checkpoint path},
+        in the canonical ensemble order (n08, n11, n12, s08, s11, s12).
     """
-    layers = {
-        "nano": "n",
-        "small": "s"
-        #"medium": "m",
-    }
-    versions = ["v08", "v11", "v12"]
-    models = {}
+    model_paths = {}
 
-    for layer_name, layer_tag in layers.items():
+    for layer_name, layer_tag in LAYERS.items():
         layer_path = os.path.join(models_base_path, layer_name)
 
-        for version in versions:
+        for version in VERSIONS:
             model_filename = f"Yolo_{version}_{layer_name}-seg.pt"
             model_path = os.path.join(layer_path, model_filename)
 
             if os.path.exists(model_path):
-                try:
-                    model = YOLO(model_path)
-                    suffix = f"{layer_tag}{version[1:]}"  # e.g., n08, s11, m12
-                    models[suffix] = model
-                    print(f"✅ Loaded model: {suffix}")
-                except Exception as e:
-                    print(f"❌ Failed to load model {model_path}: {e}")
+                suffix = f"{layer_tag}{version[1:]}"  # e.g., n08, s11, m12
+                model_paths[suffix] = model_path
             else:
                 print(f"⚠️ Model file not found: {model_path}")
 
-    return models
+    return model_paths
 
+def load_models(models_base_path: str, suffixes: Optional[List[str]] = None) -> dict:
+    """
+    Loads YOLOv8 segmentation models from the given base path.
+
+    Args:
+        models_base_path (str): Path to the 'models/' directory.
+        suffixes (Optional[List[str]]): Only load these model suffixes (default: all).
+
+    Returns:
+        dict: Dictionary structured as {model_suffix: YOLO model}
+    """
+    from ultralytics import YOLO  # deferred so discover_models() stays lightweight
+
+    models = {}
+
+    for suffix, model_path in discover_models(models_base_path).items():
+        if suffixes is not None and suffix not in suffixes:
+            continue
+        try:
+            models[suffix] = YOLO(model_path)
+            print(f"✅ Loaded model: {suffix}")
+        except Exception as e:
+            print(f"❌ Failed to load model {model_path}: {e}")
+
+    return models
 
 if __name__ == "__main__":
     models = load_models(models_base_path="models")
@@ -0,0 +1,219 @@
+"""
+Module: model_registry.py
+Purpose: Lazy, on-demand YOLO model loading with a bounded LRU of warm models.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import gc
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Iterator, Any
+
+from segmentation_service.utils.model_loader import discover_models
+
+try:
+    import psutil
+except ImportError:  # optional — fall back to /proc on Linux
+    psutil = None
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Returns the resident memory of this process in MB, or None if it cannot be measured.
+    """
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def model_size_mb(model: Any, checkpoint_path: Optional[str] = None) -> float:
+    """
+    Memory held by a loaded model: the bytes of its parameters and buffers, or the
+    checkpoint's file size if the weights cannot be inspected.
+    """
+    module = getattr(model, "model", model)
+    try:
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors) / (1024 * 1024)
+    except (AttributeError, TypeError):
+        pass
+    try:
+        return os.path.getsize(checkpoint_path) / (1024 * 1024) if checkpoint_path else 0.0
+    except OSError:
+        return 0.0
+
+
+class ModelRegistry(Mapping):
+    """
+    Read-only mapping {model_suffix: YOLO model} whose models are loaded on first access.
+
+    It can be passed anywhere the dict from `load_models` was used. Warm models are kept
+    in LRU order and the coldest ones are evicted when `max_models` or `max_memory_mb`
+    would be exceeded (0 disables a limit). The memory budget counts the size recorded for
+    each model when it was loaded (see `model_size_mb`), not the process RSS — freed
+    memory is rarely returned to the OS, so RSS would keep evicting every model.
+    Iteration order is the canonical ensemble order.
+    """
+
+    def __init__(
+        self,
+        models_base_path: str,
+        enabled_models: Optional[List[str]] = None,
+        max_models: int = 0,
+        max_memory_mb: float = 0
+    ):
+        self.models_base_path = models_base_path
+        self.max_models = max_models
+        self.max_memory_mb = max_memory_mb
+
+        self._paths: Dict[str, str] = {
+            suffix: path
+            for suffix, path in discover_models(models_base_path).items()
+            if not enabled_models or suffix in enabled_models
+        }
+        self._failed = set()
+        self._warm: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes_mb: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {s: threading.Lock() for s in self._paths}
+        self._prewarm_thread: Optional[threading.Thread] = None
+
+        print(f"📚 Model registry ready ({len(self._paths)} models available, none loaded yet)")
+
+    # ------------------------------------------------------------------ #
+    # Mapping interface
+    # ------------------------------------------------------------------ #
+
+    def __getitem__(self, suffix: str) -> Any:
+        if suffix not in self._paths or suffix in self._failed:
+            raise KeyError(suffix)
+
+        with self._lock:
+            if suffix in self._warm:
+                self._warm.move_to_end(suffix)
+                return self._warm[suffix]
+
+        # Load outside the registry lock so other warm models stay usable meanwhile
+        with self._load_locks[suffix]:
+            with self._lock:
+                if suffix in self._warm:
+                    self._warm.move_to_end(suffix)
+                    return self._warm[suffix]
+
+            from ultralytics import YOLO
+            try:
+                model = YOLO(self._paths[suffix])
+            except Exception as e:
+                print(f"❌ Failed to load model {self._paths[suffix]}: {e}")
+                self._failed.add(suffix)
+                raise KeyError(suffix) from e
+            size_mb = model_size_mb(model, self._paths[suffix])
+            print(f"✅ Loaded model: {suffix} ({size_mb:.1f} MB)")
+
+            with self._lock:
+                self._warm[suffix] = model
+                self._sizes_mb[suffix] = size_mb
+                self._evict(keep=suffix)
+            return model
+
+    def __contains__(self, suffix: object) -> bool:
+        # Membership must not trigger a load (Mapping's default calls __getitem__)
+        return suffix in self._paths and suffix not in self._failed
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([suffix for suffix in self._paths if suffix not in self._failed])
+
+    def __len__(self) -> int:
+        return len(self._paths) - len(self._failed)
+
+    def items(self) -> Iterator[Any]:
+        """
+        Yields (suffix, model) pairs, loading each model as it is reached.
+        Models that fail to load are skipped, like in `load_models`.
+        """
+        for suffix in self:
+            try:
+                yield suffix, self[suffix]
+            except KeyError:
+                continue
+
+    # ------------------------------------------------------------------ #
+    # Cache management
+    # ------------------------------------------------------------------ #
+
+    def warm_models(self) -> List[str]:
+        """
+        Returns the suffixes of the currently loaded models, coldest first.
+        """
+        with self._lock:
+            return list(self._warm)
+
+    def warm_memory_mb(self) -> float:
+        """
+        Returns the recorded size of the currently loaded models in MB.
+        """
+        with self._lock:
+            return sum(self._sizes_mb.get(suffix, 0.0) for suffix in self._warm)
+
+    def _evict(self, keep: str) -> None:
+        """
+        Drops least-recently-used models until the configured limits are respected.
+        The model that was just requested is never evicted.
+        """
+        evicted = False
+        while len(self._warm) > 1:
+            over_count = self.max_models > 0 and len(self._warm) > self.max_models
+            over_memory = self.max_memory_mb > 0 and self.warm_memory_mb() > self.max_memory_mb
+            if not (over_count or over_memory):
+                break
+
+            coldest = next(iter(self._warm))
+            if coldest == keep:
+                break
+            del self._warm[coldest]
+            self._sizes_mb.pop(coldest, None)
+            gc.collect()
+            evicted = True
+            print(f"♻️ Evicted cold model: {coldest}")
+
+        if evicted:
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+    def prewarm(self, suffixes: Optional[List[str]] = None, background: bool = True) -> None:
+        """
+        Loads models ahead of their first use, optionally in a background thread.
+
+        Args:
+            suffixes (Optional[List[str]]): Models to prewarm (default: all available,
+                capped at `max_models`).
+            background (bool): Return immediately and load in a daemon thread.
+        """
+        targets = [s for s in (suffixes or list(self._paths)) if s in self._paths]
+        if self.max_models > 0:
+            targets = targets[:self.max_models]
+
+        def _run():
+            for suffix in targets:
+                try:
+                    self[suffix]
+                except KeyError:
+                    continue
+            print(f"🔥 Prewarm finished: {', '.join(self.warm_models())}")
+
+        if background:
+            self._prewarm_thread = threading.Thread(target=_run, name="model-prewarm", daemon=True)
+            self._prewarm_thread.start()
+        else:
+            _run()
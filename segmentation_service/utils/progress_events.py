@@ -0,0 +1,44 @@
+"""
+Module: progress_events.py
+Purpose: Append per-stage progress events to a job's event log (shared/job_<uuid>/events.jsonl).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+from typing import Any
+
+EVENTS_FILENAME = "events.jsonl"
+
+# Pipeline stages, in order
+STAGES = ("upload", "segmentation", "object_processor", "comparator", "emotion_mapper")
+STARTED, COMPLETED, FAILED = "started", "completed", "failed"
+RETRYING = "retrying"   # after a failure, while the stage still has retries left
+
+
+def publish_event(job_dir: str, stage: str, status: str, **details: Any) -> None:
+    """
+    Appends one progress event as a JSON line.
+
+    The log is append-only and each event is written with a single O_APPEND write,
+    so concurrent writers never interleave and readers (the backend status index)
+    only ever need to read the bytes added since their last offset. Publishing never
+    raises: a failed write only costs the UI an update, not the job.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        stage (str): One of STAGES.
+        status (str): "started", "completed", "failed" or "retrying".
+        **details: Extra JSON-serializable fields (e.g. num_objects, error).
+    """
+    event = {"ts": round(time.time(), 3), "stage": stage, "status": status, **details}
+    line = (json.dumps(event, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+    try:
+        fd = os.open(os.path.join(job_dir, EVENTS_FILENAME), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"⚠️ Could not publish progress event for {job_dir}: {e}")
@@ -0,0 +1,542 @@
+"""
+Module: result_cache.py
+Purpose: Content-addressed cache of job artifacts so re-uploaded drawings skip the pipeline.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+CACHE_FORMAT_VERSION = 2
+CACHE_KEY_FILENAME = ".cache_key"
+MANIFEST_FILENAME = "manifest.json"
+INDEX_FILENAME = "index.sqlite"
+
+# Size, recency and image signature of every entry (eviction and near-duplicate lookup
+# never have to open the per-entry manifests)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL,
+    versions TEXT,
+    phash INTEGER,
+    width INTEGER,
+    height INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_signature ON entries (versions, width, height);
+"""
+
+# Per-job artifacts produced along the pipeline (crops folder is added separately)
+JOB_ARTIFACTS = [
+    "segmented_objects.json",
+    "crops_atlas.npy",
+    "object_features.json",
+    "enriched_objects.json",
+    "final_objects.json",
+    "segmentation_stats.json",
+]
+
+
+def file_stamp(path: str) -> str:
+    """
+    Cheap version stamp of a file (name, size and modification time).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return f"{os.path.basename(path)}:missing"
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def compute_versions_fingerprint(model_paths: Dict[str, str], settings: Dict[str, Any]) -> str:
+    """
+    Builds a fingerprint of the segmentation models and settings that influence the results
+    (the later stages' files are stamped per key, see `ResultCache.version_files`).
+
+    Args:
+        model_paths (Dict[str, str]): {model_suffix: checkpoint path} of the models in use.
+        settings (Dict[str, Any]): Result-affecting config values (thresholds, modes, ...).
+
+    Returns:
+        str: Hex digest that changes whenever a checkpoint or setting changes.
+    """
+    h = hashlib.sha256(f"format={CACHE_FORMAT_VERSION}".encode())
+    for suffix in sorted(model_paths):
+        h.update(f"|{suffix}:{file_stamp(model_paths[suffix])}".encode())
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def stage_version_files(stage_configs: Dict[str, str], path_keys: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    Collects the files that decide what the later stages produce: each stage's
+    config.yaml (classifier backend, color LUT bins/metric, comparator thresholds, ...)
+    plus the files it points to under `path_keys` (classifier checkpoint and labels,
+    mapping_rules.json — whose content is the rule-set version).
+
+    Args:
+        stage_configs (Dict[str, str]): {stage: path to its config.yaml}.
+        path_keys (Tuple[str, ...]): Config keys holding paths relative to the config's folder.
+
+    Returns:
+        Dict[str, str]: {"<stage>:<key>": path} for `ResultCache(version_files=...)`.
+    """
+    import yaml
+
+    files = {}
+    for stage, config_path in stage_configs.items():
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = yaml.safe_load(f) or {}
+        except OSError:
+            print(f"⚠️ Result cache: {stage} config not found at {config_path} — its changes won't invalidate the cache")
+            continue
+        files[f"{stage}:config"] = config_path
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        for key in path_keys:
+            value = config.get(key)
+            if isinstance(value, str) and value:
+                files[f"{stage}:{key}"] = value if os.path.isabs(value) else os.path.join(base_dir, value)
+    return files
+
+
+def image_signature(image_bytes: bytes) -> Optional[Tuple[int, int, int]]:
+    """
+    Computes a 64-bit difference hash (dHash) of an encoded image, plus its size.
+
+    Args:
+        image_bytes (bytes): Raw bytes of the uploaded image file.
+
+    Returns:
+        Optional[Tuple[int, int, int]]: (hash, width, height), or None if the image
+        cannot be decoded.
+    """
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    phash = int(np.packbits(bits).view(">u8")[0])
+    return phash, gray.shape[1], gray.shape[0]
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class ResultCache:
+    """
+    On-disk cache of job artifacts keyed by sha256(image bytes + versions fingerprint).
+
+    Layout: <cache_dir>/<key[:2]>/<key>/ holding the crops folder, any pipeline JSON
+    artifacts and a manifest. The key also covers `version_files` (the later stages'
+    configs, classifier and rules), stamped on every lookup so an edited config or a
+    hot-reloaded rules file takes effect without restarting segmentation. Sizes, last access and image signatures of all entries are
+    kept in <cache_dir>/index.sqlite, which bounds the total size by LRU eviction without
+    re-reading manifests. Each job folder gets a `.cache_key` file pointing at its entry,
+    so the emotion mapper adds the later stages' outputs with `store_job_artifacts(job_dir)`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        versions_fingerprint: str,
+        output_subdir: str = "objects",
+        max_bytes: int = 2 * 1024 ** 3,
+        link_mode: str = "hardlink",
+        near_duplicate_distance: int = 0,
+        version_files: Optional[Dict[str, str]] = None
+    ):
+        self.cache_dir = cache_dir
+        self.versions_fingerprint = versions_fingerprint
+        self.output_subdir = output_subdir
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self.near_duplicate_distance = near_duplicate_distance
+        self.version_files = version_files or {}
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._local = threading.local()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ #
+    # Keys
+    # ------------------------------------------------------------------ #
+
+    def current_versions(self) -> str:
+        """
+        Digest of the versions fingerprint and the current stamps of `version_files`.
+        """
+        h = hashlib.sha256(self.versions_fingerprint.encode())
+        for name in sorted(self.version_files):
+            h.update(f"|{name}:{file_stamp(self.version_files[name])}".encode())
+        return h.hexdigest()
+
+    def compute_key(self, image_bytes: bytes, versions: Optional[str] = None) -> str:
+        """
+        Returns the cache key for an uploaded image.
+        """
+        h = hashlib.sha256(image_bytes)
+        h.update((versions or self.current_versions()).encode())
+        return h.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read_manifest(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._entry_dir(key), MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, key: str, manifest: Dict[str, Any]) -> None:
+        path = os.path.join(self._entry_dir(key), MANIFEST_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------ #
+    # Index
+    # ------------------------------------------------------------------ #
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0:
+                self._rebuild_index()
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _rebuild_index(self) -> None:
+        # Caches written before the index existed: read their manifests once
+        rows = []
+        for key in self._iter_entries():
+            manifest = self._read_manifest(key)
+            if manifest is not None:
+                rows.append(self._index_row(key, manifest))
+        if rows:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    @staticmethod
+    def _index_row(key: str, manifest: Dict[str, Any]) -> Tuple:
+        phash = manifest.get("phash")
+        return (
+            key, manifest.get("size", 0), manifest.get("last_access", 0.0), manifest.get("versions"),
+            _to_signed(phash) if phash is not None else None,
+            manifest.get("width"), manifest.get("height"),
+        )
+
+    def _index_entry(self, key: str, manifest: Dict[str, Any]) -> None:
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", self._index_row(key, manifest)
+            )
+
+    # ------------------------------------------------------------------ #
+    # Lookup / restore
+    # ------------------------------------------------------------------ #
+
+    def lookup(self, image_bytes: bytes) -> Optional[str]:
+        """
+        Finds a cache entry for the image: exact content match first, then (if enabled)
+        the closest perceptual-hash match within `near_duplicate_distance` bits among the
+        entries made with the current versions and of the same pixel size (cached boxes
+        and crops are in image coordinates, so a near duplicate of another size can't
+        reuse them).
+
+        Args:
+            image_bytes (bytes): Raw bytes of the uploaded image file.
+
+        Returns:
+            Optional[str]: The matching cache key, or None on a miss.
+        """
+        versions = self.current_versions()
+        key = self.compute_key(image_bytes, versions)
+        if self._read_manifest(key) is not None:
+            return key
+
+        if self.near_duplicate_distance <= 0:
+            return None
+
+        signature = image_signature(image_bytes)
+        if signature is None:
+            return None
+        phash, width, height = signature
+
+        best_key, best_distance = None, self.near_duplicate_distance + 1
+        candidates = self.db.execute(
+            "SELECT key, phash FROM entries "
+            "WHERE versions = ? AND width = ? AND height = ? AND phash IS NOT NULL",
+            (versions, width, height)
+        )
+        for other_key, other_hash in candidates:
+            distance = bin(phash ^ (other_hash & 0xFFFFFFFFFFFFFFFF)).count("1")
+            if distance < best_distance:
+                best_key, best_distance = other_key, distance
+
+        if best_key is not None and self._read_manifest(best_key) is not None:
+            print(f"🪞 Near-duplicate drawing found (distance {best_distance})")
+            return best_key
+        return None
+
+    def restore(self, key: str, job_dir: str, source_image: Optional[str] = None) -> List[str]:
+        """
+        Completes a job from a cache entry by linking (or copying) its artifacts.
+
+        Args:
+            key (str): Cache key returned by `lookup`.
+            job_dir (str): Path to the shared/job_<uuid>/ folder.
+            source_image (Optional[str]): File name of this job's upload, written into the
+                restored segmented_objects.json (the cached job may have used another name).
+
+        Returns:
+            List[str]: Names of the restored artifacts.
+        """
+        entry_dir = self._entry_dir(key)
+        manifest = self._read_manifest(key) or {}
+        restored = []
+
+        crops_src = os.path.join(entry_dir, self.output_subdir)
+        if os.path.isdir(crops_src):
+            crops_dst = os.path.join(job_dir, self.output_subdir)
+            os.makedirs(crops_dst, exist_ok=True)
+            for name in sorted(os.listdir(crops_src)):
+                self._place(os.path.join(crops_src, name), os.path.join(crops_dst, name), allow_link=True)
+            restored.append(self.output_subdir)
+
+        for name in JOB_ARTIFACTS:
+            src = os.path.join(entry_dir, name)
+            if os.path.exists(src):
+                # Always copied — stages rewrite these in place, which would corrupt a hardlink
+                self._place(src, os.path.join(job_dir, name), allow_link=False)
+                restored.append(name)
+
+        manifest_path = os.path.join(job_dir, "segmented_objects.json")
+        if source_image is not None and os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                crop_manifest = json.load(f)
+            crop_manifest["source_image"] = source_image
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(crop_manifest, f, indent=2)
+
+        self._write_key_file(job_dir, key)
+        manifest["last_access"] = time.time()
+        manifest["hits"] = manifest.get("hits", 0) + 1
+        self._write_manifest(key, manifest)
+        with self.db:
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (manifest["last_access"], key))
+        return restored
+
+    # ------------------------------------------------------------------ #
+    # Store
+    # ------------------------------------------------------------------ #
+
+    def store(self, image_bytes: bytes, job_dir: str) -> str:
+        """
+        Adds a segmented job's artifacts to the cache under the image's key.
+
+        Args:
+            image_bytes (bytes): Raw bytes of the uploaded image file.
+            job_dir (str): Path to the shared/job_<uuid>/ folder.
+
+        Returns:
+            str: The cache key.
+        """
+        versions = self.current_versions()
+        key = self.compute_key(image_bytes, versions)
+        manifest = self._read_manifest(key)
+        if manifest is None:
+            signature = image_signature(image_bytes)
+            phash, width, height = signature if signature is not None else (None, None, None)
+            manifest = {
+                "created_at": time.time(), "versions": versions,
+                "phash": phash, "width": width, "height": height, "hits": 0,
+            }
+        self._write_key_file(job_dir, key)
+        self._copy_into_entry(key, job_dir, manifest)
+
+        self.evict()
+        return key
+
+    def store_artifacts(self, job_dir: str) -> Optional[str]:
+        """
+        Adds any new artifacts of a job (e.g. final_objects.json) to its cache entry.
+
+        Args:
+            job_dir (str): Path to the shared/job_<uuid>/ folder.
+
+        Returns:
+            Optional[str]: The cache key, or None if the job has no cache entry.
+        """
+        key = read_key_file(job_dir).get("key")
+        if not key:
+            return None
+
+        manifest = self._read_manifest(key)
+        if manifest is None:
+            return None   # evicted in the meantime
+        self._copy_into_entry(key, job_dir, manifest)
+        self.evict()
+        return key
+
+    def _copy_into_entry(self, key: str, job_dir: str, manifest: Dict[str, Any]) -> None:
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        crops_src = os.path.join(job_dir, self.output_subdir)
+        crops_dst = os.path.join(entry_dir, self.output_subdir)
+        if os.path.isdir(crops_src) and not os.path.isdir(crops_dst):
+            os.makedirs(crops_dst)
+            for name in sorted(os.listdir(crops_src)):
+                self._place(os.path.join(crops_src, name), os.path.join(crops_dst, name), allow_link=True)
+
+        for name in JOB_ARTIFACTS:
+            src = os.path.join(job_dir, name)
+            if os.path.exists(src):
+                self._place(src, os.path.join(entry_dir, name), allow_link=False)
+
+        manifest["size"] = sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(entry_dir) for f in files
+            if f != MANIFEST_FILENAME
+        )
+        manifest["last_access"] = time.time()
+        self._write_manifest(key, manifest)
+        self._index_entry(key, manifest)
+
+    def _place(self, src: str, dst: str, allow_link: bool) -> None:
+        if os.path.exists(dst):
+            os.remove(dst)
+        if allow_link and self.link_mode == "hardlink":
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass  # cross-device or unsupported — fall back to a copy
+        shutil.copy2(src, dst)
+
+    def _write_key_file(self, job_dir: str, key: str) -> None:
+        # The cache folder is stored relative to the job, so other containers that mount
+        # the shared volume elsewhere still find the entry
+        with open(os.path.join(job_dir, CACHE_KEY_FILENAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "key": key,
+                "cache_dir": os.path.relpath(os.path.abspath(self.cache_dir), os.path.abspath(job_dir)),
+                "output_subdir": self.output_subdir,
+                "link_mode": self.link_mode,
+                "max_bytes": self.max_bytes,
+            }, f)
+
+    # ------------------------------------------------------------------ #
+    # Maintenance
+    # ------------------------------------------------------------------ #
+
+    def _iter_entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_dir():
+                    yield entry.name
+
+    def evict(self) -> int:
+        """
+        Removes least-recently-used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        if self.max_bytes <= 0:
+            return 0
+
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = []
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            evicted.append((key,))
+            total -= size
+
+        with self.db:
+            self.db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        print(f"♻️ Result cache evicted {len(evicted)} entr{'y' if len(evicted) == 1 else 'ies'}")
+        return len(evicted)
+
+
+def read_key_file(job_dir: str) -> Dict[str, Any]:
+    """
+    Reads a job's `.cache_key` file.
+
+    Returns:
+        Dict[str, Any]: {"key", "cache_dir" (relative to the job), ...}, or {} if the job
+        has no cache entry.
+    """
+    try:
+        with open(os.path.join(job_dir, CACHE_KEY_FILENAME), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return info if isinstance(info, dict) else {}
+
+
+def store_job_artifacts(job_dir: str) -> Optional[str]:
+    """
+    Adds a finished job's later-stage outputs (object features, enriched and final
+    objects) to the cache entry its segmentation created, so a re-upload is completed
+    without running any stage. Called by the emotion mapper; needs no cache config since
+    the job's `.cache_key` file says where the entry lives.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+
+    Returns:
+        Optional[str]: The cache key, or None if the job has no cache entry.
+    """
+    info = read_key_file(job_dir)
+    if not info.get("key") or not info.get("cache_dir"):
+        return None
+    cache_dir = os.path.normpath(os.path.join(job_dir, info["cache_dir"]))
+    if not os.path.isdir(cache_dir):
+        return None
+
+    cache = ResultCache(
+        cache_dir,
+        versions_fingerprint="",
+        output_subdir=info.get("output_subdir", "objects"),
+        max_bytes=info.get("max_bytes", 0),
+        link_mode=info.get("link_mode", "hardlink")
+    )
+    try:
+        return cache.store_artifacts(job_dir)
+    finally:
+        cache.close()
@@ -6,7 +6,7 @@ Author: Itay Vazana (SoulSketch Project)
 
 from typing import List, Dict, Any
 
-def score_segmentation(objects: List[Dict[str, Any]]) -> float:
+def score_segmentation(objects: List[Dict[str, Any]], scale: float = 1.0) -> float:
     """
     Computes a quality score for a list of detected objects.
 
@@ -17,6 +17,8 @@ def score_segmentation(objects: List[Dict[str, Any]]) -> float:
 
     Args:
         objects (List[Dict[str, Any]]): List of segmented objects.
+        scale (float): Size of the image the boxes were found in / original size, so
+            boxes from a downscaled view are scored by their original-pixel area.
 
     Returns:
         float: Quality score (higher is better).
@@ -37,6 +39,7 @@ def score_segmentation(objects: List[Dict[str, Any]]) -> float:
         total_area += area
 
     avg_area = total_area / num_objects if num_objects > 0 else 0
+    avg_area /= scale * scale
 
     # Define heuristics for "good" segmentation
     # Weight: 50% confidence, 30% area size, 20% number of objects normalization
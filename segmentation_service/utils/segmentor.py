@@ -4,12 +4,18 @@ Purpose: Perform segmentation on an image using a specified YOLO model.
 Author: Itay Vazana (SoulSketch Project)
 """
 
-from ultralytics import YOLO
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Mapping, Optional, TYPE_CHECKING
 from segmentation_service.utils.image_utils import load_image
-from segmentation_service.utils.model_loader import load_models
+from segmentation_service.utils.crop_saver import clamp_bbox
+from segmentation_service.utils.tracing import span
 
-def segment_image(model: YOLO, image_path: str, conf_threshold: float = 0.5) -> List[Dict[str, Any]]:
+# Masks are upsampled to full resolution this many objects at a time (bounds peak memory)
+MASK_UPSAMPLE_CHUNK = 16
+
+if TYPE_CHECKING:  # ultralytics is heavy — only the loaded models need it at runtime
+    from ultralytics import YOLO
+
+def segment_image(model: "YOLO", image_path: str, conf_threshold: float = 0.5) -> List[Dict[str, Any]]:
     """
     Segments an image using the provided YOLOv8 model, returning masks and bounding boxes.
 
@@ -45,7 +51,66 @@ def segment_image(model: YOLO, image_path: str, conf_threshold: float = 0.5) ->
 
     return output_objects
 
-def extract_bboxes(model: YOLO, image: Any, conf_threshold: float = 0.25) -> List[Any]:
+def _result_masks(result: Any, boxes: Any) -> List[Optional[Tuple[Any, int, int]]]:
+    """
+    Upsamples all instance masks of one result to the original image in batched calls
+    and keeps only each object's bbox region.
+
+    Returns:
+        List[Optional[Tuple[np.ndarray, int, int]]]: Per box, (bool mask, x_min, y_min)
+        of the mask's bbox-sized window, or None for an empty box.
+    """
+    if not hasattr(result, 'masks') or result.masks is None:
+        return [None for _ in boxes]
+
+    from ultralytics.utils import ops
+
+    data = result.masks.data
+    orig_shape = tuple(result.orig_shape[:2])
+    out: List[Optional[Tuple[Any, int, int]]] = []
+
+    for start in range(0, len(boxes), MASK_UPSAMPLE_CHUNK):
+        chunk = data[start:start + MASK_UPSAMPLE_CHUNK]
+        full = (ops.scale_masks(chunk[None], orig_shape)[0] > 0.5).cpu().numpy()
+        for mask, box in zip(full, boxes[start:start + MASK_UPSAMPLE_CHUNK]):
+            coords = clamp_bbox(box, orig_shape)
+            if coords is None:
+                out.append(None)
+                continue
+            x_min, y_min, x_max, y_max = coords
+            out.append((mask[y_min:y_max, x_min:x_max].copy(), x_min, y_min))
+
+    return out
+
+def _result_boxes(result: Any, return_details: bool, return_masks: bool = False) -> List[Any]:
+    """
+    Reads the boxes of one Ultralytics result, optionally with confidence, class id and mask.
+    """
+    if not hasattr(result, 'boxes') or result.boxes is None:
+        return []
+
+    boxes = result.boxes.xyxy.cpu().numpy()
+    if not return_details:
+        return list(boxes)
+
+    scores = result.boxes.conf.cpu().numpy()
+    class_ids = result.boxes.cls.cpu().numpy().astype(int)
+    if not return_masks:
+        return [(box, float(score), int(cls)) for box, score, cls in zip(boxes, scores, class_ids)]
+
+    masks = _result_masks(result, boxes)
+    return [
+        (box, float(score), int(cls), mask)
+        for box, score, cls, mask in zip(boxes, scores, class_ids, masks)
+    ]
+
+def extract_bboxes(
+    model: "YOLO",
+    image: Any,
+    conf_threshold: float = 0.25,
+    return_details: bool = False,
+    return_masks: bool = False
+) -> List[Any]:
     """
     Extracts bounding boxes from a YOLOv8 model, without using masks.
 
@@ -53,6 +118,8 @@ def extract_bboxes(model: YOLO, image: Any, conf_threshold: float = 0.25) -> Lis
         model (YOLO): A loaded YOLOv8 model.
         image (np.ndarray): Loaded BGR image.
         conf_threshold (float): Minimum confidence score to keep a detection.
+        return_details (bool): Return (bbox, confidence, class_id) tuples instead of bare bboxes.
+        return_masks (bool): With return_details, append each object's upsampled mask window.
 
     Returns:
         List[np.ndarray]: List of bounding boxes [x_min, y_min, x_max, y_max].
@@ -64,13 +131,107 @@ def extract_bboxes(model: YOLO, image: Any, conf_threshold: float = 0.25) -> Lis
         return []
 
     for r in results:
-        if hasattr(r, 'boxes') and r.boxes is not None:
-            boxes = r.boxes.xyxy.cpu().numpy()
-            bboxes.extend(boxes)
+        bboxes.extend(_result_boxes(r, return_details, return_masks))
 
     return bboxes
 
+def extract_bboxes_batch(
+    model: "YOLO",
+    images: List[Any],
+    conf_threshold: float = 0.25,
+    max_batch_size: int = 8,
+    return_details: bool = False,
+    return_masks: bool = False
+) -> List[List[Any]]:
+    """
+    Extracts bounding boxes for several images with batched `predict` calls.
+
+    Images are grouped by shape before batching: Ultralytics only uses the minimal
+    rectangular letterbox when every image in a batch has the same shape, so grouping
+    keeps each image's detections identical to a single-image `extract_bboxes` call.
+
+    Args:
+        model (YOLO): A loaded YOLOv8 model.
+        images (List[np.ndarray]): Loaded BGR images.
+        conf_threshold (float): Minimum confidence score to keep a detection.
+        max_batch_size (int): Maximum number of images per `predict` call.
+        return_details (bool): Return (bbox, confidence, class_id) tuples instead of bare bboxes.
+        return_masks (bool): With return_details, append each object's upsampled mask window.
+
+    Returns:
+        List[List[np.ndarray]]: Bounding boxes per input image, in input order.
+    """
+    per_image: List[List[Any]] = [[] for _ in images]
+
+    groups: Dict[Any, List[int]] = {}
+    for idx, image in enumerate(images):
+        groups.setdefault(image.shape, []).append(idx)
+
+    for indices in groups.values():
+        for start in range(0, len(indices), max_batch_size):
+            chunk = indices[start:start + max_batch_size]
+            results = model.predict(
+                source=[images[i] for i in chunk],
+                save=False,
+                conf=conf_threshold,
+                verbose=False
+            )
+            for image_idx, r in zip(chunk, results or []):
+                per_image[image_idx].extend(_result_boxes(r, return_details, return_masks))
+
+    return per_image
+
+def detect_objects(
+    models: Mapping[str, Any],
+    images: List[Any],
+    conf_threshold: float,
+    max_batch_size: int = 1,
+    return_masks: bool = False
+) -> List[List[Tuple[Any, ...]]]:
+    """
+    Runs every model on every image and tags each detection with its model suffix.
+
+    A single image uses one `predict` call per model (original flow); several images
+    are sent through each model as batched `predict` calls. Either way, the boxes of
+    each image are ordered by model, then by detection — the order the original
+    `filter_duplicates` loop has always received.
+
+    Args:
+        models (Mapping[str, YOLO]): {model_suffix: YOLO model} (dict or ModelRegistry).
+        images (List[np.ndarray]): Loaded BGR images.
+        conf_threshold (float): Minimum confidence score to keep a detection.
+        max_batch_size (int): Maximum number of images per `predict` call.
+        return_masks (bool): Append each object's (mask window, x_min, y_min) to its tuple.
+
+    Returns:
+        List[List[Tuple[np.ndarray, str, float, int]]]: (bbox, model_suffix, confidence, class_id)
+        tuples per image (plus the mask entry in mask mode).
+    """
+    all_boxes: List[List[Tuple[Any, ...]]] = [[] for _ in images]
+
+    for model_suffix, model in models.items():
+        with span("model_predict", model=model_suffix):
+            if len(images) == 1:
+                per_image = [
+                    extract_bboxes(
+                        model, images[0], conf_threshold=conf_threshold,
+                        return_details=True, return_masks=return_masks
+                    )
+                ]
+            else:
+                per_image = extract_bboxes_batch(
+                    model, images, conf_threshold=conf_threshold,
+                    max_batch_size=max_batch_size, return_details=True, return_masks=return_masks
+                )
+        for image_boxes, detections in zip(all_boxes, per_image):
+            for bbox, *details in detections:
+                image_boxes.append((bbox, model_suffix, *details))
+
+    return all_boxes
+
 if __name__ == "__main__":
+    from segmentation_service.utils.model_loader import load_models
+
     models = load_models(models_base_path="models")
     nano_v08_model = models["nano"]["v08"]
 
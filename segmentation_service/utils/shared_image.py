@@ -0,0 +1,210 @@
+"""
+Module: shared_image.py
+Purpose: Hand a decoded image to later pipeline stages without re-reading or re-decoding it.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import socket
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Dict, Any
+
+import numpy as np
+
+from segmentation_service.utils.image_utils import load_image
+
+HEADER_FILENAME = "decoded_image.json"
+RAW_FILENAME = "decoded_image.raw"
+
+# Segments created by this process (oldest first) and segments attached by it
+_published: "OrderedDict[str, shared_memory.SharedMemory]" = OrderedDict()
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _segment_name(job_dir: str) -> str:
+    return f"soulsketch_{os.path.basename(os.path.normpath(job_dir))}"
+
+
+def _close_segment(shm: shared_memory.SharedMemory, unlink: bool) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        pass  # arrays still view the buffer; the mapping goes away with them
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to an existing segment without letting this process's resource tracker
+    unlink it on exit (the publisher owns the segment).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def publish_decoded_image(
+    image: np.ndarray,
+    job_dir: str,
+    mode: str = "shm",
+    max_segments: int = 8
+) -> Dict[str, Any]:
+    """
+    Writes the decoded BGR buffer once per job and a small header describing it.
+
+    Modes:
+    - "shm": POSIX shared memory — zero-copy for stages on the same host/IPC namespace.
+    - "mmap": raw file in the job folder — zero-copy page-cache reads for any stage that
+      mounts the shared volume.
+
+    Args:
+        image (np.ndarray): Decoded BGR image.
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        mode (str): "shm" or "mmap".
+        max_segments (int): Shared-memory segments kept alive by this process; older
+            ones are unlinked (readers then fall back to decoding the file).
+
+    Returns:
+        Dict[str, Any]: The header written to decoded_image.json.
+    """
+    header = {
+        "shape": list(image.shape),
+        "dtype": str(image.dtype),
+        "host": socket.gethostname(),
+        "mode": mode,
+        "shm_name": None,
+        "raw_path": None,
+    }
+
+    if mode == "shm":
+        name = _segment_name(job_dir)
+        release_decoded_image(job_dir)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, image.nbytes))
+        except FileExistsError:
+            # Left over from a previous run (e.g. a crash before release) — replace it
+            _close_segment(_open_segment(name), unlink=True)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+        _published[name] = shm
+        header["shm_name"] = name
+
+        while len(_published) > max_segments:
+            _, old_shm = _published.popitem(last=False)
+            _close_segment(old_shm, unlink=True)
+    elif mode == "mmap":
+        raw = np.memmap(os.path.join(job_dir, RAW_FILENAME), dtype=image.dtype, mode="w+", shape=image.shape)
+        raw[...] = image
+        raw.flush()
+        del raw
+        header["raw_path"] = RAW_FILENAME
+    else:
+        raise ValueError(f"❌ Unknown decoded image mode: {mode}")
+
+    tmp_path = os.path.join(job_dir, f".{HEADER_FILENAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(tmp_path, os.path.join(job_dir, HEADER_FILENAME))
+    return header
+
+
+def attach_decoded_image(job_dir: str, fallback_path: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Returns the job's decoded image, zero-copy when possible.
+
+    Tries, in order: the shared-memory segment (same host only), the memory-mapped raw
+    file, and finally decoding `fallback_path` from disk.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        fallback_path (Optional[str]): Encoded image to decode if no buffer is available.
+
+    Returns:
+        Optional[np.ndarray]: Read-only BGR image, or None if nothing is available.
+    """
+    header = read_header(job_dir)
+
+    if header is not None:
+        shape, dtype = tuple(header["shape"]), np.dtype(header["dtype"])
+
+        if header.get("shm_name") and header.get("host") == socket.gethostname():
+            name = header["shm_name"]
+            try:
+                shm = _published.get(name) or _attached.get(name) or _open_segment(name)
+                if name not in _published:
+                    _attached[name] = shm
+                image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                image.flags.writeable = False
+                return image
+            except FileNotFoundError:
+                pass
+
+        if header.get("raw_path"):
+            raw_path = os.path.join(job_dir, header["raw_path"])
+            if os.path.exists(raw_path):
+                return np.memmap(raw_path, dtype=dtype, mode="r", shape=shape)
+
+    if fallback_path is not None:
+        return load_image(fallback_path)
+    return None
+
+
+def read_header(job_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads decoded_image.json, or returns None if the job has no published buffer.
+    """
+    try:
+        with open(os.path.join(job_dir, HEADER_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def release_decoded_image(job_dir: str, remove_buffer: bool = False) -> None:
+    """
+    Detaches from (and, if this process published it, unlinks) the job's shared buffer.
+
+    Args:
+        job_dir (str): Path to the shared/job_<uuid>/ folder.
+        remove_buffer (bool): Also frees the buffer for every process — unlinks the
+            shared-memory segment and deletes decoded_image.raw and its header. Set by the
+            last stage that reads the image; later readers decode the source file instead.
+    """
+    name = _segment_name(job_dir)
+
+    shm = _attached.pop(name, None)
+    if shm is not None:
+        _close_segment(shm, unlink=False)
+
+    shm = _published.pop(name, None)
+    if shm is not None:
+        _close_segment(shm, unlink=True)
+
+    if not remove_buffer:
+        return
+    header = read_header(job_dir)
+    if header is None:
+        return
+    if header.get("shm_name") and header.get("host") == socket.gethostname():
+        try:
+            _close_segment(_open_segment(header["shm_name"]), unlink=True)
+        except FileNotFoundError:
+            pass
+    for filename in (HEADER_FILENAME, header.get("raw_path")):
+        if filename:
+            try:
+                os.remove(os.path.join(job_dir, filename))
+            except FileNotFoundError:
+                pass
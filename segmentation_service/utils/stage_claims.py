@@ -0,0 +1,116 @@
+"""
+Module: stage_claims.py
+Purpose: Claim leases and bounded retries for the stages that take their jobs from the job index.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+
+from segmentation_service.utils.job_store import JobStore
+from segmentation_service.utils.progress_events import publish_event, FAILED, RETRYING
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _read_token(claim_path: str) -> str:
+    try:
+        with open(claim_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("token", "")
+    except (OSError, ValueError, AttributeError):
+        return ""
+
+
+def claim_job(job_dir: str, claim_filename: str, lease_seconds: float = 300, owner: str = OWNER) -> bool:
+    """
+    Atomically claims a job by creating its lease file, so concurrent workers never
+    handle it twice. A lease older than `lease_seconds` belongs to a worker that crashed
+    (or hung) and is taken over, so a job is never stranded by a dead claim.
+
+    Args:
+        job_dir (str): Path to the job folder.
+        claim_filename (str): Lease file of the stage (e.g. ".comparator.claim").
+        lease_seconds (float): Age after which a lease counts as stale.
+        owner (str): Written into the lease for debugging.
+
+    Returns:
+        bool: True if this worker now owns the job.
+    """
+    claim_path = os.path.join(job_dir, claim_filename)
+    token = uuid.uuid4().hex
+    lease = json.dumps({"owner": owner, "token": token, "claimed_at": time.time()})
+
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            age = time.time() - os.path.getmtime(claim_path)
+        except FileNotFoundError:
+            return claim_job(job_dir, claim_filename, lease_seconds, owner)
+        if age < lease_seconds:
+            return False
+        print(f"⚠️ Stale lease ({age:.0f}s) found, re-claiming: {job_dir}")
+        tmp_path = f"{claim_path}.{token}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(lease)
+        os.replace(tmp_path, claim_path)
+        # Two workers may take over the same stale lease; the last rename wins
+        return _read_token(claim_path) == token
+    except FileNotFoundError:
+        return False   # job folder removed (archived or expired)
+
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(lease)
+    return True
+
+
+def release_job(job_dir: str, claim_filename: str) -> None:
+    """
+    Removes the stage's lease so the job can be claimed again.
+    """
+    try:
+        os.remove(os.path.join(job_dir, claim_filename))
+    except FileNotFoundError:
+        pass
+
+
+def record_stage_failure(
+    job_store: JobStore,
+    job_dir: str,
+    stage: str,
+    error: str,
+    max_attempts: int = 3,
+    retry_delay: float = 5.0
+) -> bool:
+    """
+    Counts a failed attempt of `stage` at a job (see JobStore.record_failure) and
+    publishes the outcome. While attempts remain, a "retrying" event keeps the job
+    running in the UI and the job stays out of every stage's queue for the backoff
+    delay; after the last attempt the job is marked "failed" and never picked up again.
+
+    Args:
+        job_store (JobStore): Shared job index.
+        job_dir (str): Path to the job folder.
+        stage (str): Stage name used in progress events.
+        error (str): What went wrong (kept in the job index).
+        max_attempts (int): Failed attempts before the job gives up.
+        retry_delay (float): Delay before the first retry, doubled after each failure.
+
+    Returns:
+        bool: True if the job will be retried.
+    """
+    attempts = job_store.record_failure(job_dir, error, max_attempts, retry_delay)
+    if attempts >= max_attempts:
+        publish_event(job_dir, stage, FAILED, error=error, attempt=attempts)
+        print(f"❌ {stage} failed {attempts} time(s), giving up: {job_dir}")
+        return False
+
+    delay = retry_delay * 2 ** (attempts - 1)
+    publish_event(
+        job_dir, stage, RETRYING, error=error, attempt=attempts, max_attempts=max_attempts, retry_in=delay
+    )
+    print(f"🔁 {stage} failed (attempt {attempts}/{max_attempts}), retrying in {delay:.0f}s: {job_dir}")
+    return True
@@ -0,0 +1,290 @@
+"""
+Module: tracing.py
+Purpose: Lightweight timing spans, counters and per-job trace files shared by all services (switchable to no-op).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Tuple
+
+TRACE_FILENAME = "trace.jsonl"
+METRICS_DIRNAME = ".metrics"
+SPAN_METRIC = "soulsketch_span_seconds"
+
+# Upper bounds (seconds) of the span histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _env_enabled() -> Optional[bool]:
+    value = os.environ.get("SOULSKETCH_TRACING")
+    if value is None or value == "":
+        return None
+    return value.strip().lower() not in ("0", "false", "off", "no")
+
+
+_enabled = _env_enabled() is not False
+_trace_jobs = True
+_current_trace: ContextVar[Optional["JobTrace"]] = ContextVar("soulsketch_job_trace", default=None)
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and span-duration histograms.
+
+    Updates are a dict lookup and a few additions under one lock. Label sets are small
+    and fixed (stage names, model suffixes, methods), so the number of series stays bounded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # Per series: [count per bucket..., count above the last bucket, total count, sum]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Labels = ()) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, labels: Labels = ()) -> None:
+        key = (name, labels)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(BUCKETS) + 2) + [0.0]
+            series[bisect.bisect_left(BUCKETS, seconds)] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        JSON-serializable copy of every series (the format of shared/.metrics/<service>.json).
+        """
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "buckets": list(BUCKETS),
+                     "counts": series[:len(BUCKETS) + 1], "count": series[-2], "sum": round(series[-1], 6)}
+                    for (name, labels), series in self.histograms.items()
+                ],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+METRICS = MetricsRegistry()
+
+
+class JobTrace:
+    """
+    Collects the spans and counters recorded while one job (or one batch of jobs) is
+    processed, and appends them to each job's trace.jsonl when the batch is done.
+    """
+
+    def __init__(self, job_dirs: List[str], service: str):
+        self.job_dirs = job_dirs
+        self.service = service
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def flush(self) -> None:
+        """
+        Appends the records with one O_APPEND write per job (like the progress events);
+        never raises.
+        """
+        if not self.records:
+            return
+        extra = {"service": self.service}
+        if len(self.job_dirs) > 1:
+            extra["batch_size"] = len(self.job_dirs)
+        data = "".join(
+            json.dumps({**record, **extra}, separators=(",", ":"), default=str) + "\n"
+            for record in self.records
+        ).encode("utf-8")
+
+        for job_dir in self.job_dirs:
+            try:
+                fd = os.open(os.path.join(job_dir, TRACE_FILENAME), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"⚠️ Could not write trace for {job_dir}: {e}")
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start", "wall_start")
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Span":
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        record_span(self.name, time.perf_counter() - self.start, start=self.wall_start,
+                    error=exc_type is not None, **self.labels)
+
+
+class _NoOpSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoOpSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoOpSpan()
+
+
+def configure(config: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Applies a service's `tracing` / `trace_jobs` settings. The SOULSKETCH_TRACING
+    environment variable (0/1) overrides the config.
+
+    Returns:
+        bool: Whether tracing is enabled.
+    """
+    global _enabled, _trace_jobs
+    config = config or {}
+    env = _env_enabled()
+    _enabled = env if env is not None else bool(config.get("tracing", True))
+    _trace_jobs = bool(config.get("trace_jobs", True))
+    return _enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **labels: Any):
+    """
+    Times a block: `with span("model_predict", model="n08"): ...`.
+
+    The duration goes to the `soulsketch_span_seconds` histogram (labels: span name plus
+    the given labels) and, inside `job_trace`, to the job's trace file. When tracing is
+    off this returns a shared no-op context manager.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+
+def record_span(name: str, seconds: float, start: Optional[float] = None, error: bool = False, **labels: Any) -> None:
+    """
+    Records a duration measured elsewhere (e.g. a render finished in a worker process).
+    """
+    if not _enabled:
+        return
+    METRICS.observe(SPAN_METRIC, seconds, _labels({"span": name, **labels}))
+    trace = _current_trace.get()
+    if trace is not None:
+        record = {"span": name, "ts": round(start if start is not None else time.time() - seconds, 6),
+                  "ms": round(seconds * 1000, 3), **labels}
+        if error:
+            record["error"] = True
+        trace.add(record)
+
+
+def count(name: str, value: float = 1, **labels: Any) -> None:
+    """
+    Adds `value` to a counter (e.g. `count("soulsketch_detections_before_dedup_total", 12)`).
+    """
+    if not _enabled:
+        return
+    METRICS.inc(name, value, _labels(labels))
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add({"counter": name, "ts": round(time.time(), 6), "value": value, **labels})
+
+
+@contextmanager
+def job_trace(job_dirs: List[str], service: str, base_shared_dir: Optional[str] = None):
+    """
+    Attributes every span and counter recorded in this block (in this thread) to the
+    given jobs and appends them to their trace.jsonl at the end. Spans of a batch are
+    written to every job of the batch, with `batch_size`.
+
+    Args:
+        job_dirs (List[str]): Job folders processed in the block.
+        service (str): Service name stored with each record.
+        base_shared_dir (Optional[str]): Also publish the metrics snapshot afterwards.
+    """
+    trace = JobTrace(list(job_dirs), service) if _enabled and _trace_jobs and job_dirs else None
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if trace is not None:
+            trace.flush()
+        if base_shared_dir is not None:
+            write_metrics_snapshot(base_shared_dir, service)
+
+
+@contextmanager
+def capture_spans():
+    """
+    Collects the spans and counters recorded in this block (in this thread) without
+    writing them anywhere, e.g. to break a benchmarked call down into its hot paths.
+    Yields None when tracing is off.
+    """
+    trace = JobTrace([], "capture") if _enabled else None
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def write_metrics_snapshot(base_shared_dir: str, service: str) -> Optional[str]:
+    """
+    Publishes this process's metrics as shared/.metrics/<service>.json (atomic rename),
+    where the backend's /metrics endpoint picks them up. Never raises.
+
+    Returns:
+        Optional[str]: Path written, or None when tracing is off or the write failed.
+    """
+    if not _enabled:
+        return None
+    metrics_dir = os.path.join(base_shared_dir, METRICS_DIRNAME)
+    path = os.path.join(metrics_dir, f"{service}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"service": service, "pid": os.getpid(), "ts": round(time.time(), 3), **METRICS.snapshot()}, f)
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        print(f"⚠️ Could not publish metrics for {service}: {e}")
+        return None
@@ -1,8 +1,12 @@
 import os
+import sys
 import random
 import string
 import shutil
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from segmentation_service.utils.job_store import JobStore, UPLOADED
+
 
 def generate_random_id(length=6) -> str:
     """
@@ -30,13 +34,11 @@ def select_random_image(images_dir: str) -> str:
 
 def create_job_with_image(base_dir: str, images_dir: str):
     """
-    Creates a job_<random_id> folder and copies a random image into it as uploaded.jpg.
+    Creates a job_<random_id> folder in the job store and copies a random image into it
+    as uploaded.jpg (then marks the job uploaded, as the backend does).
     """
-    random_id = generate_random_id()
-    job_folder_name = f"job_{random_id}"
-    job_folder_path = os.path.join(base_dir, job_folder_name)
-
-    os.makedirs(job_folder_path, exist_ok=False)
+    job_store = JobStore(base_dir)
+    random_id, job_folder_path = job_store.create(generate_random_id())
     print(f"✅ Created job folder: {job_folder_path}")
 
     selected_image = select_random_image(images_dir)
@@ -44,6 +46,7 @@ def create_job_with_image(base_dir: str, images_dir: str):
     dest_image_path = os.path.join(job_folder_path, "uploaded.jpg")
 
     shutil.copyfile(src_image_path, dest_image_path)
+    job_store.set_state(random_id, UPLOADED)
     print(f"✅ Copied {selected_image} as uploaded.jpg into {job_folder_path}")
 
 
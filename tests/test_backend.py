@@ -0,0 +1,98 @@
+"""
+Module: test_backend.py
+Purpose: Tests for the backend's upload header parser and upload copy.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import io
+import os
+import sys
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+from app.services.storage import read_image_header, save_upload, MultipartFileReader, UploadTooLarge
+
+
+def encode(fmt, width, height):
+    image = np.random.default_rng(0).integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    return cv2.imencode(f".{fmt}", image)[1].tobytes()
+
+
+@pytest.mark.parametrize("fmt,name", [("png", "png"), ("jpg", "jpeg")])
+@pytest.mark.parametrize("width,height", [(1, 1), (640, 480), (123, 457)])
+def test_header_size_matches_encoded_image(fmt, name, width, height):
+    assert read_image_header(encode(fmt, width, height)) == (name, width, height)
+
+
+def test_jpeg_size_after_large_metadata_segment():
+    data = encode("jpg", 32, 16)
+    app1 = b"\xff\xe1" + struct.pack(">H", 60_002) + b"\x00" * 60_000   # e.g. a big EXIF block
+    data = data[:2] + app1 + data[2:]
+    assert read_image_header(data[:1000]) is None   # size marker not reached yet
+    assert read_image_header(data) == ("jpeg", 32, 16)
+
+
+def test_truncated_headers_need_more_bytes():
+    png, jpg = encode("png", 10, 20), encode("jpg", 10, 20)
+    assert read_image_header(b"") is None
+    assert read_image_header(png[:12]) is None
+    assert read_image_header(jpg[:2]) is None
+
+
+@pytest.mark.parametrize("data", [
+    b"GIF89a" + b"\x00" * 32, b"not an image at all", b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+])
+def test_unsupported_or_corrupt_headers_raise(data):
+    with pytest.raises(ValueError):
+        read_image_header(data)
+
+
+def test_save_upload_publishes_valid_image(tmp_path):
+    data = encode("png", 50, 40)
+    path, fmt, width, height = save_upload(
+        str(tmp_path), io.BytesIO(data), max_bytes=1 << 20, max_pixels=10_000, chunk_size=64
+    )
+    assert (os.path.basename(path), fmt, width, height) == ("uploaded.png", "png", 50, 40)
+    assert open(path, "rb").read() == data
+    assert os.listdir(tmp_path) == ["uploaded.png"]
+
+
+@pytest.mark.parametrize("max_bytes,max_pixels", [(100, 10_000), (1 << 20, 1_000)])
+def test_save_upload_rejects_oversized_uploads(tmp_path, max_bytes, max_pixels):
+    with pytest.raises(UploadTooLarge):
+        save_upload(str(tmp_path), io.BytesIO(encode("png", 50, 40)), max_bytes=max_bytes, max_pixels=max_pixels)
+    assert os.listdir(tmp_path) == []
+
+
+def multipart_body(boundary, parts):
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode()
+
+
+@pytest.mark.parametrize("piece", [1, 7, 4096])
+def test_multipart_reader_returns_file_bytes_across_chunk_splits(piece):
+    data = encode("png", 30, 20)
+    body = multipart_body("XyZ", [("note", None, b"hello"), ("file", "a.png", data), ("file", "b.png", b"second")])
+    reader = MultipartFileReader("multipart/form-data; boundary=XyZ")
+    received = b"".join(reader.feed(body[i:i + piece]) for i in range(0, len(body), piece))
+    reader.finish()
+    assert received == data
+    assert reader.filename == "a.png"
+
+
+def test_multipart_reader_rejects_other_bodies():
+    with pytest.raises(ValueError):
+        MultipartFileReader("application/x-www-form-urlencoded")
+    reader = MultipartFileReader("multipart/form-data; boundary=XyZ")
+    reader.feed(multipart_body("XyZ", [("note", None, b"hello")]))
+    with pytest.raises(ValueError):
+        reader.finish()
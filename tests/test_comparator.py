@@ -0,0 +1,96 @@
+"""
+Module: test_comparator.py
+Purpose: Tests for the comparator's batched scoring against the spec formulas.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comparator_engine.scorer import score_jobs, score_objects
+
+
+def euclidean(a, b):
+    return ((a["x"] - b["x"]) ** 2 + (a["y"] - b["y"]) ** 2) ** 0.5
+
+
+def spec_scores(objects):
+    """
+    The per-drawing formulas of the comparator spec (README_comparator_engine_FINAL.md),
+    plus the nearest-neighbour isolation score; a single object scores 1.0 everywhere.
+    """
+    if len(objects) < 2:
+        return [{"size": 1.0, "distance": 1.0, "isolation": 1.0, "complexity": 1.0} for _ in objects]
+
+    avg_size = sum(obj["size"] for obj in objects) / len(objects)
+    avg_complexity = sum(obj["complexity_score"] for obj in objects) / len(objects)
+    mean_dist, nearest = [], []
+    for obj in objects:
+        others = [euclidean(obj["position"], other["position"]) for other in objects if other is not obj]
+        mean_dist.append(sum(others) / (len(objects) - 1))
+        nearest.append(min(others))
+    avg_dist = sum(mean_dist) / len(objects)
+    avg_nearest = sum(nearest) / len(objects)
+
+    return [
+        {
+            "size": obj["size"] / avg_size,
+            "distance": mean_dist[i] / avg_dist,
+            "isolation": nearest[i] / avg_nearest,
+            "complexity": obj["complexity_score"] / avg_complexity,
+        }
+        for i, obj in enumerate(objects)
+    ]
+
+
+def random_jobs(num_jobs, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(num_jobs):
+        jobs.append([
+            {
+                "object_id": f"obj_{i:03d}",
+                "size": rng.randint(10, 5000),
+                "complexity_score": round(rng.uniform(0.05, 1.0), 3),
+                "position": {"x": rng.uniform(0, 1000), "y": rng.uniform(0, 800)},
+            }
+            for i in range(rng.choice([1, 2, 3, rng.randint(4, 40)]))
+        ])
+    return jobs
+
+
+@pytest.mark.parametrize("kd_tree_threshold", [256, 8])
+def test_score_jobs_matches_spec_formulas(kd_tree_threshold):
+    jobs = random_jobs(300)
+    enriched = score_jobs(jobs, kd_tree_threshold=kd_tree_threshold, max_block_elements=20_000)
+
+    assert len(enriched) == len(jobs)
+    for objects, scored in zip(jobs, enriched):
+        assert len(scored) == len(objects)
+        for obj, expected in zip(scored, spec_scores(objects)):
+            assert obj["relative_size_score"] == pytest.approx(expected["size"], abs=1e-4)
+            assert obj["relative_distance_score"] == pytest.approx(expected["distance"], abs=1e-4)
+            assert obj["relative_isolation_score"] == pytest.approx(expected["isolation"], abs=1e-4)
+            assert obj["relative_complexity_score"] == pytest.approx(expected["complexity"], abs=1e-4)
+
+
+def test_batch_equals_single_job_scoring():
+    jobs = random_jobs(50, seed=1)
+    assert score_jobs(jobs) == [score_objects(objects) for objects in jobs]
+
+
+def test_missing_attributes_are_skipped():
+    objects = [
+        {"size": 100, "complexity_score": None, "position": {"x": 0, "y": 0}},
+        {"size": None, "complexity_score": 0.5, "position": {"x": 3, "y": 4}},
+        {"size": 300, "complexity_score": "n/a", "position": None},
+    ]
+    scored = score_objects(objects)
+    assert [obj["relative_size_score"] for obj in scored] == [0.5, None, 1.5]
+    assert [obj["relative_complexity_score"] for obj in scored] == [None, 1.0, None]
+    assert scored[2]["relative_distance_score"] is None
+    assert scored[0]["relative_distance_score"] == 1.0
@@ -0,0 +1,126 @@
+"""
+Module: test_emotion_mapper.py
+Purpose: Tests for the compiled rule index against the uncompiled reference matcher.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emotion_mapper.engine.rule_matcher import compile_rules, load_rules, match_rule
+from emotion_mapper.engine.emotion_mapper import map_emotions
+
+RULES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "emotion_mapper", "rules", "mapping_rules.json"
+)
+LABELS = ["person", "tree", "sun", "heart", "star", "house", "cloud", "cat"]
+COLORS = ["yellow", "red", "blue", "green", "black", "white", "pink", "purple", "brown"]
+SCORE_FIELDS = ["relative_size_score", "relative_distance_score", "relative_complexity_score"]
+BOUNDS = [0.5, 0.6, 0.7, 1.0, 1.3, 1.5]
+
+
+def reference_match(rules, obj):
+    """
+    First rule by (priority desc, file order) whose conditions all hold, checked one by one.
+    """
+    for rule in sorted(rules, key=lambda r: -r.get("priority", 0)):
+        if match_rule(rule, obj):
+            return rule
+    return None
+
+
+def random_rules(rng, num_rules):
+    rules = []
+    for i in range(num_rules):
+        conditions = {}
+        if rng.random() < 0.8:
+            conditions["label"] = rng.choice(LABELS) if rng.random() < 0.7 else rng.sample(LABELS, 2)
+        if rng.random() < 0.4:
+            conditions["color"] = rng.choice(COLORS) if rng.random() < 0.5 else rng.sample(COLORS, 3)
+        if rng.random() < 0.2:
+            conditions["dominant_color"] = rng.choice(COLORS)
+        for field in rng.sample(SCORE_FIELDS, rng.randint(0, 2)):
+            ops = rng.sample(["lt", "lte", "gt", "gte", "eq"], rng.choice([1, 1, 2]))
+            conditions[field] = {op: rng.choice(BOUNDS) for op in ops}
+        if rng.random() < 0.1:
+            conditions["source"] = rng.choice(["n08", "s11"])   # residual equality check
+        rule = {"id": f"rule_{i}", "if": conditions, "then": {"emotion_tag": f"tag_{i}"}}
+        if rng.random() < 0.3:
+            rule["priority"] = rng.randint(-2, 3)
+        rules.append(rule)
+    return rules
+
+
+def random_object(rng):
+    def score():
+        return rng.choice([None, True, "high", rng.choice(BOUNDS), round(rng.uniform(0.0, 2.5), 3)])
+
+    obj = {
+        "predicted_label": rng.choice(LABELS),
+        "mapped_emotional_colors": rng.sample(COLORS, rng.randint(0, 3)),
+        "source": rng.choice(["n08", "s11", None]),
+    }
+    for field in SCORE_FIELDS:
+        obj[field] = score()
+    return obj
+
+
+def test_compiled_index_matches_reference_on_shipped_rules():
+    rng = random.Random(0)
+    rules = load_rules(RULES_PATH)
+    index = compile_rules(rules)
+    mismatches = [obj for obj in (random_object(rng) for _ in range(5000))
+                  if index.match(obj) is not reference_match(rules, obj)]
+    assert mismatches == []
+
+
+def test_compiled_index_matches_reference_on_random_rule_sets():
+    rng = random.Random(1)
+    mismatches = 0
+    for _ in range(100):
+        rules = random_rules(rng, rng.randint(1, 40))
+        index = compile_rules(rules)
+        objects = [random_object(rng) for _ in range(200)]
+        matched = index.match_all(objects)
+        mismatches += sum(rule is not reference_match(rules, obj) for obj, rule in zip(objects, matched))
+    assert mismatches == 0
+
+
+def test_map_emotions_tags_with_matched_rule_and_version():
+    rules = load_rules(RULES_PATH)
+    index = compile_rules(rules, version="test")
+    rng = random.Random(2)
+    objects = [random_object(rng) for _ in range(200)]
+    for obj, tagged in zip(objects, map_emotions(objects, index)):
+        rule = reference_match(rules, obj)
+        assert tagged["matched_rule_id"] == (rule["id"] if rule else None)
+        assert tagged["rule_set_version"] == "test"
+
+
+def test_process_jobs_keeps_jobs_written_before_a_failed_write(tmp_path, monkeypatch):
+    import json
+    from emotion_mapper import emotion_mapper_main as main
+
+    rng = random.Random(3)
+    job_dirs = []
+    for i in range(3):
+        job_dir = tmp_path / f"job_{i}"
+        job_dir.mkdir()
+        (job_dir / main.ENRICHED_FILENAME).write_text(json.dumps([random_object(rng) for _ in range(3)]))
+        job_dirs.append(str(job_dir))
+
+    save = main.save_final_objects
+
+    def failing_save(job_dir, objects):
+        if job_dir == job_dirs[1]:
+            raise OSError("disk full")
+        return save(job_dir, objects)
+
+    monkeypatch.setattr(main, "save_final_objects", failing_save)
+    errors = {}
+    results = main.process_jobs(job_dirs, main.RuleSet(RULES_PATH), errors)
+    assert sorted(results) == [job_dirs[0], job_dirs[2]]
+    assert list(errors) == [job_dirs[1]]
+    assert not os.path.exists(os.path.join(job_dirs[1], main.FINAL_FILENAME))
@@ -0,0 +1,197 @@
+"""
+Module: test_job_store.py
+Purpose: Tests for the sharded job store: path resolution, state index, migration, archiving and expiry.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from segmentation_service.utils import job_store as job_store_module
+from segmentation_service.utils.job_store import (
+    JobStore, RetentionWorker, shard_dir, resolve_job_dir, bare_job_id,
+    CREATED, UPLOADED, SEGMENTED, FINISHED, ARCHIVED, FAILED
+)
+
+
+def make_job(store, job_id, state, files=None):
+    """
+    Creates a sharded job with the given files ({relative path: bytes}) and state.
+    """
+    _, job_dir = store.create(job_id)
+    for name, payload in (files or {}).items():
+        path = os.path.join(job_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+    store.set_state(job_id, state)
+    return job_dir
+
+
+def age_jobs(store, seconds):
+    """
+    Moves every job's timestamps `seconds` into the past.
+    """
+    with store.db:
+        store.db.execute(
+            "UPDATE jobs SET created_at = created_at - ?, updated_at = updated_at - ?, "
+            "finished_at = finished_at - ?", (seconds, seconds, seconds)
+        )
+
+
+def test_shard_dir_and_resolution(tmp_path):
+    base = str(tmp_path)
+    path = shard_dir(base, "abc")
+    assert path == shard_dir(base, "job_abc") == shard_dir(base, os.path.join(base, "job_abc"))
+    assert os.path.basename(path) == "job_abc"
+    assert os.path.relpath(path, base).split(os.sep)[0] == "jobs"
+    assert [len(part) for part in os.path.relpath(path, base).split(os.sep)[1:3]] == [2, 2]
+    assert bare_job_id(path) == "abc"
+
+    # Neither exists: the sharded path; a legacy flat folder wins until it is migrated
+    assert resolve_job_dir(base, "abc") == path
+    os.makedirs(os.path.join(base, "job_abc"))
+    assert resolve_job_dir(base, "abc") == os.path.join(base, "job_abc")
+    os.makedirs(path)
+    assert resolve_job_dir(base, "abc") == path
+
+
+def test_migrate_flat_jobs_infers_states(tmp_path):
+    flat = {
+        "done": {"final_objects.json": b"[]", "segmented_objects.json": b"{}"},
+        "seg": {"segmented_objects.json": b"{}"},
+        "up": {"uploaded.png": b"png"},
+        "new": {".upload.part": b"partial"},
+    }
+    for job_id, files in flat.items():
+        os.makedirs(tmp_path / f"job_{job_id}")
+        for name, payload in files.items():
+            (tmp_path / f"job_{job_id}" / name).write_bytes(payload)
+
+    store = JobStore(str(tmp_path))
+    assert store.migrate_flat_jobs() == 4
+    assert store.migrate_flat_jobs() == 0
+    states = {job_id: store.get(job_id)["state"] for job_id in flat}
+    assert states == {"done": FINISHED, "seg": SEGMENTED, "up": UPLOADED, "new": CREATED}
+    for job_id, files in flat.items():
+        assert not os.path.exists(tmp_path / f"job_{job_id}")
+        assert store.job_dir(job_id) == shard_dir(str(tmp_path), job_id)
+        assert sorted(os.listdir(store.job_dir(job_id))) == sorted(files)
+
+
+def test_compact_read_archived_and_restore(tmp_path):
+    store = JobStore(str(tmp_path))
+    files = {"final_objects.json": b'[{"object_id": "obj_1"}]', "objects/obj_1.png": b"png", ".claim": b"x"}
+    job_dir = make_job(store, "old", FINISHED, files)
+    make_job(store, "busy", SEGMENTED, {"segmented_objects.json": b"{}"})
+    age_jobs(store, 3600)
+    make_job(store, "recent", FINISHED, {"final_objects.json": b"[]"})
+
+    assert store.compact(older_than_seconds=600) == 1
+    record = store.get("old")
+    assert record["state"] == ARCHIVED and record["archive"]
+    assert not os.path.exists(job_dir)
+    assert os.path.exists(os.path.join(store.archive_dir, record["archive"]))
+    assert store.get("busy")["state"] == SEGMENTED
+    assert store.get("recent")["state"] == FINISHED
+
+    assert store.read_archived("old", "final_objects.json") == files["final_objects.json"]
+    assert store.read_archived("old", "objects/obj_1.png") == b"png"
+    assert store.read_archived("old", ".claim") is None
+    assert store.read_archived("recent", "final_objects.json") is None
+
+    finish_seq = record["finish_seq"]
+    assert store.restore("old") == job_dir
+    assert store.restore("old") is None
+    for name in ("final_objects.json", "objects/obj_1.png"):
+        with open(os.path.join(job_dir, name), "rb") as f:
+            assert f.read() == files[name]
+    record = store.get("old")
+    assert (record["state"], record["archive"], record["finish_seq"]) == (FINISHED, None, finish_seq)
+
+    # Restoring counts as a fresh use: not archived again until it ages
+    assert store.compact(older_than_seconds=600) == 0
+
+
+def test_expire_never_touches_jobs_in_flight(tmp_path):
+    store = JobStore(str(tmp_path))
+    in_flight = {state: make_job(store, state, state) for state in (CREATED, UPLOADED, SEGMENTED)}
+    make_job(store, "archived", FINISHED, {"final_objects.json": b"[]"})
+    age_jobs(store, 3600)
+    assert store.compact(older_than_seconds=600) == 1
+    archive = os.path.join(store.archive_dir, store.get("archived")["archive"])
+    os.utime(archive, (0, 0))
+    gone = {state: make_job(store, state, state) for state in (FINISHED, FAILED)}
+    age_jobs(store, 7200)
+
+    assert store.expire(older_than_seconds=600) == 3
+    assert not os.path.exists(archive)
+    for state, job_dir in in_flight.items():
+        assert store.get(state)["state"] == state
+        assert os.path.isdir(job_dir)
+    for state, job_dir in gone.items():
+        assert store.get(state) is None
+        assert not os.path.exists(job_dir)
+    assert store.get("archived") is None
+
+
+def test_retention_worker_archives_then_expires(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", FINISHED, {"final_objects.json": b"[]"})
+    make_job(store, "b", SEGMENTED)
+    age_jobs(store, 3600)
+    worker = RetentionWorker(store, archive_after_seconds=600, retention_seconds=0)
+    assert worker.run_once() == {"archived": 1, "deleted": 0}
+    assert store.get("a")["state"] == ARCHIVED
+
+    age_jobs(store, 86400)
+    worker = RetentionWorker(store, archive_after_seconds=600, retention_seconds=3600)
+    assert worker.run_once() == {"archived": 0, "deleted": 1}
+    assert store.get("a") is None
+    assert store.get("b")["state"] == SEGMENTED
+
+
+def test_finish_seq_follows_commit_order_not_clock(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path))
+    for job_id in ("a", "b", "c"):
+        store.register(job_id, SEGMENTED)
+
+    # "b" read its clock before "a" but committed after it
+    clock = iter([100.0, 90.0])
+    monkeypatch.setattr(job_store_module.time, "time", lambda: next(clock))
+    store.set_state("a", FINISHED)
+    store.set_state("b", FINISHED)
+    monkeypatch.undo()
+
+    first = store.finished_after(0)
+    assert [row["job_id"] for row in first] == ["a", "b"]
+    assert [row["finish_seq"] for row in first] == [1, 2]
+
+    # A watermark taken after "a" still sees "b", although b finished "earlier"
+    assert [row["job_id"] for row in store.finished_after(first[0]["finish_seq"])] == ["b"]
+    store.set_state("c", FINISHED)
+    assert [row["job_id"] for row in store.finished_after(first[-1]["finish_seq"])] == ["c"]
+    assert store.finish_seq_at(100.0) == 2
+
+
+def test_index_without_finish_seq_is_numbered_on_upgrade(tmp_path):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    conn = sqlite3.connect(str(jobs_dir / "index.sqlite"))
+    conn.executescript(
+        "CREATE TABLE jobs (job_id TEXT PRIMARY KEY, state TEXT NOT NULL, created_at REAL NOT NULL, "
+        "updated_at REAL NOT NULL, finished_at REAL, archive TEXT) WITHOUT ROWID;"
+    )
+    conn.executemany(
+        "INSERT INTO jobs VALUES (?, ?, 0, 0, ?, NULL)",
+        [("late", FINISHED, 20.0), ("early", FINISHED, 10.0), ("open", SEGMENTED, None)]
+    )
+    conn.commit()
+    conn.close()
+
+    store = JobStore(str(tmp_path))
+    assert [(row["job_id"], row["finish_seq"]) for row in store.finished_after(0)] == [("early", 1), ("late", 2)]
+    store.set_state("open", FINISHED)
+    assert store.get("open")["finish_seq"] == 3
@@ -0,0 +1,70 @@
+"""
+Module: test_object_processor.py
+Purpose: Tests for the object processor's color lookup table and complexity score.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from object_processor.analysis.color_mapper import (
+    build_color_lut, load_color_lut, lookup_groups, nearest_group_knn, LUT_METRICS
+)
+from object_processor.analysis.complexity import complexity_score, complexity_scores_batch
+
+
+@pytest.mark.parametrize("metric", LUT_METRICS)
+@pytest.mark.parametrize("bins", [16, 32])
+def test_lut_matches_knn_on_grid_points(bins, metric):
+    # KNN at the cell centers of the quantized cube must be what the first and last
+    # integer color of each cell look up
+    step = 256 // bins
+    centers = np.arange(bins) * step + (step - 1) / 2.0
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3)
+    expected = nearest_group_knn(grid, metric)
+
+    lut = build_color_lut(bins, metric)
+    for corner in (0, step - 1):
+        colors = (np.floor(grid) - np.floor((step - 1) / 2.0) + corner).astype(np.uint8)
+        assert np.array_equal(lookup_groups(colors, lut), expected)
+
+
+def test_load_color_lut_builds_file_in_lut_dir(tmp_path):
+    lut = load_color_lut(bins=8, metric="rgb", lut_dir=str(tmp_path))
+    assert lut.shape == (8, 8, 8)
+    assert os.listdir(tmp_path) == ["color_lut_rgb_8.npy"]
+    assert np.array_equal(np.asarray(lut), build_color_lut(8, "rgb"))
+
+
+@pytest.mark.parametrize("bins", [0, 48, 512])
+def test_lut_bins_must_be_power_of_two(bins, tmp_path):
+    with pytest.raises(ValueError):
+        load_color_lut(bins=bins, lut_dir=str(tmp_path))
+
+
+def test_complexity_score_ranks_scribbles_above_outlines():
+    import cv2
+
+    outline = np.full((100, 100, 3), 255, np.uint8)
+    cv2.circle(outline, (50, 50), 40, (0, 0, 0), 2)
+    scribble = np.full((100, 100, 3), 255, np.uint8)
+    rng = np.random.default_rng(0)
+    for _ in range(60):
+        x1, y1, x2, y2 = (int(v) for v in rng.integers(0, 100, 4))
+        cv2.line(scribble, (x1, y1), (x2, y2), (0, 0, 255), 1)
+
+    blank = np.full((100, 100, 3), 255, np.uint8)
+    assert complexity_score(blank) == 0.0
+    assert 0.0 < complexity_score(outline) < complexity_score(scribble) <= 1.0
+    assert complexity_scores_batch([outline, scribble]) == [complexity_score(outline), complexity_score(scribble)]
+
+
+def test_complexity_score_ignores_transparent_pixels():
+    crop = np.zeros((50, 50, 4), np.uint8)          # black but fully transparent
+    assert complexity_score(crop) == 0.0
+    crop[10:40, 10:40, 3] = 255
+    assert complexity_score(crop) > 0.0
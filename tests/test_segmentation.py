@@ -0,0 +1,91 @@
+"""
+Module: test_segmentation.py
+Purpose: Tests for the segmentation service's duplicate filtering and job queue.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from segmentation_service.utils.iou_utils import calculate_iou, filter_duplicates
+
+
+def reference_filter_duplicates(boxes_sources, iou_threshold=0.5):
+    """
+    The original pairwise loop: first arrival wins against every box kept so far.
+    """
+    filtered = []
+    for box, src in boxes_sources:
+        if not any(calculate_iou(box, kept_box) > iou_threshold for kept_box, _ in filtered):
+            filtered.append((box, src))
+    return filtered
+
+
+def random_detections(rng, num_boxes):
+    """
+    Random boxes from three "models", with jittered copies so many pairs overlap.
+    """
+    boxes = []
+    for _ in range(num_boxes):
+        if boxes and rng.random() < 0.5:
+            box = boxes[rng.integers(len(boxes))][0] + rng.integers(-8, 9, size=4)
+        else:
+            x, y = rng.integers(0, 400, size=2)
+            w, h = rng.integers(1, 120, size=2)
+            box = np.array([x, y, x + w, y + h])
+        box = np.array([box[0], box[1], max(box[2], box[0] + 1), max(box[3], box[1] + 1)], dtype=np.float32)
+        boxes.append((box, rng.choice(["n08", "s11", "m12"])))
+    return boxes
+
+
+def test_filter_duplicates_matches_reference():
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        detections = random_detections(rng, int(rng.integers(0, 60)))
+        for threshold in (0.3, 0.5, 0.7):
+            expected = reference_filter_duplicates(detections, threshold)
+            result = filter_duplicates(detections, threshold)
+            assert [src for _, src in result] == [src for _, src in expected], (trial, threshold)
+            for (box, _), (expected_box, _) in zip(result, expected):
+                assert np.array_equal(box, expected_box)
+
+
+def test_filter_duplicates_empty_and_identical():
+    assert filter_duplicates([]) == []
+    box = np.array([10, 10, 50, 50], dtype=np.float32)
+    result = filter_duplicates([(box, "n08"), (box.copy(), "s11")])
+    assert len(result) == 1 and result[0][1] == "n08"
+
+
+def test_job_queue_forgets_jobs_once_they_leave(tmp_path):
+    from segmentation_service.utils.job_queue import JobQueue
+    from segmentation_service.utils.job_store import JobStore, UPLOADED, SEGMENTED, FAILED
+
+    store = JobStore(str(tmp_path))
+    job_dirs = []
+    for job_id in ("a", "b"):
+        _, job_dir = store.create(job_id)
+        with open(os.path.join(job_dir, "uploaded.png"), "wb") as f:
+            f.write(b"png")
+        store.set_state(job_id, UPLOADED)
+        job_dirs.append(job_dir)
+
+    job_queue = JobQueue(
+        str(tmp_path), [".png"], scan_interval=0.05, use_inotify=False, job_store=store, max_attempts=1
+    )
+    job_queue.start()
+    try:
+        done, image_path = job_queue.get(timeout=1)
+        assert image_path == os.path.join(done, "uploaded.png")
+        job_queue.complete(done)
+        failed, _ = job_queue.get(timeout=1)
+        assert not job_queue.release(failed, error="boom")
+
+        assert job_queue._known == set()
+        assert store.get(done)["state"] == SEGMENTED and store.get(failed)["state"] == FAILED
+        assert job_queue.get(timeout=0.3) is None
+    finally:
+        job_queue.stop()
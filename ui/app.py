@@ -0,0 +1,45 @@
+"""
+Module: app.py
+Purpose: Streamlit entrypoint of the SoulSketch UI.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+
+import requests
+import streamlit as st
+
+from components.uploader import render_uploader
+from components.processor import wait_for_completion
+from components.results import render_results
+from utils.api import get_results
+
+STYLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "styles.css")
+
+
+def main() -> None:
+    st.set_page_config(page_title="SoulSketch", page_icon="🎨")
+    if os.path.exists(STYLES_PATH):
+        with open(STYLES_PATH, "r", encoding="utf-8") as f:
+            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+
+    st.title("🧠🎨 SoulSketch")
+    st.caption("Emotional analysis of children's drawings")
+
+    job_id = render_uploader() or st.session_state.get("job_id")
+    if not job_id:
+        return
+    st.session_state["job_id"] = job_id
+
+    status = wait_for_completion(job_id)
+    if status["status"] != "complete":
+        return
+
+    try:
+        render_results(get_results(job_id))
+    except requests.RequestException as e:
+        st.error(f"❌ Could not load results: {e}")
+
+
+if __name__ == "__main__":
+    main()
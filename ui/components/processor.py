@@ -0,0 +1,70 @@
+"""
+Module: processor.py
+Purpose: Progress section — follows a job's pushed status updates until the analysis is done.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import time
+from typing import Dict, Any
+
+import requests
+import streamlit as st
+
+from utils.api import stream_status, get_status
+
+STAGE_LABELS = {
+    "upload": "Uploading drawing",
+    "segmentation": "Finding objects in the drawing",
+    "object_processor": "Recognizing objects and colors",
+    "comparator": "Comparing objects",
+    "emotion_mapper": "Mapping emotions",
+}
+FALLBACK_POLL_SECONDS = 2.5
+TIMEOUT_SECONDS = 600
+
+
+def _render(status: Dict[str, Any], progress_bar, caption) -> None:
+    stage = STAGE_LABELS.get(status.get("stage"), "Waiting in queue")
+    progress_bar.progress(float(status.get("progress", 0.0)), text=f"🧠 {stage}...")
+    if status.get("status") == "failed":
+        caption.error(f"❌ Analysis failed: {status.get('detail', {}).get('error', 'unknown error')}")
+
+
+def wait_for_completion(job_id: str) -> Dict[str, Any]:
+    """
+    Shows the analysis progress of a job and returns its final status.
+
+    Subscribes to the backend's event stream, so the page updates as soon as a stage
+    finishes without polling. If the stream cannot be opened (e.g. a proxy that buffers
+    responses), falls back to polling /status.
+
+    Args:
+        job_id (str): The job to follow.
+
+    Returns:
+        Dict[str, Any]: Last status ("complete" or "failed"; "timeout" if neither arrived in time).
+    """
+    progress_bar = st.progress(0.0, text="🧠 Analyzing...")
+    caption = st.empty()
+    status: Dict[str, Any] = {"job_id": job_id, "status": "queued", "progress": 0.0}
+    deadline = time.time() + TIMEOUT_SECONDS
+
+    try:
+        for status in stream_status(job_id):
+            _render(status, progress_bar, caption)
+            if status["status"] in ("complete", "failed"):
+                return status
+            if time.time() > deadline:
+                break
+    except requests.RequestException as e:
+        print(f"⚠️ Event stream unavailable for {job_id} ({e}) — falling back to polling")
+
+    while time.time() < deadline:
+        status = get_status(job_id)
+        _render(status, progress_bar, caption)
+        if status["status"] in ("complete", "failed"):
+            return status
+        time.sleep(FALLBACK_POLL_SECONDS)
+
+    caption.warning("⏳ The analysis is taking longer than expected — please try again later.")
+    return {**status, "status": "timeout"}
@@ -0,0 +1,47 @@
+"""
+Module: results.py
+Purpose: Results section — one emotion card per detected object plus the PDF download.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import Dict, Any
+
+import streamlit as st
+
+from utils.api import get_pdf
+
+
+def _color_swatches(colors) -> str:
+    return " ".join(
+        f"<span style='display:inline-block;width:18px;height:18px;border-radius:4px;"
+        f"background:{color};border:1px solid #ccc'></span>"
+        for color in colors or []
+    )
+
+
+def render_results(results: Dict[str, Any]) -> None:
+    """
+    Displays the analyzed objects and the report download button.
+
+    Args:
+        results (Dict[str, Any]): Response of /results/:job_id.
+    """
+    objects = results.get("final_objects", [])
+    st.subheader(f"🎨 {len(objects)} objects found")
+
+    for obj in objects:
+        with st.container():
+            st.markdown(f"**{obj.get('predicted_label', 'unknown').title()}** — *{obj.get('emotion_tag', 'neutral')}*")
+            st.markdown(_color_swatches(obj.get("dominant_colors")), unsafe_allow_html=True)
+            st.caption(obj.get("rule_match_explanation", ""))
+
+    if results.get("pdf_url"):
+        with st.spinner("📄 Preparing the PDF report..."):
+            pdf_bytes = get_pdf(results["job_id"])
+        if pdf_bytes:
+            st.download_button(
+                "📄 Download PDF report", pdf_bytes,
+                file_name=f"soulsketch_{results['job_id']}.pdf", mime="application/pdf"
+            )
+        else:
+            st.warning("⚠️ The PDF report is not available right now — please try again in a moment.")
@@ -0,0 +1,34 @@
+"""
+Module: uploader.py
+Purpose: Upload section — drawing selection, preview and analysis start.
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+from typing import Optional
+
+import requests
+import streamlit as st
+
+from utils.api import upload_image
+
+
+def render_uploader() -> Optional[str]:
+    """
+    Shows the file uploader and uploads the drawing when "Start Analysis" is clicked.
+
+    Returns:
+        Optional[str]: The new job id, or None until an upload succeeded.
+    """
+    uploaded = st.file_uploader("Upload a child's drawing", type=["png", "jpg", "jpeg"])
+    if uploaded is None:
+        return None
+
+    st.image(uploaded, caption=uploaded.name, use_column_width=True)
+    if not st.button("Start Analysis"):
+        return None
+
+    try:
+        return upload_image(uploaded.getvalue(), uploaded.name)
+    except requests.RequestException as e:
+        st.error(f"❌ Upload failed: {e}")
+        return None
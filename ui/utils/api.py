@@ -0,0 +1,104 @@
+"""
+Module: api.py
+Purpose: Wrapper functions for the backend REST API (upload, status stream, results, PDF).
+Author: Itay Vazana (SoulSketch Project)
+"""
+
+import os
+import json
+import time
+from typing import Iterator, Dict, Any, Optional
+
+import requests
+
+BASE_URL = os.environ.get("SOULSKETCH_API_URL", "http://localhost:8000")
+REQUEST_TIMEOUT = 30
+
+
+def upload_image(file_bytes: bytes, filename: str) -> str:
+    """
+    Uploads a drawing and returns its job id.
+    """
+    response = requests.post(
+        f"{BASE_URL}/upload", files={"file": (filename, file_bytes)}, timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+
+def get_status(job_id: str) -> Dict[str, Any]:
+    """
+    One-off status lookup (used as a fallback when the event stream is unavailable).
+    """
+    response = requests.get(f"{BASE_URL}/status/{job_id}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def stream_status(job_id: str, read_timeout: float = 60) -> Iterator[Dict[str, Any]]:
+    """
+    Subscribes to the job's Server-Sent Events stream and yields each status update
+    pushed by the backend, until the job completes or fails.
+
+    Args:
+        job_id (str): Job to follow.
+        read_timeout (float): Max seconds without any data (the backend sends keepalives).
+
+    Yields:
+        Dict[str, Any]: Status dicts as returned by /status.
+    """
+    with requests.get(
+        f"{BASE_URL}/events/{job_id}", stream=True,
+        headers={"Accept": "text/event-stream"}, timeout=(REQUEST_TIMEOUT, read_timeout)
+    ) as response:
+        response.raise_for_status()
+        data_lines = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+            elif line == "" and data_lines:
+                yield json.loads("\n".join(data_lines))
+                data_lines = []
+
+
+def get_results(job_id: str) -> Dict[str, Any]:
+    """
+    Final objects and report link of a completed job.
+    """
+    response = requests.get(f"{BASE_URL}/results/{job_id}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_pdf(job_id: str, max_wait: float = 30) -> Optional[bytes]:
+    """
+    Downloads the PDF report. While the backend is still rendering it (503), the request
+    is repeated after the advertised Retry-After delay, for up to `max_wait` seconds.
+
+    Returns:
+        Optional[bytes]: The report, or None if it is missing, still not ready, or the
+        backend failed (the caller shows a message instead of a download button).
+    """
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            response = requests.get(f"{BASE_URL}/pdf/{job_id}", timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"❌ PDF download failed for job {job_id}: {e}")
+            return None
+
+        if response.status_code == 503:
+            try:
+                delay = float(response.headers.get("Retry-After", 2))
+            except ValueError:
+                delay = 2.0
+            if time.monotonic() + delay > deadline:
+                return None
+            time.sleep(delay)
+            continue
+        if not response.ok:
+            print(f"⚠️ PDF for job {job_id} unavailable (HTTP {response.status_code})")
+            return None
+        return response.content